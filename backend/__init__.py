@@ -1,20 +1,55 @@
 # backend/__init__.py
-from flask import Flask
 
 def create_app():
+    # Import diferido: `python -m backend` puede cronometrar el arranque desde el principio
+    from flask import Flask
+
     app = Flask(__name__, template_folder='../templates', static_folder='../static')
     
     from .config import SECRET_KEY
     app.secret_key = SECRET_KEY
 
+    # Sesiones en el servidor: la cookie lleva solo el id (SESSION_BACKEND)
+    from . import sessions
+    sessions.init_app(app)
+
+    # Bytecode de plantillas en disco y etiqueta {% cache %} para fragmentos
+    from . import templating
+    templating.init_app(app)
+
+    # Estáticos con huella y precomprimidos en /assets/ (url_for('static', ...) los usa solo)
+    from . import assets
+    assets.init_app(app)
+
+    # Tiempos por endpoint (connect / query / fetch / render) y /metrics
+    from . import metrics
+    metrics.init_app(app)
+
     # Importar Blueprints
     from .routes.views import views_bp
     from .routes.actions import actions_bp
     from .routes.auth import auth_bp
+    from .routes.api import api_bp
 
     # Registrar Blueprints
     app.register_blueprint(views_bp)
     app.register_blueprint(actions_bp)
     app.register_blueprint(auth_bp)
+    app.register_blueprint(api_bp)
+
+    # Trabajos en segundo plano: se retoman los que quedaron pendientes de una ejecución anterior
+    from .jobs import runner
+    runner.asegurar_iniciado()
+
+    # Pedidos del checkout que quedaron en el diario local sin aplicar en su nodo
+    from .order_journal import diario_ventas
+    diario_ventas.asegurar_iniciado()
+
+    # Nodos con el circuito abierto: las plantillas muestran un aviso
+    from .database import node_status
+
+    @app.context_processor
+    def estado_nodos():
+        return {'nodos_caidos': [n for n, estado in node_status().items() if estado != 'cerrado']}
 
     return app
\ No newline at end of file
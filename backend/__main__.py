@@ -0,0 +1,10 @@
+# backend/__main__.py
+# Entrada sin interfaz gráfica: python -m backend --host 0.0.0.0 --port 5000 --workers 8
+# Solo carga Flask, pyodbc y el servidor WSGI (nada de PyQt6).
+import time
+
+_INICIO = time.perf_counter()
+
+from .server import main
+
+raise SystemExit(main(inicio=_INICIO))
\ No newline at end of file
@@ -0,0 +1,246 @@
+# backend/assets.py
+# Archivos estáticos con huella: python -m backend.assets [--cdn]
+#
+# Copia cada archivo de static/ a static/dist/ con el hash de su contenido en el nombre
+# (style.css -> style.3f2a9c1e0b7d.css), junto con variantes .gz (y .br si está el paquete
+# brotli) ya comprimidas, y escribe static/dist/manifest.json. La app sirve esos archivos
+# en /assets/ con "Cache-Control: immutable": como el nombre cambia con el contenido, el
+# navegador no vuelve a pedirlos nunca.
+#
+# Antes baja a static/vendor/ lo que falte de Bootstrap y Bootstrap Icons (versiones fijas),
+# para que las sucursales sin salida a internet no dependan del CDN; si no puede, falla.
+# Esos archivos se versionan junto al código: el build solo necesita red la primera vez.
+# --cdn construye sin ellos y las páginas los siguen pidiendo al CDN.
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import posixpath
+import re
+import shutil
+import sys
+import urllib.request
+
+from .config import ASSETS_MAX_AGE
+
+try:
+    import brotli
+except ImportError:   # Opcional: sin el paquete solo se generan variantes gzip
+    brotli = None
+
+log = logging.getLogger(__name__)
+
+STATIC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'static')
+DIST = 'dist'
+MANIFEST = 'manifest.json'
+
+# Nombre lógico en static/ -> URL de la versión fija en el CDN. Mientras falte el archivo
+# local las plantillas siguen apuntando al CDN.
+VENDOR = {
+    'vendor/bootstrap/bootstrap.min.css':
+        'https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css',
+    'vendor/bootstrap/bootstrap.bundle.min.js':
+        'https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js',
+    'vendor/bootstrap-icons/bootstrap-icons.css':
+        'https://cdn.jsdelivr.net/npm/bootstrap-icons@1.10.5/font/bootstrap-icons.css',
+    'vendor/bootstrap-icons/fonts/bootstrap-icons.woff2':
+        'https://cdn.jsdelivr.net/npm/bootstrap-icons@1.10.5/font/fonts/bootstrap-icons.woff2',
+    'vendor/bootstrap-icons/fonts/bootstrap-icons.woff':
+        'https://cdn.jsdelivr.net/npm/bootstrap-icons@1.10.5/font/fonts/bootstrap-icons.woff',
+}
+
+# Solo vale la pena comprimir texto; png/woff2 ya vienen comprimidos
+COMPRIMIBLES = ('.css', '.js', '.svg', '.json', '.txt', '.html', '.ico')
+_URL_CSS = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+_SOURCE_MAP = re.compile(rb'\n?/[*/]# sourceMappingURL=[^\n]*')
+
+
+# ==============================================================================
+# CONSTRUCCIÓN (static/ -> static/dist/)
+# ==============================================================================
+def _huella(datos):
+    return hashlib.sha256(datos).hexdigest()[:12]
+
+
+def _nombre_con_huella(logico, huella):
+    base, ext = posixpath.splitext(logico)
+    return f"{base}.{huella}{ext}"
+
+
+def _reescribir_css(texto, logico, manifest):
+    """Apunta los url() relativos del CSS (fuentes, imágenes) a sus archivos con huella."""
+    carpeta = posixpath.dirname(logico)
+
+    def reemplazar(m):
+        url = m.group(2).strip()
+        if url.startswith(('data:', 'http:', 'https:', '//', '/', '#')):
+            return m.group(0)
+        ruta = re.split(r'[?#]', url, 1)[0]
+        destino = manifest.get(posixpath.normpath(posixpath.join(carpeta, ruta)))
+        if destino is None:
+            return m.group(0)
+        return f'url("{posixpath.relpath(destino, carpeta or ".")}")'
+
+    return _URL_CSS.sub(reemplazar, texto)
+
+
+def _escribir(destino, datos):
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    with open(destino, 'wb') as f:
+        f.write(datos)
+
+
+def construir(static=STATIC):
+    """Regenera static/dist/ y devuelve el manifest {nombre lógico: nombre con huella}."""
+    dist = os.path.join(static, DIST)
+    shutil.rmtree(dist, ignore_errors=True)
+
+    logicos = []
+    for carpeta, subcarpetas, archivos in os.walk(static):
+        if os.path.abspath(carpeta) == os.path.abspath(static) and DIST in subcarpetas:
+            subcarpetas.remove(DIST)
+        for archivo in archivos:
+            logicos.append(os.path.relpath(os.path.join(carpeta, archivo), static).replace(os.sep, '/'))
+    # Los CSS al final: sus url() necesitan las huellas de las fuentes e imágenes
+    logicos.sort(key=lambda n: (n.endswith('.css'), n))
+
+    manifest, ahorro = {}, {'original': 0, 'gzip': 0, 'br': 0}
+    for logico in logicos:
+        with open(os.path.join(static, logico), 'rb') as f:
+            datos = f.read()
+        if logico.endswith(('.css', '.js')):
+            # Los .map no se distribuyen: sin esto el navegador los pide y recibe 404
+            datos = _SOURCE_MAP.sub(b'', datos)
+        if logico.endswith('.css'):
+            datos = _reescribir_css(datos.decode('utf-8'), logico, manifest).encode('utf-8')
+
+        final = _nombre_con_huella(logico, _huella(datos))
+        destino = os.path.join(dist, *final.split('/'))
+        _escribir(destino, datos)
+        manifest[logico] = final
+        ahorro['original'] += len(datos)
+
+        if logico.endswith(COMPRIMIBLES):
+            variantes = [('gzip', '.gz', gzip.compress(datos, compresslevel=9, mtime=0))]
+            if brotli is not None:
+                variantes.append(('br', '.br', brotli.compress(datos, quality=11)))
+            for nombre, ext, comprimido in variantes:
+                # Si no ahorra al menos un 5 % se sirve el original
+                if len(comprimido) < len(datos) * 0.95:
+                    _escribir(destino + ext, comprimido)
+                    ahorro[nombre] += len(datos) - len(comprimido)
+
+    with open(os.path.join(dist, MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    log.info("Assets: %d archivos, %d bytes (gzip ahorra %d, br %d)", len(manifest), ahorro['original'],
+             ahorro['gzip'], ahorro['br'])
+    return manifest
+
+
+def vendor_faltante(static=STATIC):
+    """Archivos de VENDOR que todavía no están en static/ (se servirían desde el CDN)."""
+    return [logico for logico in VENDOR if not os.path.exists(os.path.join(static, *logico.split('/')))]
+
+
+def descargar_vendor(static=STATIC, forzar=False):
+    """Baja a static/ los archivos de VENDOR que falten (o todos con `forzar`)."""
+    for logico, url in VENDOR.items():
+        destino = os.path.join(static, *logico.split('/'))
+        if os.path.exists(destino) and not forzar:
+            continue
+        with urllib.request.urlopen(url, timeout=30) as respuesta:
+            _escribir(destino, respuesta.read())
+        print(f"{logico} <- {url}")
+
+
+# ==============================================================================
+# INTEGRACIÓN CON FLASK
+# ==============================================================================
+def _cargar_manifest(static):
+    try:
+        with open(os.path.join(static, DIST, MANIFEST), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def init_app(app):
+    """Sirve static/dist/ en /assets/ y hace que url_for('static', ...) use los nombres con huella.
+
+    Un archivo sin construir se sigue sirviendo desde /static/; uno de VENDOR que no se
+    haya descargado, desde el CDN. Así las plantillas no cambian según el despliegue.
+    """
+    from flask import abort, request, send_file, url_for
+    from werkzeug.security import safe_join
+
+    dist = os.path.join(app.static_folder, DIST)
+    manifest = _cargar_manifest(app.static_folder)
+    if not manifest:
+        log.info("Sin static/dist/manifest.json: correr `python -m backend.assets` para cachear los estáticos")
+    faltan = vendor_faltante(app.static_folder)
+    if faltan:
+        log.warning("Sin copia local de %s: las páginas dependen del CDN (correr `python -m backend.assets` "
+                    "en un equipo con internet y versionar static/vendor/)", ', '.join(faltan))
+
+    def asset_url(endpoint, **values):
+        if endpoint == 'static':
+            nombre = values.get('filename')
+            final = manifest.get(nombre)
+            if final is not None:
+                values['filename'] = final
+                return url_for('assets', **values)
+            if nombre in VENDOR and not os.path.exists(os.path.join(app.static_folder, *nombre.split('/'))):
+                return VENDOR[nombre]
+        return url_for(endpoint, **values)
+
+    def assets(filename):
+        ruta = safe_join(dist, filename)
+        if ruta is None or filename == MANIFEST or not os.path.isfile(ruta):
+            abort(404)
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        codificacion = None
+        aceptadas = request.accept_encodings
+        for nombre, ext in (('br', '.br'), ('gzip', '.gz')):
+            if aceptadas[nombre] and os.path.isfile(ruta + ext):
+                codificacion, ruta = nombre, ruta + ext
+                break
+
+        respuesta = send_file(ruta, mimetype=mimetype, download_name=posixpath.basename(filename),
+                              max_age=ASSETS_MAX_AGE, conditional=True)
+        respuesta.cache_control.immutable = True
+        respuesta.vary.add('Accept-Encoding')
+        if codificacion:
+            respuesta.headers['Content-Encoding'] = codificacion
+        return respuesta
+
+    app.add_url_rule('/assets/<path:filename>', 'assets', assets)
+    app.jinja_env.globals['url_for'] = asset_url
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m backend.assets',
+                                     description="Genera static/dist/ con huellas y variantes comprimidas.")
+    parser.add_argument('--cdn', action='store_true',
+                        help="No descarga Bootstrap ni Bootstrap Icons: lo que falte se sigue pidiendo al CDN.")
+    parser.add_argument('--forzar', action='store_true', help="Vuelve a descargar el vendor aunque ya exista.")
+    parser.add_argument('--static', default=STATIC, help="Carpeta de estáticos (por defecto la del proyecto).")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    if not args.cdn:
+        try:
+            descargar_vendor(args.static, args.forzar)
+        except OSError as e:
+            print(f"No se pudo descargar el vendor ({e}); faltan: {', '.join(vendor_faltante(args.static))}. "
+                  f"Usar --cdn para construir igual.", file=sys.stderr)
+            return 1
+    manifest = construir(args.static)
+    print(f"{len(manifest)} archivos en {os.path.join(args.static, DIST)}")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
\ No newline at end of file
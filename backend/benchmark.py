@@ -0,0 +1,318 @@
+# backend/benchmark.py
+# Benchmark de carga: python -m backend.benchmark --concurrencia 8 --duracion 30 --salida bench.json
+#
+# Arranca create_app() en este proceso contra dos nodos simulados (backend/nodo_simulado.py,
+# SQLite con el esquema de TechStore y latencia de red configurable) y reparte peticiones
+# entre catálogo, dashboard, perfil, login y checkout desde varios hilos. Mide latencias
+# (p50/p95/p99), rendimiento y viajes a la base por petición, y guarda el resultado en JSON
+# para comparar entre commits (--comparar base.json).
+#
+# Las peticiones van por el cliente de pruebas de Flask (sin sockets): se mide la app y
+# la base, no el servidor HTTP.
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+# Operación -> endpoint de Flask (para los viajes a la base medidos por metrics.py)
+ENDPOINTS = {
+    'catalogo': 'views.index',
+    'dashboard': 'views.dashboard',
+    'perfil': 'views.perfil',
+    'login': 'auth.login',
+    'checkout': 'actions.checkout',
+}
+MEZCLA_DEFECTO = 'catalogo=50,dashboard=15,perfil=15,login=10,checkout=10'
+# Pestañas del dashboard que se consultan en el nodo (las globales salen de la copia local)
+TABLAS_DEFECTO = 'PRODUCTO,CLIENTE,EMPLEADO,SUCURSAL'
+
+
+def percentil(ordenados, p):
+    """Percentil por rango más cercano de una lista ya ordenada."""
+    if not ordenados:
+        return 0.0
+    return ordenados[min(len(ordenados) - 1, max(0, int(round(p / 100 * len(ordenados) + 0.5)) - 1))]
+
+
+def _mezcla(texto):
+    pesos = {}
+    for parte in texto.split(','):
+        nombre, _, peso = parte.partition('=')
+        nombre = nombre.strip()
+        if nombre not in ENDPOINTS:
+            raise argparse.ArgumentTypeError(f"Operación desconocida: {nombre} (usa {', '.join(ENDPOINTS)})")
+        pesos[nombre] = float(peso or 1)
+    return pesos
+
+
+# ==============================================================================
+# USUARIOS SIMULADOS
+# ==============================================================================
+class Usuario:
+    """Estado de un hilo: un cliente y un empleado con sesión iniciada."""
+
+    def __init__(self, app, azar, args, nodos):
+        self.app = app
+        self.azar = azar
+        self.args = args
+        self.nodos = nodos
+        self.cliente = app.test_client()
+        self.sucursal_cliente = azar.choice(list(nodos))
+        self._login(self.cliente, f"cliente{azar.randint(1, args.clientes)}@bench.test", self.sucursal_cliente)
+        self.admin = app.test_client()
+        sucursal_admin = azar.choice(list(nodos))
+        self._login(self.admin, f"empleado{nodos[sucursal_admin]}_{azar.randint(1, args.empleados)}@bench.test",
+                    sucursal_admin)
+
+    @staticmethod
+    def _login(cliente, correo, sucursal):
+        r = cliente.post('/login', data={'correo': correo, 'sucursal': sucursal})
+        if r.status_code != 302:
+            raise RuntimeError(f"No se pudo iniciar sesión como {correo} en {sucursal}")
+
+    # --- Operaciones: devuelven True si la respuesta fue correcta ---
+    def catalogo(self):
+        return self.cliente.get('/').status_code == 200
+
+    def dashboard(self):
+        r = self.admin.get('/dashboard', query_string={'tabla': self.azar.choice(self.args.tablas),
+                                                       'pagina': self.azar.randint(1, 3)})
+        return r.status_code == 200
+
+    def perfil(self):
+        return self.cliente.get('/perfil').status_code == 200
+
+    def login(self):
+        tirada = self.azar.random()
+        if tirada < 0.7:
+            correo = f"cliente{self.azar.randint(1, self.args.clientes)}@bench.test"
+        elif tirada < 0.9:
+            nodo = self.azar.choice(list(self.nodos.values()))
+            correo = f"empleado{nodo}_{self.azar.randint(1, self.args.empleados)}@bench.test"
+        else:
+            correo = f"nadie{self.azar.randint(1, 10 ** 6)}@bench.test"
+        r = self.app.test_client().post('/login', data={'correo': correo,
+                                                        'sucursal': self.azar.choice(list(self.nodos))})
+        return r.status_code in (200, 302)
+
+    def checkout(self):
+        productos = self.azar.sample(range(1, self.args.productos + 1), self.azar.randint(1, 3))
+        carrito = [{'id': i, 'cantidad': self.azar.randint(1, 2)} for i in productos]
+        r = self.cliente.post('/checkout', data={'cart_data': json.dumps(carrito)})
+        return r.status_code == 302 and 'error=' not in (r.headers.get('Location') or '')
+
+
+# ==============================================================================
+# EJECUCIÓN
+# ==============================================================================
+def _preparar_entorno(args):
+    """Variables de entorno y nodos simulados; debe correr antes de importar la app."""
+    os.environ.setdefault('REPORTES_DB', os.path.join(args.datos, 'reportes.sqlite3'))
+    os.environ.setdefault('RECONCILIACION_DB', os.path.join(args.datos, 'conciliacion.sqlite3'))
+    os.environ.setdefault('SESSION_DB', os.path.join(args.datos, 'sesiones.sqlite3'))
+    # Pedidos simulados: que no queden en el diario real y se apliquen luego en los nodos de verdad
+    os.environ.setdefault('CHECKOUT_DIARIO_DB', os.path.join(args.datos, 'pedidos.sqlite3'))
+    os.environ.setdefault('TRABAJOS_DB', os.path.join(args.datos, 'trabajos.sqlite3'))
+    os.environ.setdefault('DB_HEALTH_INTERVALO', '0')
+    os.environ.setdefault('DB_POOL_SIZE', str(max(10, args.concurrencia * 2)))
+    os.environ.setdefault('METRICS_SLOW_MS', '0')
+
+    from . import nodo_simulado
+    sys.modules['pyodbc'] = nodo_simulado
+    from .config import NODOS
+
+    bases = {}
+    for nombre, cfg in NODOS.items():
+        ruta = os.path.join(args.datos, f"{cfg['database']}.sqlite3")
+        if not os.path.exists(ruta):
+            print(f"Generando datos de {nombre}...", file=sys.stderr)
+            nodo_simulado.poblar(ruta, cfg['id_sucursal'], productos=args.productos, clientes=args.clientes,
+                                 empleados=args.empleados, facturas=args.facturas, semilla=args.semilla)
+        bases[cfg['database']] = ruta
+    nodo_simulado.configurar(bases, latencia=args.latencia_ms / 1000,
+                             latencia_conexion=args.latencia_conexion_ms / 1000)
+    return {nombre: cfg['id_sucursal'] for nombre, cfg in NODOS.items()}
+
+
+def ejecutar(args):
+    nodos = _preparar_entorno(args)
+    from . import create_app, metrics, nodo_simulado
+
+    app = create_app()
+    operaciones = list(args.mezcla)
+    pesos = [args.mezcla[op] for op in operaciones]
+
+    usuarios = [Usuario(app, random.Random(args.semilla + i), args, nodos) for i in range(args.concurrencia)]
+    muestras = {op: [] for op in operaciones}   # (inicio relativo, segundos, ok)
+    lock = threading.Lock()
+    largada = threading.Barrier(args.concurrencia + 1)
+    estado = {}
+
+    def trabajador(usuario):
+        locales = {op: [] for op in operaciones}
+        largada.wait()
+        inicio_medicion, fin = estado['inicio_medicion'], estado['fin']
+        while True:
+            op = usuario.azar.choices(operaciones, pesos)[0]
+            t = time.perf_counter()
+            if t >= fin:
+                break
+            try:
+                ok = getattr(usuario, op)()
+            except Exception:
+                ok = False
+            if t >= inicio_medicion:
+                locales[op].append((time.perf_counter() - t, ok))
+        with lock:
+            for op, datos in locales.items():
+                muestras[op].extend(datos)
+
+    hilos = [threading.Thread(target=trabajador, args=(u,), daemon=True) for u in usuarios]
+    for h in hilos:
+        h.start()
+    ahora = time.perf_counter()
+    estado['inicio_medicion'] = ahora + args.calentamiento
+    estado['fin'] = ahora + args.calentamiento + args.duracion
+    largada.wait()
+
+    # Viajes a la base por endpoint: diferencia del histograma entre el fin del calentamiento y el final
+    time.sleep(max(0.0, estado['inicio_medicion'] - time.perf_counter()))
+    viajes_antes = metrics.viajes_por_peticion.resumen()
+    nodos_antes = nodo_simulado.estadisticas()
+    for h in hilos:
+        h.join()
+    viajes_despues = metrics.viajes_por_peticion.resumen()
+    nodos_despues = nodo_simulado.estadisticas()
+
+    return _informe(args, muestras, viajes_antes, viajes_despues, nodos_antes, nodos_despues)
+
+
+def _informe(args, muestras, viajes_antes, viajes_despues, nodos_antes, nodos_despues):
+    def resumen(datos):
+        tiempos = sorted(s * 1000 for s, _ in datos)
+        return {
+            'peticiones': len(datos),
+            'errores': sum(1 for _, ok in datos if not ok),
+            'rps': round(len(datos) / args.duracion, 2),
+            'media_ms': round(sum(tiempos) / len(tiempos), 3) if tiempos else 0.0,
+            'p50_ms': round(percentil(tiempos, 50), 3),
+            'p95_ms': round(percentil(tiempos, 95), 3),
+            'p99_ms': round(percentil(tiempos, 99), 3),
+            'max_ms': round(tiempos[-1], 3) if tiempos else 0.0,
+        }
+
+    operaciones = {}
+    for op, datos in muestras.items():
+        operaciones[op] = resumen(datos)
+        antes = viajes_antes.get((ENDPOINTS[op],), (0, 0))
+        despues = viajes_despues.get((ENDPOINTS[op],), (0, 0))
+        n = despues[0] - antes[0]
+        operaciones[op]['round_trips_por_peticion'] = round((despues[1] - antes[1]) / n, 2) if n else 0.0
+
+    nodos = {}
+    for base, despues in nodos_despues.items():
+        antes = nodos_antes.get(base, {})
+        nodos[base] = {k: v - antes.get(k, 0) for k, v in despues.items()}
+
+    return {
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'commit': _commit(),
+        'python': platform.python_version(),
+        'parametros': {k: v for k, v in vars(args).items() if k not in ('salida', 'comparar')},
+        'total': resumen([m for datos in muestras.values() for m in datos]),
+        'operaciones': operaciones,
+        'nodos': nodos,
+    }
+
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+# ==============================================================================
+# SALIDA Y COMPARACIÓN
+# ==============================================================================
+def imprimir(informe):
+    print(f"\nCommit {informe['commit'] or '?'} · {informe['parametros']['concurrencia']} hilos · "
+          f"{informe['parametros']['duracion']:g}s · latencia {informe['parametros']['latencia_ms']:g} ms")
+    print(f"{'operación':<10} {'pet.':>7} {'err':>5} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'viajes':>7}")
+    for op, r in list(informe['operaciones'].items()) + [('TOTAL', informe['total'])]:
+        print(f"{op:<10} {r['peticiones']:>7} {r['errores']:>5} {r['rps']:>8.1f} {r['p50_ms']:>8.2f} "
+              f"{r['p95_ms']:>8.2f} {r['p99_ms']:>8.2f} {r.get('round_trips_por_peticion', ''):>7}")
+
+
+def comparar(base, actual, umbral):
+    """Imprime la variación contra `base` y devuelve las regresiones (p95 o req/s peor que `umbral` %)."""
+    regresiones = []
+    print(f"\nComparación con {base.get('commit') or 'base'} (umbral {umbral:g}%)")
+    print(f"{'operación':<10} {'p95 base':>9} {'p95 ahora':>9} {'Δ%':>7} {'req/s base':>10} {'ahora':>8} {'Δ%':>7}")
+    filas = list(actual['operaciones'].items()) + [('TOTAL', actual['total'])]
+    for op, r in filas:
+        b = base['total'] if op == 'TOTAL' else base.get('operaciones', {}).get(op)
+        if not b:
+            continue
+        d_p95 = (r['p95_ms'] / b['p95_ms'] - 1) * 100 if b['p95_ms'] else 0.0
+        d_rps = (r['rps'] / b['rps'] - 1) * 100 if b['rps'] else 0.0
+        marca = ''
+        if d_p95 > umbral or d_rps < -umbral:
+            regresiones.append(op)
+            marca = '  <-- regresión'
+        print(f"{op:<10} {b['p95_ms']:>9.2f} {r['p95_ms']:>9.2f} {d_p95:>+7.1f} {b['rps']:>10.1f} "
+              f"{r['rps']:>8.1f} {d_rps:>+7.1f}{marca}")
+    return regresiones
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m backend.benchmark',
+                                     description="Benchmark de TechStore contra nodos SQL simulados.")
+    parser.add_argument('--concurrencia', type=int, default=8, help="Hilos haciendo peticiones.")
+    parser.add_argument('--duracion', type=float, default=20, help="Segundos medidos.")
+    parser.add_argument('--calentamiento', type=float, default=3, help="Segundos previos que no se miden.")
+    parser.add_argument('--mezcla', type=_mezcla, default=_mezcla(MEZCLA_DEFECTO),
+                        help=f"Pesos por operación (por defecto {MEZCLA_DEFECTO}).")
+    parser.add_argument('--tablas', type=lambda t: t.split(','), default=TABLAS_DEFECTO.split(','),
+                        help=f"Pestañas del dashboard (por defecto {TABLAS_DEFECTO}).")
+    parser.add_argument('--productos', type=int, default=2000)
+    parser.add_argument('--clientes', type=int, default=500)
+    parser.add_argument('--empleados', type=int, default=20)
+    parser.add_argument('--facturas', type=int, default=20000, help="Facturas por nodo.")
+    parser.add_argument('--latencia-ms', type=float, default=1.0, help="Latencia por viaje a la base.")
+    parser.add_argument('--latencia-conexion-ms', type=float, default=20.0, help="Costo de abrir una conexión.")
+    parser.add_argument('--semilla', type=int, default=2026)
+    parser.add_argument('--datos', help="Carpeta de los nodos simulados (se reutiliza si ya existe).")
+    parser.add_argument('--salida', help="Archivo JSON donde guardar el resultado.")
+    parser.add_argument('--comparar', help="Resultado JSON anterior contra el que comparar.")
+    parser.add_argument('--umbral', type=float, default=10.0, help="Regresión tolerada en %% (p95 y req/s).")
+    args = parser.parse_args(argv)
+    if args.datos is None:
+        args.datos = tempfile.mkdtemp(prefix='techstore_bench_')
+    os.makedirs(args.datos, exist_ok=True)
+
+    informe = ejecutar(args)
+    imprimir(informe)
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as f:
+            json.dump(informe, f, indent=2, ensure_ascii=False)
+        print(f"\nResultado guardado en {args.salida}")
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as f:
+            regresiones = comparar(json.load(f), informe, args.umbral)
+        if regresiones:
+            print(f"\nRegresiones en: {', '.join(regresiones)}")
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
\ No newline at end of file
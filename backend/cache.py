@@ -0,0 +1,223 @@
+# backend/cache.py
+import threading
+import time
+import logging
+from collections import OrderedDict
+
+from .config import (CATALOG_CACHE_TTL, CATALOG_STALE_TTL, IDENTIDAD_CACHE_SIZE, IDENTIDAD_CACHE_TTL,
+                     PERFIL_CACHE_SIZE, PERFIL_CACHE_TTL)
+
+log = logging.getLogger(__name__)
+
+
+class _Entrada:
+    __slots__ = ('valor', 'cargado', 'version', 'carga')
+
+    def __init__(self, valor, cargado, version, carga):
+        self.valor = valor
+        self.cargado = cargado
+        self.version = version
+        self.carga = carga
+
+
+class CatalogCache:
+    """Caché en proceso del catálogo, una entrada por sucursal.
+
+    - Fresca (< ttl): se sirve directamente.
+    - Vieja (< ttl + stale_ttl): se sirve la copia vieja y se recarga en segundo plano.
+    - Caducada o invalidada: se recarga en la misma petición. Solo un hilo consulta
+      la base; el resto espera ese mismo resultado (single-flight).
+
+    invalidate() sube la versión de la sucursal: una recarga iniciada antes de la
+    invalidación no pisa el caché con datos anteriores a la escritura.
+
+    Cada carga guardada recibe un número nuevo (también las recargas por TTL, que
+    pueden traer cambios hechos fuera de esta app): get_etiquetado() lo expone para ETags.
+    """
+
+    def __init__(self, ttl=CATALOG_CACHE_TTL, stale_ttl=CATALOG_STALE_TTL):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._lock = threading.Lock()
+        self._entradas = {}
+        self._versiones = {}
+        self._cargando = {}    # sucursal -> threading.Event de la recarga en curso
+        self._cargas = 0       # contador global de cargas guardadas
+        self._counters = {'hits': 0, 'stale_hits': 0, 'misses': 0, 'refreshes': 0,
+                          'refresh_errors': 0, 'invalidations': 0, 'fallbacks': 0}
+
+    def version(self, sucursal):
+        with self._lock:
+            return self._versiones.get(sucursal, 0)
+
+    def get(self, sucursal, loader):
+        """Devuelve el catálogo de la sucursal; `loader()` consulta la base si hace falta."""
+        return self.get_etiquetado(sucursal, loader)[0]
+
+    def get_etiquetado(self, sucursal, loader):
+        """Como get(), pero devuelve (catálogo, etiqueta). La etiqueta cambia con cada carga."""
+        while True:
+            with self._lock:
+                entrada = self._entradas.get(sucursal)
+                version = self._versiones.get(sucursal, 0)
+                edad = time.monotonic() - entrada.cargado if entrada else None
+
+                if entrada and entrada.version == version:
+                    if edad < self.ttl:
+                        self._counters['hits'] += 1
+                        return entrada.valor, f"{version}.{entrada.carga}"
+                    if edad < self.ttl + self.stale_ttl:
+                        self._counters['stale_hits'] += 1
+                        if sucursal not in self._cargando:
+                            evento = self._cargando[sucursal] = threading.Event()
+                            threading.Thread(target=self._refrescar, args=(sucursal, loader, version, evento),
+                                             daemon=True).start()
+                        return entrada.valor, f"{version}.{entrada.carga}"
+
+                evento = self._cargando.get(sucursal)
+                if evento is None:
+                    evento = self._cargando[sucursal] = threading.Event()
+                    self._counters['misses'] += 1
+                    break
+
+            # Otro hilo ya está consultando: esperamos su resultado y reevaluamos
+            evento.wait()
+
+        try:
+            valor = loader()
+            return valor, f"{version}.{self._guardar(sucursal, valor, version)}"
+        finally:
+            self._terminar_carga(sucursal, evento)
+
+    def ultimo(self, sucursal):
+        """Última copia guardada de la sucursal sin importar edad ni versión (None si no hay).
+
+        Solo para mostrar algo mientras el nodo está caído.
+        """
+        with self._lock:
+            entrada = self._entradas.get(sucursal)
+            if entrada is None:
+                return None
+            self._counters['fallbacks'] += 1
+            return entrada.valor
+
+    def invalidate(self, sucursal=None):
+        """Invalida una sucursal, o todas si no se indica ninguna."""
+        with self._lock:
+            sucursales = [sucursal] if sucursal else set(self._versiones) | set(self._entradas) | set(self._cargando)
+            for s in sucursales:
+                self._versiones[s] = self._versiones.get(s, 0) + 1
+            self._counters['invalidations'] += 1
+
+    def stats(self):
+        with self._lock:
+            datos = dict(self._counters)
+            datos['versiones'] = dict(self._versiones)
+        return datos
+
+    # --- Internos ---
+    def _refrescar(self, sucursal, loader, version, evento):
+        try:
+            self._guardar(sucursal, loader(), version)
+            with self._lock:
+                self._counters['refreshes'] += 1
+        except Exception as e:
+            # Nos quedamos con la copia vieja; la próxima petición lo reintenta
+            with self._lock:
+                self._counters['refresh_errors'] += 1
+            log.warning("Recarga del catálogo de %s falló: %s", sucursal, e)
+        finally:
+            self._terminar_carga(sucursal, evento)
+
+    def _guardar(self, sucursal, valor, version):
+        """Guarda la carga y devuelve su número."""
+        with self._lock:
+            self._cargas += 1
+            # Si hubo una invalidación mientras consultábamos, el resultado ya es viejo
+            if self._versiones.get(sucursal, 0) == version:
+                self._entradas[sucursal] = _Entrada(valor, time.monotonic(), version, self._cargas)
+            return self._cargas
+
+    def _terminar_carga(self, sucursal, evento):
+        with self._lock:
+            if self._cargando.get(sucursal) is evento:
+                del self._cargando[sucursal]
+        evento.set()
+
+
+class LRUCache:
+    """Caché acotado con expulsión LRU y TTL por entrada (`ttl` por defecto, o el de set())."""
+
+    _FALTA = object()
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._datos = OrderedDict()   # clave -> (valor, instante en que expira)
+        self._counters = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+
+    def get(self, clave, defecto=None):
+        with self._lock:
+            item = self._datos.get(clave, self._FALTA)
+            if item is not self._FALTA and time.monotonic() < item[1]:
+                self._datos.move_to_end(clave)
+                self._counters['hits'] += 1
+                return item[0]
+            if item is not self._FALTA:
+                del self._datos[clave]
+            self._counters['misses'] += 1
+            return defecto
+
+    def set(self, clave, valor, ttl=None):
+        with self._lock:
+            self._datos[clave] = (valor, time.monotonic() + (self.ttl if ttl is None else ttl))
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_size:
+                self._datos.popitem(last=False)
+                self._counters['evictions'] += 1
+
+    def invalidate(self, predicado=None):
+        """Borra las claves que cumplan `predicado` (todas si no se indica)."""
+        with self._lock:
+            claves = [k for k in self._datos if predicado is None or predicado(k)]
+            for k in claves:
+                del self._datos[k]
+            self._counters['invalidations'] += len(claves)
+
+    def stats(self):
+        with self._lock:
+            datos = dict(self._counters, size=len(self._datos), max_size=self.max_size)
+        consultas = datos['hits'] + datos['misses']
+        datos['hit_ratio'] = round(datos['hits'] / consultas, 4) if consultas else 0.0
+        return datos
+
+
+catalog_cache = CatalogCache()
+
+# Historial de compras ya renderizado, por (sucursal, cliente, página)
+perfil_cache = LRUCache(PERFIL_CACHE_SIZE, PERFIL_CACHE_TTL)
+
+
+def invalidate_perfil(sucursal, id_cliente):
+    perfil_cache.invalidate(lambda k: k[0] == sucursal and k[1] == str(id_cliente))
+
+
+# Resultado de las búsquedas del login por (tabla, sucursal, correo), incluidas las
+# vacías ("no existe"), que guardan None y duran IDENTIDAD_CACHE_TTL_NEGATIVO
+identidad_cache = LRUCache(IDENTIDAD_CACHE_SIZE, IDENTIDAD_CACHE_TTL)
+
+
+def normalizar_correo(correo):
+    """Correo tal como se busca y se cachea: sin espacios y en minúsculas."""
+    return (correo or '').strip().lower()
+
+
+def clave_identidad(tabla, sucursal, correo):
+    return tabla, sucursal, normalizar_correo(correo)
+
+
+def invalidate_identidad(tabla, correo=None):
+    """Borra las búsquedas de `tabla` ('EMPLEADO' o 'CLIENTE') en todas las sedes; de un correo o todas."""
+    correo = clave_identidad(tabla, None, correo)[2] if correo else None
+    identidad_cache.invalidate(lambda k: k[0] == tabla and (correo is None or k[2] == correo))
\ No newline at end of file
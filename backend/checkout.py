@@ -0,0 +1,187 @@
+# backend/checkout.py
+import json
+import threading
+import time
+
+import pyodbc
+from .config import CHECKOUT_MAX_RETRIES, CHECKOUT_RETRY_BACKOFF
+
+
+class StockInsuficienteError(Exception):
+    """Uno o más productos del carrito no tienen stock suficiente en la sucursal."""
+
+    def __init__(self, faltantes):
+        self.faltantes = faltantes   # [(Id_producto, nombre)]
+        nombres = ', '.join(nombre or f"#{id_prod}" for id_prod, nombre in faltantes)
+        super().__init__(f"Stock insuficiente para {nombres}.")
+
+
+class CarritoInvalidoError(ValueError):
+    pass
+
+
+_counters_lock = threading.Lock()
+_counters = {'ventas': 0, 'sin_stock': 0, 'reintentos': 0, 'round_trips': 0}
+
+
+def checkout_stats():
+    with _counters_lock:
+        datos = dict(_counters)
+    datos['round_trips_por_venta'] = round(datos['round_trips'] / datos['ventas'], 2) if datos['ventas'] else 0
+    return datos
+
+
+def _contar(**incrementos):
+    with _counters_lock:
+        for k, v in incrementos.items():
+            _counters[k] += v
+
+
+def normalizar_carrito(carrito):
+    """Valida el JSON del carrito y agrupa cantidades por producto: {Id_producto: cantidad}."""
+    if not isinstance(carrito, list) or not carrito:
+        raise CarritoInvalidoError("El carrito está vacío.")
+    items = {}
+    for item in carrito:
+        try:
+            id_prod = int(item['id'])
+            cantidad = int(item['cantidad'])
+        except (KeyError, TypeError, ValueError):
+            raise CarritoInvalidoError("Carrito con formato inválido.")
+        if cantidad <= 0:
+            raise CarritoInvalidoError("Las cantidades deben ser mayores a cero.")
+        items[id_prod] = items.get(id_prod, 0) + cantidad
+    return items
+
+
+# Un solo batch T-SQL para todo el carrito:
+#   1. UPDATE guardado (cantidad >= pedido) que reserva el stock de todos los ítems a la vez
+#      y guarda la cantidad resultante (para el feed de cambios de stock).
+#   2. Si algún ítem no se pudo reservar, devuelve los faltantes (el llamador hace rollback).
+#   3. Id de factura con MAX+1 bajo UPDLOCK/HOLDLOCK: dos ventas simultáneas no obtienen el mismo número.
+#   4. Cabecera y detalles con INSERT ... SELECT usando el precio vigente en PRODUCTO.
+_SQL_VENTA = """
+SET NOCOUNT ON;
+DECLARE @suc INT = ?;
+DECLARE @items TABLE (Id_producto INT PRIMARY KEY, cantidad INT NOT NULL);
+DECLARE @reservas TABLE (Id_producto INT PRIMARY KEY, cantidad INT NOT NULL);
+
+INSERT INTO @items (Id_producto, cantidad)
+SELECT Id_producto, cantidad FROM OPENJSON(?) WITH (Id_producto INT '$.id', cantidad INT '$.cantidad');
+
+UPDATE I SET I.cantidad = I.cantidad - C.cantidad
+OUTPUT inserted.Id_producto, inserted.cantidad INTO @reservas
+FROM INVENTARIO I
+JOIN @items C ON C.Id_producto = I.Id_producto
+WHERE I.Id_sucursal = @suc AND I.cantidad >= C.cantidad;
+
+IF EXISTS (SELECT 1 FROM @items C WHERE C.Id_producto NOT IN (SELECT Id_producto FROM @reservas))
+BEGIN
+    SELECT CAST(0 AS INT) AS ok, C.Id_producto, P.nombre, NULL
+    FROM @items C
+    LEFT JOIN PRODUCTO P ON P.Id_producto = C.Id_producto
+    WHERE C.Id_producto NOT IN (SELECT Id_producto FROM @reservas);
+    RETURN;
+END
+
+DECLARE @id_factura INT;
+SELECT @id_factura = ISNULL(MAX(Id_factura), 0) + 1 FROM FACTURA WITH (UPDLOCK, HOLDLOCK);
+
+INSERT INTO FACTURA (Id_factura, Id_cliente, Id_sucursal, total, fecha)
+SELECT @id_factura, ?, @suc, SUM(C.cantidad * P.precio), GETDATE()
+FROM @items C JOIN PRODUCTO P ON P.Id_producto = C.Id_producto;
+
+INSERT INTO DETALLE_FACTURA (Id_factura, Id_producto, Id_sucursal, cantidad, precio_unidad, subtotal)
+SELECT @id_factura, C.Id_producto, @suc, C.cantidad, P.precio, C.cantidad * P.precio
+FROM @items C JOIN PRODUCTO P ON P.Id_producto = C.Id_producto;
+
+SELECT CAST(1 AS INT) AS ok, @id_factura, R.Id_producto, R.cantidad FROM @reservas R;
+"""
+
+
+def registrar_venta(cursor, id_cliente, id_sucursal, items):
+    """Reserva stock y crea la factura del carrito completo en un solo viaje a la base.
+
+    Devuelve (Id_factura, [(Id_producto, cantidad que quedó)]). No hace commit.
+    Lanza StockInsuficienteError si algún producto no alcanza.
+    """
+    carrito_json = json.dumps([{'id': k, 'cantidad': v} for k, v in items.items()])
+    cursor.execute(_SQL_VENTA, (id_sucursal, carrito_json, id_cliente))
+    filas = cursor.fetchall()
+    _contar(round_trips=1)
+
+    if not filas or filas[0][0] != 1:
+        _contar(sin_stock=1)
+        raise StockInsuficienteError([(f[1], f[2]) for f in filas])
+    return int(filas[0][1]), [(f[2], f[3]) for f in filas]
+
+
+def es_deadlock(error):
+    """SQL Server 1205 (víctima de interbloqueo) llega como SQLSTATE 40001."""
+    return isinstance(error, pyodbc.Error) and bool(error.args) and (
+        error.args[0] == '40001' or '1205' in str(error))
+
+
+# Clave de idempotencia de cada pedido del diario, en la misma transacción que la venta:
+# si el aplicador se corta tras el commit, al reintentar ve la clave y no vende dos veces
+SQL_TABLA_PEDIDOS = """
+IF OBJECT_ID('dbo.PEDIDO_WEB', 'U') IS NULL
+    CREATE TABLE dbo.PEDIDO_WEB (
+        clave CHAR(32) NOT NULL PRIMARY KEY,
+        Id_factura INT NOT NULL,
+        aplicado DATETIME NOT NULL DEFAULT GETDATE()
+    );
+"""
+
+
+def registrar_cliente(cursor, sucursal, id_sucursal, id_cliente, cliente):
+    """Registro rápido de quien compra sin cuenta; `cliente`: nombre, direccion, telefono, correo."""
+    datos = (id_cliente, cliente['nombre'], cliente['direccion'], cliente['telefono'], cliente['correo'])
+    if sucursal == 'Quito':
+        cursor.execute("""
+            EXEC sp_RegistrarClienteNuevo 
+            @IdCliente = ?, @Nombre = ?, @Direccion = ?, @Telefono = ?, @Correo = ?
+        """, datos)
+    else:
+        cursor.execute("SELECT 1 FROM CLIENTE WHERE Id_cliente = ?", (id_cliente,))
+        if not cursor.fetchone():
+            cursor.execute("""
+                INSERT INTO CLIENTE (Id_cliente, nombre, direccion, telefono, correo, Id_sucursal)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, datos + (id_sucursal,))
+
+
+def _deshacer(conn):
+    try:
+        conn.rollback()
+    except pyodbc.Error:
+        pass   # Conexión rota: el pool la descarta
+
+
+def aplicar_pedido(conn, sucursal, id_sucursal, pedido):
+    """Aplica un pedido del diario en `conn` y hace commit.
+
+    `pedido`: clave, id_cliente, cliente (registro rápido o None) e items {Id_producto: cantidad}.
+    Registro, venta y clave de idempotencia van en una transacción; si SQL Server la
+    elige como víctima de un deadlock se repite en la misma conexión. Devuelve
+    (Id_factura, stock). Ante cualquier error hace rollback antes de propagarlo.
+    """
+    for intento in range(CHECKOUT_MAX_RETRIES + 1):
+        cursor = conn.cursor()
+        try:
+            if pedido['cliente']:
+                registrar_cliente(cursor, sucursal, id_sucursal, pedido['id_cliente'], pedido['cliente'])
+            id_factura, stock = registrar_venta(cursor, pedido['id_cliente'], id_sucursal, pedido['items'])
+            cursor.execute("INSERT INTO PEDIDO_WEB (clave, Id_factura) VALUES (?, ?)", (pedido['clave'], id_factura))
+            conn.commit()
+            _contar(ventas=1, round_trips=2)   # + clave y commit
+            return id_factura, stock
+        except pyodbc.Error as e:
+            _deshacer(conn)
+            if not es_deadlock(e) or intento == CHECKOUT_MAX_RETRIES:
+                raise
+            _contar(reintentos=1)
+            time.sleep(CHECKOUT_RETRY_BACKOFF * (2 ** intento))
+        except Exception:
+            _deshacer(conn)
+            raise
\ No newline at end of file
@@ -1,8 +1,14 @@
 # backend/config.py
 import os
+import tempfile
 
 SECRET_KEY = 'techstore_secret_key_2026'
 
+# Datos locales que deben sobrevivir a un reinicio (diario de pedidos, trabajos, conciliación).
+# No en /tmp: suele ser tmpfs o se limpia al arrancar
+DATA_DIR = os.environ.get('TECHSTORE_DATA_DIR',
+                          os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'instance'))
+
 SERVER_QUITO = os.environ.get('DB_SERVER_QUITO', '26.248.18.42')
 SERVER_GUAYAQUIL = os.environ.get('DB_SERVER_GUAYAQUIL', '26.77.173.132')
 
@@ -10,6 +16,7 @@ NODOS = {
     'Quito': {
         'server': SERVER_QUITO, 
         'database': 'TechStore_Quito',
+        'id_sucursal': 1,
         'use_sql_auth': True,
         'user': 'sa',             
         'password': 'P@ssw0rd'
@@ -17,8 +24,204 @@ NODOS = {
     'Guayaquil': {
         'server': SERVER_GUAYAQUIL, 
         'database': 'TechStore_Guayaquil',
+        'id_sucursal': 2,
         'use_sql_auth': True,
         'user': 'sa',
         'password': 'P@ssw0rd'
     }
-}
\ No newline at end of file
+}
+
+# --- POOL DE CONEXIONES (por nodo) ---
+# Tamaño máximo de conexiones abiertas por sucursal
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+# Segundos que una conexión ociosa puede quedarse en el pool antes de cerrarse
+DB_POOL_IDLE_TIMEOUT = float(os.environ.get('DB_POOL_IDLE_TIMEOUT', 300))
+# Segundos que una petición espera por una conexión libre antes de fallar
+DB_POOL_WAIT_TIMEOUT = float(os.environ.get('DB_POOL_WAIT_TIMEOUT', 10))
+# Si la conexión estuvo ociosa más de estos segundos, se valida con SELECT 1 al prestarla
+DB_POOL_PING_AFTER = float(os.environ.get('DB_POOL_PING_AFTER', 10))
+# Timeout del handshake TCP + login TDS de pyodbc
+DB_CONNECT_TIMEOUT = int(os.environ.get('DB_CONNECT_TIMEOUT', 30))
+
+# --- SALUD DE NODOS / CIRCUIT BREAKER ---
+# Fallos de conexión seguidos que abren el circuito (se falla al instante sin conectar)
+DB_BREAKER_UMBRAL = int(os.environ.get('DB_BREAKER_UMBRAL', 3))
+# Segundos con el circuito abierto antes de dejar pasar una conexión de prueba
+DB_BREAKER_ESPERA = float(os.environ.get('DB_BREAKER_ESPERA', 15))
+# Cada cuántos segundos el monitor prueba cada nodo (0 = sin monitor)
+DB_HEALTH_INTERVALO = float(os.environ.get('DB_HEALTH_INTERVALO', 5))
+# Timeout de conexión de la prueba del monitor (corto: no ocupa hilos de peticiones)
+DB_HEALTH_TIMEOUT = int(os.environ.get('DB_HEALTH_TIMEOUT', 3))
+
+# --- CACHÉ DEL CATÁLOGO PÚBLICO ---
+# Segundos en que el catálogo cacheado se considera fresco
+CATALOG_CACHE_TTL = float(os.environ.get('CATALOG_CACHE_TTL', 30))
+# Segundos extra en que se sirve la copia vieja mientras se recarga en segundo plano
+CATALOG_STALE_TTL = float(os.environ.get('CATALOG_STALE_TTL', 300))
+
+# --- BÚSQUEDA EN EL CATÁLOGO (/buscar) ---
+# Productos que devuelve como máximo una búsqueda (las facetas cuentan todos)
+BUSQUEDA_MAX_RESULTADOS = int(os.environ.get('BUSQUEDA_MAX_RESULTADOS', 50))
+
+# --- PAGINACIÓN DEL DASHBOARD ---
+DASHBOARD_PAGE_SIZE = int(os.environ.get('DASHBOARD_PAGE_SIZE', 50))
+DASHBOARD_MAX_PAGE_SIZE = int(os.environ.get('DASHBOARD_MAX_PAGE_SIZE', 500))
+# Segundos que se reutiliza un COUNT(*) con filtro antes de recalcularlo
+DASHBOARD_COUNT_TTL = float(os.environ.get('DASHBOARD_COUNT_TTL', 60))
+# Conteos guardados como máximo (uno por tabla, sucursal y filtro: cada búsqueda distinta suma uno)
+DASHBOARD_COUNT_CACHE_SIZE = int(os.environ.get('DASHBOARD_COUNT_CACHE_SIZE', 512))
+# Consulta en vivo a todos los nodos (mientras no hay copia local de reportes): cada nodo manda
+# todas las filas hasta la página pedida, así que se llega como mucho hasta esta fila
+DASHBOARD_FANOUT_MAX_FILAS = int(os.environ.get('DASHBOARD_FANOUT_MAX_FILAS', 1000))
+
+# --- PERFIL DE CLIENTE ---
+# Facturas por página en "Mis Compras"
+PERFIL_PAGE_SIZE = int(os.environ.get('PERFIL_PAGE_SIZE', 10))
+# Páginas de historial renderizadas que se guardan en memoria (LRU) y su vigencia
+PERFIL_CACHE_SIZE = int(os.environ.get('PERFIL_CACHE_SIZE', 500))
+PERFIL_CACHE_TTL = float(os.environ.get('PERFIL_CACHE_TTL', 600))
+
+# --- CACHÉ DE IDENTIDADES (LOGIN) ---
+# Búsquedas de empleado / cliente por correo guardadas en memoria (LRU) y su vigencia;
+# los correos no registrados se recuerdan menos tiempo
+IDENTIDAD_CACHE_SIZE = int(os.environ.get('IDENTIDAD_CACHE_SIZE', 5000))
+IDENTIDAD_CACHE_TTL = float(os.environ.get('IDENTIDAD_CACHE_TTL', 300))
+IDENTIDAD_CACHE_TTL_NEGATIVO = float(os.environ.get('IDENTIDAD_CACHE_TTL_NEGATIVO', 60))
+
+# --- CHECKOUT ---
+# Reintentos cuando SQL Server elige la venta como víctima de un deadlock (error 1205)
+CHECKOUT_MAX_RETRIES = int(os.environ.get('CHECKOUT_MAX_RETRIES', 3))
+CHECKOUT_RETRY_BACKOFF = float(os.environ.get('CHECKOUT_RETRY_BACKOFF', 0.05))
+# Diario local de pedidos: la venta se anota aquí y un hilo por nodo la aplica en SQL Server
+CHECKOUT_DIARIO_DB = os.environ.get('CHECKOUT_DIARIO_DB', os.path.join(DATA_DIR, 'techstore_pedidos.sqlite3'))
+# Segundos que /checkout espera la confirmación del nodo antes de responder "pedido recibido"
+CHECKOUT_ESPERA = float(os.environ.get('CHECKOUT_ESPERA', 2))
+# Pedidos que se aplican por conexión, y espera entre reintentos si el nodo no responde (se duplica)
+CHECKOUT_LOTE = int(os.environ.get('CHECKOUT_LOTE', 50))
+CHECKOUT_REINTENTO = float(os.environ.get('CHECKOUT_REINTENTO', 1))
+CHECKOUT_REINTENTO_MAX = float(os.environ.get('CHECKOUT_REINTENTO_MAX', 60))
+# Segundos de turno de un proceso como aplicador de un nodo (otro proceso lo toma si no lo renueva)
+CHECKOUT_TURNO = float(os.environ.get('CHECKOUT_TURNO', 30))
+# Días que se conservan los pedidos ya aplicados o rechazados
+CHECKOUT_RETENCION_DIAS = float(os.environ.get('CHECKOUT_RETENCION_DIAS', 30))
+
+# --- SERVIDOR DE PRODUCCIÓN (waitress) ---
+# Dirección y puerto por defecto del modo sin interfaz (python -m backend)
+SERVER_HOST = os.environ.get('SERVER_HOST', '0.0.0.0')
+SERVER_PORT = int(os.environ.get('SERVER_PORT', 5000))
+# Hilos que atienden peticiones en paralelo
+SERVER_THREADS = int(os.environ.get('SERVER_THREADS', 8))
+# Conexiones abiertas simultáneas antes de dejar de aceptar nuevas
+SERVER_CONNECTION_LIMIT = int(os.environ.get('SERVER_CONNECTION_LIMIT', 100))
+# Cola de conexiones pendientes del socket (listen backlog)
+SERVER_BACKLOG = int(os.environ.get('SERVER_BACKLOG', 1024))
+# Segundos que se mantiene abierta una conexión keep-alive sin actividad
+SERVER_KEEPALIVE = int(os.environ.get('SERVER_KEEPALIVE', 30))
+# Segundos que se espera a que terminen las peticiones en curso al detener el servidor
+SERVER_SHUTDOWN_TIMEOUT = float(os.environ.get('SERVER_SHUTDOWN_TIMEOUT', 10))
+
+# --- DRIVER ODBC ---
+# Vacío: se detecta una sola vez entre los drivers instalados (se prefiere el 17)
+DB_ODBC_DRIVER = os.environ.get('DB_ODBC_DRIVER', '')
+
+# --- CONSULTAS EN PARALELO A TODOS LOS NODOS (fan-out) ---
+# Segundos que se espera a cada nodo; si no responde se devuelven resultados parciales
+FANOUT_TIMEOUT = float(os.environ.get('FANOUT_TIMEOUT', 5))
+# Hilos compartidos para las consultas en paralelo
+FANOUT_WORKERS = int(os.environ.get('FANOUT_WORKERS', 8))
+# Segundos que el login espera a la otra sede solo para el aviso de "sede equivocada"
+LOGIN_HINT_TIMEOUT = float(os.environ.get('LOGIN_HINT_TIMEOUT', 1))
+
+# --- COPIA LOCAL DE REPORTES (INVENTARIO / FACTURA del dashboard) ---
+# Archivo SQLite donde se materializan los reportes globales
+REPORTES_DB = os.environ.get('REPORTES_DB', os.path.join(tempfile.gettempdir(), 'techstore_reportes.sqlite3'))
+# Segundos entre actualizaciones incrementales en segundo plano
+REPORTES_INTERVALO = float(os.environ.get('REPORTES_INTERVALO', 60))
+# Facturas nuevas que se traen por nodo en cada pasada (el resto en la siguiente, sin esperar)
+REPORTES_LOTE = int(os.environ.get('REPORTES_LOTE', 5000))
+
+# --- MÉTRICAS (/metrics) ---
+# Peticiones más lentas que esto (ms) se registran en el log con su SQL más lento; 0 lo desactiva
+METRICS_SLOW_MS = float(os.environ.get('METRICS_SLOW_MS', 1000))
+# Si se define, /metrics exige la cabecera "Authorization: Bearer <token>"
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# --- EXPORTACIÓN CSV / EXCEL ---
+# Filas que se piden a SQL Server en cada fetchmany (la memoria no depende del total)
+EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', 1000))
+
+# --- IMPORTACIÓN MASIVA DE PRODUCTOS ---
+# Filas por executemany al cargar la tabla temporal
+IMPORT_BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE', 1000))
+# Errores por fila que se muestran como máximo (se cuentan todos)
+IMPORT_MAX_ERRORES = int(os.environ.get('IMPORT_MAX_ERRORES', 500))
+
+# --- API JSON (/api) ---
+# Respuestas más chicas que esto (bytes) se envían sin comprimir
+API_COMPRESS_MIN_BYTES = int(os.environ.get('API_COMPRESS_MIN_BYTES', 1024))
+# Cuerpos ya serializados y comprimidos que se guardan (por ETag y codificación)
+API_CACHE_SIZE = int(os.environ.get('API_CACHE_SIZE', 32))
+
+# --- FEED DE CAMBIOS DE STOCK ---
+# Eventos que se guardan por sucursal (anillo); un cliente más atrasado recarga el catálogo
+STOCK_FEED_SIZE = int(os.environ.get('STOCK_FEED_SIZE', 2048))
+# Segundos máximos que una petición de long-polling espera cambios
+STOCK_FEED_POLL_MAX = float(os.environ.get('STOCK_FEED_POLL_MAX', 25))
+# Esperas simultáneas permitidas: cada una ocupa un hilo del servidor (SERVER_THREADS)
+STOCK_FEED_MAX_ESPERAS = int(os.environ.get('STOCK_FEED_MAX_ESPERAS', 4))
+
+# --- CONCILIACIÓN DE LOGÍSTICA (envíos Guayaquil vs recepciones Quito) ---
+RECONCILIACION_DB = os.environ.get('RECONCILIACION_DB', os.path.join(DATA_DIR, 'techstore_conciliacion.sqlite3'))
+# Segundos entre pasadas automáticas
+RECONCILIACION_INTERVALO = float(os.environ.get('RECONCILIACION_INTERVALO', 900))
+# Envíos por bloque (keyset por Id_envio) en cada nodo
+RECONCILIACION_LOTE = int(os.environ.get('RECONCILIACION_LOTE', 2000))
+# Tiempo máximo por bloque en cada nodo (segundos)
+RECONCILIACION_TIMEOUT = float(os.environ.get('RECONCILIACION_TIMEOUT', 30))
+# Un envío sin recepción después de estas horas se reporta como atascado
+RECONCILIACION_ATASCO_HORAS = float(os.environ.get('RECONCILIACION_ATASCO_HORAS', 48))
+# Minutos que se espera a que un envío nuevo aparezca en el nodo Quito
+RECONCILIACION_GRACIA_MIN = float(os.environ.get('RECONCILIACION_GRACIA_MIN', 10))
+
+# --- RECEPCIÓN POR LOTE (LOGÍSTICA) ---
+# Envíos que se aceptan en una sola petición de "Recibir seleccionados"
+RECEPCION_MAX_LOTE = int(os.environ.get('RECEPCION_MAX_LOTE', 500))
+
+# --- SESIONES EN EL SERVIDOR ---
+# 'memoria' (un proceso), 'sqlite' (varios procesos / reinicios) o 'cookie' (cookie firmada de Flask)
+SESSION_BACKEND = os.environ.get('SESSION_BACKEND', 'memoria')
+SESSION_DB = os.environ.get('SESSION_DB', os.path.join(DATA_DIR, 'techstore_sesiones.sqlite3'))
+# Segundos de inactividad tras los que vence una sesión
+SESSION_TTL = float(os.environ.get('SESSION_TTL', 8 * 3600))
+# Sesiones máximas en memoria (se expulsan las menos usadas)
+SESSION_MAX = int(os.environ.get('SESSION_MAX', 10000))
+# Segundos entre barridos de sesiones vencidas
+SESSION_BARRIDO = float(os.environ.get('SESSION_BARRIDO', 60))
+# Vigencia del carrito guardado de cada cliente y productos distintos que admite
+CARRITO_TTL = float(os.environ.get('CARRITO_TTL', 30 * 24 * 3600))
+CARRITO_MAX_ITEMS = int(os.environ.get('CARRITO_MAX_ITEMS', 100))
+
+# --- PLANTILLAS (bytecode de Jinja y caché de fragmentos) ---
+# Carpeta del bytecode compilado de las plantillas, compartida por workers y reinicios ('' lo desactiva)
+JINJA_CACHE_DIR = os.environ.get('JINJA_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'techstore_jinja'))
+# Fragmentos renderizados ({% cache %}) que se guardan como máximo y segundos que duran
+FRAGMENT_CACHE_SIZE = int(os.environ.get('FRAGMENT_CACHE_SIZE', 20000))
+FRAGMENT_CACHE_TTL = float(os.environ.get('FRAGMENT_CACHE_TTL', 600))
+
+# --- ESTÁTICOS CON HUELLA (python -m backend.assets) ---
+# Segundos de caché de /assets/ (el nombre cambia con el contenido, así que puede ser un año)
+ASSETS_MAX_AGE = int(os.environ.get('ASSETS_MAX_AGE', 365 * 24 * 3600))
+
+# --- TRABAJOS EN SEGUNDO PLANO (operaciones largas del dashboard) ---
+TRABAJOS_DB = os.environ.get('TRABAJOS_DB', os.path.join(DATA_DIR, 'techstore_trabajos.sqlite3'))
+# Hilos que ejecutan trabajos y cuántos pueden estar a la vez contra un mismo nodo
+TRABAJOS_WORKERS = max(1, int(os.environ.get('TRABAJOS_WORKERS', 4)))
+TRABAJOS_POR_NODO = max(1, int(os.environ.get('TRABAJOS_POR_NODO', 2)))
+# Intentos ante errores transitorios (nodo caído, red, deadlock); la espera se duplica en cada uno
+TRABAJOS_MAX_INTENTOS = int(os.environ.get('TRABAJOS_MAX_INTENTOS', 5))
+TRABAJOS_BACKOFF = float(os.environ.get('TRABAJOS_BACKOFF', 2))
+TRABAJOS_BACKOFF_MAX = float(os.environ.get('TRABAJOS_BACKOFF_MAX', 60))
+# Segundos sin noticias tras los que un trabajo 'ejecutando' se da por abandonado (proceso caído)
+TRABAJOS_LEASE = float(os.environ.get('TRABAJOS_LEASE', 300))
+# Días que se conservan los trabajos terminados
+TRABAJOS_RETENCION_DIAS = float(os.environ.get('TRABAJOS_RETENCION_DIAS', 7))
\ No newline at end of file
@@ -1,25 +1,465 @@
 # backend/database.py
+import logging
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
 import pyodbc
-from .config import NODOS
+from .config import (NODOS, DB_POOL_SIZE, DB_POOL_IDLE_TIMEOUT, DB_POOL_WAIT_TIMEOUT,
+                     DB_POOL_PING_AFTER, DB_CONNECT_TIMEOUT, DB_ODBC_DRIVER, DB_BREAKER_UMBRAL,
+                     DB_BREAKER_ESPERA, DB_HEALTH_INTERVALO, DB_HEALTH_TIMEOUT)
+from .metrics import CursorMedido, medir
+
+log = logging.getLogger(__name__)
+
+
+class PoolAgotadoError(Exception):
+    """No se obtuvo una conexión libre del pool dentro del tiempo de espera."""
+
+
+class NodoCaidoError(Exception):
+    """El circuito del nodo está abierto: se falla al instante en vez de esperar el timeout."""
+
+
+def _resolver_nodo(sucursal_name):
+    """Nombre real del nodo (las sucursales desconocidas caen en Quito, como antes)."""
+    return sucursal_name if sucursal_name in NODOS else 'Quito'
+
+
+_DRIVER_PREFERIDO = 'ODBC Driver 17 for SQL Server'
+_driver = None
+
+
+def odbc_driver():
+    """Driver ODBC a usar. pyodbc.drivers() consulta el gestor ODBC; se hace una sola vez."""
+    global _driver
+    if _driver is None:
+        if DB_ODBC_DRIVER:
+            _driver = DB_ODBC_DRIVER
+        else:
+            try:
+                instalados = [d for d in pyodbc.drivers() if d.startswith('ODBC Driver ') and d.endswith(' for SQL Server')]
+            except pyodbc.Error:
+                instalados = []
+            if _DRIVER_PREFERIDO in instalados or not instalados:
+                _driver = _DRIVER_PREFERIDO
+            else:
+                _driver = max(instalados, key=lambda d: int(d.split()[2]) if d.split()[2].isdigit() else 0)
+    return _driver
+
+
+def build_conn_str(sucursal_name):
+    """Cadena ODBC del nodo seleccionado."""
+    config = NODOS[_resolver_nodo(sucursal_name)]
+    driver = odbc_driver()
 
-def get_db_connection(sucursal_name):
-    """Establece la conexión a SQL Server según el nodo seleccionado."""
-    config = NODOS.get(sucursal_name, NODOS['Quito'])
-    
     if config.get('use_sql_auth'):
-        conn_str = (
-            'DRIVER={ODBC Driver 17 for SQL Server};'
+        return (
+            f'DRIVER={{{driver}}};'
             f'SERVER={config["server"]},1433;'
             f'DATABASE={config["database"]};'
             f'UID={config["user"]};'
             f'PWD={config["password"]};'
         )
-    else:
-        conn_str = (
-            'DRIVER={ODBC Driver 17 for SQL Server};'
-            f'SERVER={config["server"]};'
-            f'DATABASE={config["database"]};'
-            'Trusted_Connection=yes;'
-        )
-    
-    return pyodbc.connect(conn_str, timeout=30)
\ No newline at end of file
+    return (
+        f'DRIVER={{{driver}}};'
+        f'SERVER={config["server"]};'
+        f'DATABASE={config["database"]};'
+        'Trusted_Connection=yes;'
+    )
+
+
+# ==============================================================================
+# CIRCUIT BREAKER POR NODO
+# ==============================================================================
+class CircuitBreaker:
+    """Estado de salud de un nodo.
+
+    - cerrado: todo normal.
+    - abierto: tras `umbral` fallos de conexión seguidos; acquire() falla al instante.
+    - semiabierto: pasados `espera` segundos se deja pasar UNA conexión de prueba;
+      si funciona se cierra, si falla vuelve a abrirse.
+    El monitor de salud también cierra el circuito apenas el nodo responde.
+    """
+
+    def __init__(self, nombre, umbral=DB_BREAKER_UMBRAL, espera=DB_BREAKER_ESPERA):
+        self.nombre = nombre
+        self.umbral = umbral
+        self.espera = espera
+        self._lock = threading.Lock()
+        self.estado = 'cerrado'
+        self._fallos = 0
+        self._abierto_desde = 0.0
+        self._prueba = False       # hay una conexión de prueba en curso (semiabierto)
+        self._ultimo_error = None
+        self._chequeo = None       # (instante, latencia en ms) de la última prueba del monitor
+        self._counters = {'aperturas': 0, 'rechazos': 0}
+
+    def permitir(self):
+        with self._lock:
+            if self.estado == 'cerrado':
+                return True
+            if self.estado == 'abierto' and time.monotonic() - self._abierto_desde >= self.espera:
+                self.estado = 'semiabierto'
+            if self.estado == 'semiabierto' and not self._prueba:
+                self._prueba = True
+                return True
+            self._counters['rechazos'] += 1
+            return False
+
+    def exito(self):
+        with self._lock:
+            self._fallos = 0
+            self._prueba = False
+            if self.estado != 'cerrado':
+                log.warning("Nodo %s disponible otra vez.", self.nombre)
+                self.estado = 'cerrado'
+                self._ultimo_error = None
+
+    def fallo(self, error):
+        with self._lock:
+            self._fallos += 1
+            self._prueba = False
+            self._ultimo_error = str(error)
+            if self.estado == 'semiabierto' or self._fallos >= self.umbral:
+                if self.estado != 'abierto':
+                    self._counters['aperturas'] += 1
+                    log.warning("Nodo %s fuera de servicio tras %d fallos: %s", self.nombre, self._fallos, error)
+                self.estado = 'abierto'
+                self._abierto_desde = time.monotonic()
+
+    def registrar_chequeo(self, latencia_ms):
+        with self._lock:
+            self._chequeo = (time.time(), latencia_ms)
+
+    def error_rechazo(self):
+        with self._lock:
+            restante = max(0.0, self.espera - (time.monotonic() - self._abierto_desde))
+            return NodoCaidoError(f"Nodo {self.nombre} fuera de servicio (último error: {self._ultimo_error}); "
+                                  f"próximo intento en {restante:.0f}s.")
+
+    def stats(self):
+        with self._lock:
+            datos = dict(self._counters, estado=self.estado, fallos=self._fallos, ultimo_error=self._ultimo_error)
+            if self._chequeo:
+                datos['ultimo_chequeo'] = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self._chequeo[0]))
+                datos['latencia_ms'] = self._chequeo[1]
+        return datos
+
+
+# ==============================================================================
+# POOL DE CONEXIONES POR NODO
+# ==============================================================================
+class PooledConnection:
+    """Envoltura de una conexión pyodbc: close() la devuelve al pool en vez de cerrarla."""
+
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+
+    def __getattr__(self, name):
+        if self._raw is None:
+            raise pyodbc.ProgrammingError('La conexión ya fue devuelta al pool.')
+        return getattr(self._raw, name)
+
+    def __setattr__(self, name, value):
+        # Atributos de pyodbc (timeout, autocommit...) van a la conexión real
+        if name.startswith('_'):
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._raw, name, value)
+
+    def cursor(self):
+        return CursorMedido(self.__getattr__('cursor')())
+
+    def commit(self):
+        inicio = time.perf_counter()
+        try:
+            self.__getattr__('commit')()
+        finally:
+            medir('query', time.perf_counter() - inicio, round_trips=1)
+
+    def close(self, discard=False):
+        if self._raw is not None:
+            raw, self._raw = self._raw, None
+            self._pool.release(raw, discard=discard)
+
+    @property
+    def closed(self):
+        return self._raw is None
+
+
+class ConnectionPool:
+    """Pool acotado de conexiones a un nodo SQL Server.
+
+    - Como máximo `max_size` conexiones abiertas (prestadas + ociosas).
+    - Las ociosas por más de `idle_timeout` segundos se cierran.
+    - Al prestar una conexión que lleva más de `ping_after` segundos ociosa se valida con SELECT 1.
+    - Si el pool está lleno se espera hasta `wait_timeout` segundos y luego PoolAgotadoError.
+    """
+
+    def __init__(self, nombre, conn_str, max_size=DB_POOL_SIZE, idle_timeout=DB_POOL_IDLE_TIMEOUT,
+                 wait_timeout=DB_POOL_WAIT_TIMEOUT, ping_after=DB_POOL_PING_AFTER,
+                 connect_timeout=DB_CONNECT_TIMEOUT):
+        self.nombre = nombre
+        self.conn_str = conn_str
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.wait_timeout = wait_timeout
+        self.ping_after = ping_after
+        self.connect_timeout = connect_timeout
+        self.breaker = CircuitBreaker(nombre)
+
+        self._cond = threading.Condition()
+        self._idle = deque()   # (conexión, instante en que se devolvió)
+        self._total = 0        # conexiones abiertas (prestadas + ociosas)
+        self._counters = {
+            'hits': 0,         # préstamo servido con una conexión reutilizada
+            'misses': 0,       # préstamo que abrió una conexión nueva
+            'waits': 0,        # préstamos que tuvieron que esperar
+            'wait_time': 0.0,  # segundos acumulados esperando
+            'timeouts': 0,     # préstamos que fallaron por pool agotado
+            'evicted': 0,      # conexiones cerradas por ociosas
+            'discarded': 0,    # conexiones descartadas por rotas
+        }
+
+    # --- API pública ---
+    def acquire(self, timeout=None):
+        """Presta una conexión pyodbc cruda. Debe devolverse con release().
+
+        Con el circuito del nodo abierto lanza NodoCaidoError sin intentar conectar.
+        `timeout` (segundos) acota la espera en el pool y la conexión nueva, si es menor
+        que los del pool.
+        """
+        inicio = time.perf_counter()
+        if not self.breaker.permitir():
+            raise self.breaker.error_rechazo()
+        try:
+            while True:
+                conn, last_used = self._checkout(self.wait_timeout if timeout is None
+                                                 else min(self.wait_timeout, timeout))
+                if conn is None:
+                    return self._open_new(self.connect_timeout if timeout is None
+                                          else min(self.connect_timeout, max(1, math.ceil(timeout))))
+
+                if time.monotonic() - last_used > self.ping_after and not self._is_alive(conn):
+                    self._drop(conn)
+                    continue
+                return conn
+        finally:
+            # Espera en el pool + conexión nueva o ping: fase "connect" de la petición
+            medir('connect', time.perf_counter() - inicio)
+
+    def release(self, conn, discard=False):
+        """Devuelve una conexión; se deshace cualquier transacción pendiente."""
+        if not discard:
+            try:
+                conn.rollback()
+                conn.timeout = 0   # Sin límite de tiempo por consulta (valor por defecto de pyodbc)
+            except pyodbc.Error:
+                discard = True
+
+        if discard:
+            # Error de red / driver con la conexión en uso: cuenta como fallo del nodo
+            self.breaker.fallo('conexión perdida')
+            self._drop(conn)
+            return
+        self.breaker.exito()
+
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        conn = PooledConnection(self, self.acquire(timeout))
+        try:
+            yield conn
+        except (pyodbc.OperationalError, pyodbc.InterfaceError):
+            # Error de red / driver: la conexión puede haber quedado inservible
+            conn.close(discard=True)
+            raise
+        finally:
+            conn.close()
+
+    def stats(self):
+        with self._cond:
+            datos = dict(self._counters)
+            datos.update(nodo=self.nombre, max_size=self.max_size,
+                         open=self._total, idle=len(self._idle),
+                         in_use=self._total - len(self._idle))
+        datos['breaker'] = self.breaker.stats()
+        return datos
+
+    def close_all(self):
+        with self._cond:
+            ociosas = [c for c, _ in self._idle]
+            self._idle.clear()
+            self._total -= len(ociosas)
+            self._cond.notify_all()
+        for c in ociosas:
+            self._safe_close(c)
+
+    # --- Internos ---
+    def _checkout(self, wait_timeout):
+        """Toma una conexión ociosa, o reserva un cupo para abrir una nueva (None)."""
+        deadline = time.monotonic() + wait_timeout
+        inicio_espera = None
+        expiradas = []
+        try:
+            with self._cond:
+                while True:
+                    ahora = time.monotonic()
+                    # Las más antiguas quedan a la izquierda: se expulsan primero
+                    while self._idle and ahora - self._idle[0][1] > self.idle_timeout:
+                        expiradas.append(self._idle.popleft()[0])
+                        self._total -= 1
+                        self._counters['evicted'] += 1
+
+                    if self._idle:
+                        # LIFO: reutilizamos la conexión más "caliente"
+                        conn, last_used = self._idle.pop()
+                        self._counters['hits'] += 1
+                        return conn, last_used
+
+                    if self._total < self.max_size:
+                        self._total += 1
+                        self._counters['misses'] += 1
+                        return None, None
+
+                    restante = deadline - ahora
+                    if restante <= 0:
+                        self._counters['timeouts'] += 1
+                        raise PoolAgotadoError(
+                            f"Pool de {self.nombre} agotado: {self.max_size} conexiones ocupadas "
+                            f"tras esperar {wait_timeout:g}s.")
+
+                    if inicio_espera is None:
+                        inicio_espera = ahora
+                        self._counters['waits'] += 1
+                    self._cond.wait(restante)
+        finally:
+            if inicio_espera is not None:
+                with self._cond:
+                    self._counters['wait_time'] += time.monotonic() - inicio_espera
+            for c in expiradas:
+                self._safe_close(c)
+
+    def _open_new(self, connect_timeout):
+        try:
+            return pyodbc.connect(self.conn_str, timeout=connect_timeout)
+        except Exception as e:
+            # Liberamos el cupo reservado en _checkout
+            with self._cond:
+                self._total -= 1
+                self._cond.notify()
+            self.breaker.fallo(e)
+            raise
+
+    def probar(self, timeout=DB_HEALTH_TIMEOUT):
+        """Prueba del monitor: conexión nueva y SELECT 1, fuera del pool y con timeout corto."""
+        inicio = time.perf_counter()
+        try:
+            conn = pyodbc.connect(self.conn_str, timeout=timeout)
+            try:
+                conn.cursor().execute('SELECT 1').fetchone()
+            finally:
+                self._safe_close(conn)
+        except Exception as e:
+            self.breaker.fallo(e)
+            return False
+        self.breaker.registrar_chequeo(round((time.perf_counter() - inicio) * 1000, 1))
+        self.breaker.exito()
+        return True
+
+    def _is_alive(self, conn):
+        try:
+            conn.cursor().execute('SELECT 1').fetchone()
+            return True
+        except pyodbc.Error:
+            return False
+
+    def _drop(self, conn):
+        self._safe_close(conn)
+        with self._cond:
+            self._total -= 1
+            self._counters['discarded'] += 1
+            self._cond.notify()
+
+    @staticmethod
+    def _safe_close(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(sucursal_name):
+    """Pool del nodo (se crea perezosamente, uno por entrada de NODOS)."""
+    nombre = _resolver_nodo(sucursal_name)
+    pool = _pools.get(nombre)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(nombre)
+            if pool is None:
+                pool = _pools[nombre] = ConnectionPool(nombre, build_conn_str(nombre))
+                _iniciar_monitor(pool)
+    return pool
+
+
+def pool_stats():
+    """Contadores de todos los pools creados hasta ahora."""
+    return {nombre: pool.stats() for nombre, pool in list(_pools.items())}
+
+
+def node_status():
+    """{nodo: estado del circuito} de todos los nodos ('cerrado' = disponible)."""
+    return {nombre: (_pools[nombre].breaker.estado if nombre in _pools else 'cerrado') for nombre in NODOS}
+
+
+def nodo_disponible(sucursal_name):
+    pool = _pools.get(_resolver_nodo(sucursal_name))
+    return pool is None or pool.breaker.estado == 'cerrado'
+
+
+def _iniciar_monitor(pool, intervalo=DB_HEALTH_INTERVALO):
+    """Un hilo por nodo que lo prueba cada `intervalo` segundos."""
+    if intervalo <= 0:
+        return
+
+    def bucle():
+        while True:
+            pool.probar()
+            time.sleep(intervalo)
+
+    threading.Thread(target=bucle, name=f'salud-{pool.nombre}', daemon=True).start()
+
+
+def close_pools():
+    for pool in list(_pools.values()):
+        pool.close_all()
+
+
+@contextmanager
+def db_connection(sucursal_name, timeout=None):
+    """Conexión prestada del pool del nodo; se devuelve sola al salir del bloque `with`.
+
+    `timeout` acota cuánto se espera por ella (pool lleno o nodo que no contesta al conectar).
+    """
+    with get_pool(sucursal_name).connection(timeout) as conn:
+        yield conn
+
+
+def get_db_connection(sucursal_name):
+    """Establece la conexión a SQL Server según el nodo seleccionado.
+
+    Devuelve una conexión del pool: conn.close() la regresa al pool.
+    """
+    pool = get_pool(sucursal_name)
+    return PooledConnection(pool, pool.acquire())
\ No newline at end of file
@@ -0,0 +1,166 @@
+# backend/export.py
+import csv
+import io
+import logging
+import re
+import zipfile
+from datetime import date, datetime
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+from .config import EXPORT_CHUNK_SIZE
+from .database import db_connection
+from .pagination import consulta_exportar
+
+log = logging.getLogger(__name__)
+
+
+def iterar_filas(fuentes, args, chunk_size=EXPORT_CHUNK_SIZE):
+    """Recorre una o varias consultas con fetchmany, sin cargarlas completas en memoria.
+
+    fuentes: [(nodo, TablaSpec, cache_key)]. Produce primero la lista de columnas y
+    después bloques de filas; el llamador toma las columnas con next() para que los
+    errores de conexión salgan antes de empezar la respuesta. Si el cliente corta la
+    descarga (close() del generador) se cancela la consulta y la conexión vuelve al pool.
+    """
+    primera = True
+    for nodo, spec, cache_key in fuentes:
+        with db_connection(nodo) as conn:
+            cursor = conn.cursor()
+            columnas, sql, params = consulta_exportar(cursor, spec, args, cache_key)
+            cursor.arraysize = chunk_size
+            cursor.execute(sql, params)
+            terminado = False
+            try:
+                if primera:
+                    primera = False
+                    yield columnas
+                while True:
+                    bloque = cursor.fetchmany(chunk_size)
+                    if not bloque:
+                        terminado = True
+                        break
+                    yield bloque
+            finally:
+                if not terminado:
+                    log.info("Exportación cancelada en %s: se corta la consulta.", nodo)
+                    try:
+                        cursor.cancel()
+                    except Exception:
+                        pass
+
+
+# ==============================================================================
+# CSV
+# ==============================================================================
+def generar_csv(columnas, bloques):
+    """Bytes CSV (UTF-8 con BOM para Excel) a partir de los bloques de iterar_filas."""
+    try:
+        buffer = io.StringIO()
+        escritor = csv.writer(buffer)
+        escritor.writerow(columnas)
+        yield ('\ufeff' + buffer.getvalue()).encode('utf-8')
+        for bloque in bloques:
+            buffer.seek(0)
+            buffer.truncate()
+            escritor.writerows(bloque)
+            yield buffer.getvalue().encode('utf-8')
+    finally:
+        bloques.close()   # Descarga cortada: cancela la consulta de inmediato
+
+
+# ==============================================================================
+# EXCEL (XLSX mínimo escrito en streaming, sin dependencias)
+# ==============================================================================
+class _Salida(io.RawIOBase):
+    """Archivo de solo escritura y no buscable: zipfile escribe aquí y vaciamos por partes."""
+
+    def __init__(self):
+        self._partes = []
+
+    def writable(self):
+        return True
+
+    def write(self, datos):
+        self._partes.append(bytes(datos))
+        return len(datos)
+
+    def vaciar(self):
+        datos = b''.join(self._partes)
+        self._partes.clear()
+        return datos
+
+
+_CONTROL = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')   # no válidos en XML
+
+_XLSX_FIJOS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="xl/workbook.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+        '</Relationships>'),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="worksheets/sheet1.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+        '</Relationships>'),
+}
+
+
+def _celda(valor):
+    if valor is None:
+        return '<c/>'
+    if isinstance(valor, bool):
+        return f'<c t="b"><v>{int(valor)}</v></c>'
+    if isinstance(valor, (int, float, Decimal)):
+        return f'<c><v>{valor}</v></c>'
+    if isinstance(valor, (datetime, date)):
+        valor = valor.isoformat(' ') if isinstance(valor, datetime) else valor.isoformat()
+    texto = escape(_CONTROL.sub('', str(valor)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{texto}</t></is></c>'
+
+
+def _fila(valores):
+    return '<row>' + ''.join(_celda(v) for v in valores) + '</row>'
+
+
+def generar_xlsx(columnas, bloques, hoja='Datos'):
+    """Un .xlsx que se envía mientras se escribe, a partir de los bloques de iterar_filas."""
+    try:
+        salida = _Salida()
+        with zipfile.ZipFile(salida, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+            for nombre, contenido in _XLSX_FIJOS.items():
+                zf.writestr(nombre, contenido)
+            zf.writestr('xl/workbook.xml', (
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+                'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+                f'<sheets><sheet name="{escape(hoja[:31])}" sheetId="1" r:id="rId1"/></sheets></workbook>'))
+            yield salida.vaciar()
+
+            with zf.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as hoja_xml:
+                hoja_xml.write((
+                    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+                    + _fila(columnas)).encode('utf-8'))
+                for bloque in bloques:
+                    hoja_xml.write(''.join(_fila(f) for f in bloque).encode('utf-8'))
+                    datos = salida.vaciar()
+                    if datos:
+                        yield datos
+                hoja_xml.write(b'</sheetData></worksheet>')
+        yield salida.vaciar()
+    finally:
+        bloques.close()
\ No newline at end of file
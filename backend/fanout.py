@@ -0,0 +1,118 @@
+# backend/fanout.py
+import contextvars
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
+
+from .config import NODOS, FANOUT_TIMEOUT, FANOUT_WORKERS
+from .database import db_connection
+
+
+class ResultadoNodo:
+    """Resultado de un nodo: `valor` si respondió, `error` (texto) si falló o no llegó a tiempo."""
+
+    __slots__ = ('nodo', 'valor', 'error', 'segundos')
+
+    def __init__(self, nodo, valor=None, error=None, segundos=None):
+        self.nodo = nodo
+        self.valor = valor
+        self.error = error
+        self.segundos = segundos
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+_counters_lock = threading.Lock()
+_counters = {}   # nodo -> {'ok', 'errores', 'timeouts', 'tiempo'}
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=FANOUT_WORKERS, thread_name_prefix='fanout')
+    return _executor
+
+
+def _contar(nodo, clave, segundos=None):
+    with _counters_lock:
+        c = _counters.setdefault(nodo, {'ok': 0, 'errores': 0, 'timeouts': 0, 'tiempo': 0.0})
+        c[clave] += 1
+        if segundos is not None:
+            c['tiempo'] += segundos
+
+
+def fanout_stats():
+    with _counters_lock:
+        datos = {nodo: dict(c) for nodo, c in _counters.items()}
+    for c in datos.values():
+        tiempo, respuestas = c.pop('tiempo'), c['ok']
+        c['tiempo_medio'] = round(tiempo / respuestas, 4) if respuestas else 0.0
+    return datos
+
+
+def _ejecutar(nodo, trabajo, timeout):
+    inicio = time.monotonic()
+    # El mismo límite al conectar: un nodo caído no retiene un hilo compartido DB_CONNECT_TIMEOUT s
+    with db_connection(nodo, timeout) as conn:
+        # Límite de la consulta en el servidor: no dejamos hilos colgados tras el timeout
+        conn.timeout = max(1, math.ceil(timeout))
+        resultado = trabajo(nodo, conn)
+    return resultado, time.monotonic() - inicio
+
+
+def fan_out(trabajo, nodos=None, timeout=FANOUT_TIMEOUT):
+    """Ejecuta `trabajo(nodo, conn)` en varios nodos a la vez.
+
+    Devuelve {nodo: ResultadoNodo} en el orden de `nodos` (todos los de NODOS por defecto).
+    `timeout` son segundos, o un dict {nodo: segundos} para límites distintos por nodo.
+    Un nodo caído o que no responde a tiempo no invalida a los demás.
+    """
+    nodos = list(nodos or NODOS)
+    limites = timeout if isinstance(timeout, dict) else dict.fromkeys(nodos, timeout)
+    executor = _get_executor()
+    inicio = time.monotonic()
+    # Cada hilo corre en una copia del contexto: las métricas de la petición siguen sumando
+    futuros = {nodo: executor.submit(contextvars.copy_context().run, _ejecutar, nodo, trabajo,
+                                     limites.get(nodo, FANOUT_TIMEOUT))
+               for nodo in nodos}
+
+    resultados = {}
+    for nodo, futuro in futuros.items():
+        limite = limites.get(nodo, FANOUT_TIMEOUT)
+        try:
+            valor, segundos = futuro.result(timeout=max(0, inicio + limite - time.monotonic()))
+            _contar(nodo, 'ok', segundos)
+            resultados[nodo] = ResultadoNodo(nodo, valor=valor, segundos=segundos)
+        except FuturesTimeout:
+            # El hilo termina por su cuenta (timeout de la consulta); no lo esperamos
+            futuro.cancel()
+            _contar(nodo, 'timeouts')
+            resultados[nodo] = ResultadoNodo(nodo, error=f"{nodo} no respondió en {limite:g}s.")
+        except Exception as e:
+            _contar(nodo, 'errores')
+            resultados[nodo] = ResultadoNodo(nodo, error=str(e))
+    return resultados
+
+
+def consultar_nodos(sql, params=(), nodos=None, timeout=FANOUT_TIMEOUT):
+    """La misma consulta en cada nodo. Devuelve (filas, errores).
+
+    filas: [(nodo, fila)] en orden de nodo; errores: {nodo: mensaje} de los que fallaron.
+    """
+    def trabajo(nodo, conn):
+        cursor = conn.cursor()
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+    resultados = fan_out(trabajo, nodos, timeout)
+    filas = [(r.nodo, fila) for r in resultados.values() if r.ok for fila in r.valor]
+    errores = {r.nodo: r.error for r in resultados.values() if not r.ok}
+    return filas, errores
\ No newline at end of file
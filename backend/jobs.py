@@ -0,0 +1,335 @@
+# backend/jobs.py
+import json
+import logging
+import os
+import random
+import secrets
+import sqlite3
+import threading
+import time
+
+import pyodbc
+
+from .checkout import es_deadlock
+from .config import (TRABAJOS_BACKOFF, TRABAJOS_BACKOFF_MAX, TRABAJOS_DB, TRABAJOS_LEASE, TRABAJOS_MAX_INTENTOS,
+                     TRABAJOS_POR_NODO, TRABAJOS_RETENCION_DIAS, TRABAJOS_WORKERS)
+from .database import NodoCaidoError, PoolAgotadoError, db_connection
+
+log = logging.getLogger(__name__)
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS trabajos (
+    id TEXT PRIMARY KEY,
+    tipo TEXT NOT NULL,
+    nodo TEXT NOT NULL,
+    parametros TEXT NOT NULL,
+    usuario TEXT,
+    estado TEXT NOT NULL,            -- pendiente / ejecutando / ok / error
+    intentos INTEGER NOT NULL DEFAULT 0,
+    max_intentos INTEGER NOT NULL,
+    proximo REAL NOT NULL,           -- no antes de este instante (espera entre reintentos)
+    vence REAL,                      -- mientras 'ejecutando': se da por abandonado pasado este instante
+    progreso INTEGER NOT NULL DEFAULT 0,
+    mensaje TEXT,
+    resultado TEXT,
+    error TEXT,
+    creado REAL NOT NULL,
+    actualizado REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_trabajos_cola ON trabajos (estado, proximo);
+"""
+
+_COLUMNAS = ('id', 'tipo', 'nodo', 'usuario', 'estado', 'intentos', 'max_intentos', 'progreso', 'mensaje',
+             'resultado', 'error', 'creado', 'actualizado', 'proximo')
+
+# Clave de cada trabajo aplicado, en la misma transacción que su trabajo: si el commit llegó
+# al servidor pero la respuesta no (o el proceso murió justo después), el reintento la ve
+# y devuelve el resultado guardado en vez de ejecutar otra vez
+SQL_TABLA_TRABAJOS = """
+IF OBJECT_ID('dbo.TRABAJO_NODO', 'U') IS NULL
+    CREATE TABLE dbo.TRABAJO_NODO (
+        id CHAR(16) NOT NULL PRIMARY KEY,
+        resultado NVARCHAR(MAX) NULL,
+        aplicado DATETIME NOT NULL DEFAULT GETDATE()
+    );
+"""
+
+# tipo -> (función, nodo, después). Se llenan con @tarea en los módulos de rutas.
+_TAREAS = {}
+_FALTA = object()
+
+
+def tarea(tipo, nodo, despues=None):
+    """Registra `funcion(conn, parametros, avance)` como trabajo de `tipo` que corre contra `nodo`.
+
+    `conn` es una conexión del pool de `nodo`; la función NO hace commit: el runner guarda
+    la clave del trabajo y confirma todo junto, así un trabajo se aplica una sola vez
+    aunque se reintente. Debe devolver algo serializable a JSON. `avance(porcentaje,
+    mensaje=None)` informa el progreso. `despues(parametros, resultado)` corre tras el
+    commit (cachés, feed de stock); también si el trabajo ya estaba aplicado.
+    """
+    def registrar(funcion):
+        _TAREAS[tipo] = (funcion, nodo, despues)
+        return funcion
+    return registrar
+
+
+def es_transitorio(error):
+    """Errores en los que vale la pena reintentar: nodo caído, pool lleno, red o deadlock."""
+    return (isinstance(error, (NodoCaidoError, PoolAgotadoError, pyodbc.OperationalError, pyodbc.InterfaceError))
+            or es_deadlock(error))
+
+
+class JobRunner:
+    """Trabajos largos del dashboard fuera del hilo de la petición.
+
+    - La ruta encola (una fila en SQLite) y responde al instante con el id; el dashboard
+      consulta estado() hasta que termina.
+    - `workers` hilos toman trabajos de la cola, como mucho `por_nodo` a la vez contra el
+      mismo nodo: un nodo lento no acapara todos los hilos.
+    - Un error transitorio vuelve el trabajo a la cola con espera exponencial (con jitter)
+      hasta `max_intentos`; cualquier otro error lo termina en 'error'.
+    - Cada trabajo deja su id en TRABAJO_NODO dentro de su propia transacción: reintentarlo
+      (también tras un error en el commit) o retomarlo nunca lo aplica dos veces.
+    - La tabla es persistente y compartida entre procesos: un trabajo que estaba
+      'ejecutando' cuando el proceso murió se retoma al vencer su lease. Un proceso no
+      retoma los que él mismo sigue ejecutando. El límite por nodo es por proceso.
+    """
+
+    def __init__(self, ruta=TRABAJOS_DB, workers=TRABAJOS_WORKERS, por_nodo=TRABAJOS_POR_NODO,
+                 max_intentos=TRABAJOS_MAX_INTENTOS, backoff=TRABAJOS_BACKOFF, backoff_max=TRABAJOS_BACKOFF_MAX,
+                 lease=TRABAJOS_LEASE, retencion_dias=TRABAJOS_RETENCION_DIAS):
+        self.ruta = ruta
+        self.workers = workers
+        self.por_nodo = por_nodo
+        self.max_intentos = max_intentos
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.lease = lease
+        self.retencion = retencion_dias * 86400
+        self._local = threading.local()
+        self._cond = threading.Condition()
+        self._hilos = []
+        self._en_curso = {}          # nodo -> trabajos ejecutándose en este proceso
+        self._ejecutando = set()     # ids de esos trabajos (su lease puede vencer mientras corren)
+        self._tabla_lista = set()    # nodos donde ya se verificó TRABAJO_NODO
+        self._proxima_purga = 0.0
+        self._counters = {'encolados': 0, 'ok': 0, 'errores': 0, 'reintentos': 0, 'retomados': 0,
+                          'ya_aplicados': 0}
+
+    # --- API pública ---
+    def asegurar_iniciado(self):
+        if self._hilos:
+            return
+        with self._cond:
+            if self._hilos:
+                return
+            self._conexion().executescript(_ESQUEMA)
+            for i in range(self.workers):
+                hilo = threading.Thread(target=self._bucle, name=f'trabajos-{i}', daemon=True)
+                hilo.start()
+                self._hilos.append(hilo)
+
+    def encolar(self, tipo, parametros, usuario=None):
+        """Agrega un trabajo a la cola y devuelve su id."""
+        if tipo not in _TAREAS:
+            raise ValueError(f"Tipo de trabajo desconocido: {tipo}")
+        self.asegurar_iniciado()
+        id_trabajo = secrets.token_hex(8)
+        ahora = time.time()
+        conn = self._conexion()
+        with conn:
+            conn.execute("""
+                INSERT INTO trabajos (id, tipo, nodo, parametros, usuario, estado, max_intentos, proximo,
+                                      creado, actualizado)
+                VALUES (?, ?, ?, ?, ?, 'pendiente', ?, ?, ?, ?)
+            """, (id_trabajo, tipo, _TAREAS[tipo][1], json.dumps(parametros), usuario, self.max_intentos,
+                  ahora, ahora, ahora))
+        with self._cond:
+            self._counters['encolados'] += 1
+            self._cond.notify()
+        return id_trabajo
+
+    def estado(self, id_trabajo):
+        """Dict con el estado del trabajo (None si no existe)."""
+        self.asegurar_iniciado()
+        fila = self._conexion().execute(f"SELECT {', '.join(_COLUMNAS)} FROM trabajos WHERE id = ?",
+                                        (id_trabajo,)).fetchone()
+        if fila is None:
+            return None
+        datos = dict(zip(_COLUMNAS, fila))
+        datos['resultado'] = json.loads(datos['resultado']) if datos['resultado'] else None
+        if datos['estado'] == 'pendiente' and datos['intentos']:
+            datos['reintento_en'] = round(max(0.0, datos['proximo'] - time.time()), 1)
+        del datos['proximo']
+        return datos
+
+    def stats(self):
+        self.asegurar_iniciado()
+        por_estado = dict(self._conexion().execute("SELECT estado, COUNT(*) FROM trabajos GROUP BY estado"))
+        with self._cond:
+            return dict(self._counters, por_estado=por_estado, en_curso=dict(self._en_curso),
+                        workers=self.workers, por_nodo=self.por_nodo)
+
+    # --- Internos ---
+    def _bucle(self):
+        while True:
+            try:
+                trabajo = self._tomar()
+            except Exception as e:
+                log.warning("Cola de trabajos: %s", e)
+                trabajo = None
+            if trabajo is None:
+                with self._cond:
+                    self._cond.wait(1.0)
+                continue
+            try:
+                self._ejecutar(*trabajo)
+            finally:
+                with self._cond:
+                    self._en_curso[trabajo[2]] -= 1
+                    self._ejecutando.discard(trabajo[0])
+                    self._cond.notify()
+
+    def _tomar(self):
+        """Reclama el próximo trabajo listo de un nodo con cupo: (id, tipo, nodo, parametros, intentos, max)."""
+        conn = self._conexion()
+        ahora = time.time()
+        self._purgar(conn, ahora)
+        with self._cond:
+            llenos = [n for n, c in self._en_curso.items() if c >= self.por_nodo]
+            filtro = f"AND nodo NOT IN ({', '.join('?' * len(llenos))})" if llenos else ""
+            candidatos = conn.execute(f"""
+                SELECT id, tipo, nodo, parametros, intentos, max_intentos, estado, actualizado FROM trabajos
+                WHERE ((estado = 'pendiente' AND proximo <= ?) OR (estado = 'ejecutando' AND vence < ?)) {filtro}
+                ORDER BY proximo LIMIT 10
+            """, (ahora, ahora, *llenos)).fetchall()
+            for id_trabajo, tipo, nodo, parametros, intentos, maximo, estado, actualizado in candidatos:
+                if id_trabajo in self._ejecutando:
+                    continue   # Lease vencido pero todavía corriendo aquí: no se lanza otra vez
+                # Reclamo optimista: si otro proceso lo tomó primero, `actualizado` ya cambió
+                with conn:
+                    tomado = conn.execute("""
+                        UPDATE trabajos SET estado = 'ejecutando', intentos = intentos + 1, vence = ?,
+                                            actualizado = ?
+                        WHERE id = ? AND estado = ? AND actualizado = ?
+                    """, (ahora + self.lease, ahora, id_trabajo, estado, actualizado)).rowcount
+                if tomado:
+                    self._en_curso[nodo] = self._en_curso.get(nodo, 0) + 1
+                    self._ejecutando.add(id_trabajo)
+                    if estado == 'ejecutando':
+                        self._counters['retomados'] += 1
+                    return id_trabajo, tipo, nodo, json.loads(parametros), intentos + 1, maximo
+        return None
+
+    def _ejecutar(self, id_trabajo, tipo, nodo, parametros, intento, maximo):
+        conn = self._conexion()
+
+        def avance(porcentaje, mensaje=None):
+            ahora = time.time()
+            with conn:
+                conn.execute("UPDATE trabajos SET progreso = ?, mensaje = ?, vence = ?, actualizado = ? WHERE id = ?",
+                             (int(porcentaje), mensaje, ahora + self.lease, ahora, id_trabajo))
+
+        try:
+            resultado = self._aplicar(id_trabajo, tipo, parametros, avance)
+        except Exception as e:
+            ahora = time.time()
+            if es_transitorio(e) and intento < maximo:
+                espera = min(self.backoff_max, self.backoff * 2 ** (intento - 1)) * random.uniform(0.5, 1.0)
+                with conn:
+                    conn.execute("""
+                        UPDATE trabajos SET estado = 'pendiente', proximo = ?, vence = NULL, error = ?,
+                                            mensaje = ?, actualizado = ?
+                        WHERE id = ?
+                    """, (ahora + espera, str(e), f"Reintento {intento + 1} de {maximo}", ahora, id_trabajo))
+                self._contar('reintentos')
+                log.info("Trabajo %s (%s) falló (%s); reintento en %.1f s", id_trabajo, tipo, e, espera)
+            else:
+                with conn:
+                    conn.execute("""
+                        UPDATE trabajos SET estado = 'error', vence = NULL, error = ?, actualizado = ? WHERE id = ?
+                    """, (str(e), ahora, id_trabajo))
+                self._contar('errores')
+                log.warning("Trabajo %s (%s) terminó con error: %s", id_trabajo, tipo, e)
+            return
+
+        ahora = time.time()
+        with conn:
+            conn.execute("""
+                UPDATE trabajos SET estado = 'ok', progreso = 100, vence = NULL, error = NULL, resultado = ?,
+                                    actualizado = ?
+                WHERE id = ?
+            """, (json.dumps(resultado, default=str), ahora, id_trabajo))
+        self._contar('ok')
+
+    def _aplicar(self, id_trabajo, tipo, parametros, avance):
+        """Corre la tarea y guarda su clave en la misma transacción del nodo, o devuelve el
+        resultado guardado si un intento anterior ya la había aplicado."""
+        funcion, nodo, despues = _TAREAS[tipo]
+        with db_connection(nodo) as conn:
+            cursor = conn.cursor()
+            if nodo not in self._tabla_lista:
+                cursor.execute(SQL_TABLA_TRABAJOS)
+                conn.commit()
+                self._tabla_lista.add(nodo)
+            resultado = self._resultado_previo(cursor, id_trabajo)
+            if resultado is _FALTA:
+                resultado = funcion(conn, parametros, avance)
+                try:
+                    cursor.execute("INSERT INTO TRABAJO_NODO (id, resultado) VALUES (?, ?)",
+                                   (id_trabajo, json.dumps(resultado, default=str)))
+                    conn.commit()
+                except pyodbc.IntegrityError:
+                    # Otro proceso lo retomó (lease vencido) y confirmó primero: vale lo suyo
+                    conn.rollback()
+                    resultado = self._resultado_previo(cursor, id_trabajo)
+                    if resultado is _FALTA:
+                        raise
+                    self._contar('ya_aplicados')
+            else:
+                self._contar('ya_aplicados')
+                log.info("Trabajo %s (%s) ya estaba aplicado en %s", id_trabajo, tipo, nodo)
+
+        if despues is not None:
+            try:
+                despues(parametros, resultado)
+            except Exception as e:
+                # Ya está confirmado en el nodo: no se reintenta por esto
+                log.warning("Trabajo %s (%s): %s", id_trabajo, tipo, e)
+        return resultado
+
+    @staticmethod
+    def _resultado_previo(cursor, id_trabajo):
+        cursor.execute("SELECT resultado FROM TRABAJO_NODO WHERE id = ?", (id_trabajo,))
+        fila = cursor.fetchone()
+        if fila is None:
+            return _FALTA
+        return json.loads(fila[0]) if fila[0] else None
+
+    def _purgar(self, conn, ahora):
+        """Borra los trabajos terminados más viejos que la retención (como mucho una vez por minuto)."""
+        with self._cond:
+            if ahora < self._proxima_purga:
+                return
+            self._proxima_purga = ahora + 60
+        with conn:
+            conn.execute("DELETE FROM trabajos WHERE estado IN ('ok', 'error') AND actualizado < ?",
+                         (ahora - self.retencion,))
+
+    def _contar(self, clave):
+        with self._cond:
+            self._counters[clave] += 1
+
+    def _conexion(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.ruta)), exist_ok=True)
+            conn = sqlite3.connect(self.ruta, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+
+runner = JobRunner()
\ No newline at end of file
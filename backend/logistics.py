@@ -0,0 +1,71 @@
+# backend/logistics.py
+import json
+
+ID_QUITO = 1
+
+
+class LoteInvalidoError(ValueError):
+    pass
+
+
+def normalizar_envios(valores, maximo):
+    """Ids de envío del formulario, sin repetidos y en orden."""
+    try:
+        ids = sorted({int(v) for v in valores})
+    except (TypeError, ValueError):
+        raise LoteInvalidoError("Ids de envío inválidos.")
+    if not ids:
+        raise LoteInvalidoError("No se seleccionó ningún envío.")
+    if len(ids) > maximo:
+        raise LoteInvalidoError(f"Máximo {maximo} envíos por lote.")
+    return ids
+
+
+# Todas las recepciones en un batch y una transacción. Cada envío corre bajo su propio
+# SAVEPOINT: si sp_Recibir_De_Guayaquil falla, se deshace solo ese envío y se sigue.
+# Si el error condena la transacción completa (XACT_STATE = -1, o el SP hizo ROLLBACK
+# de todo) no hay recepción parcial posible: se relanza y no se recibe ninguno.
+_SQL_RECEPCION = """
+SET NOCOUNT ON;
+DECLARE @usuario NVARCHAR(100) = ?;
+DECLARE @resultados TABLE (Id_envio INT PRIMARY KEY, ok BIT NOT NULL, mensaje NVARCHAR(4000));
+DECLARE @id INT;
+
+DECLARE envios CURSOR LOCAL FAST_FORWARD FOR
+    SELECT CAST(value AS INT) FROM OPENJSON(?) ORDER BY CAST(value AS INT);
+OPEN envios;
+IF @@TRANCOUNT = 0 BEGIN TRANSACTION;
+FETCH NEXT FROM envios INTO @id;
+WHILE @@FETCH_STATUS = 0
+BEGIN
+    SAVE TRANSACTION recepcion;
+    BEGIN TRY
+        EXEC sp_Recibir_De_Guayaquil @IdEnvio = @id, @Usuario = @usuario;
+        INSERT INTO @resultados (Id_envio, ok) VALUES (@id, 1);
+    END TRY
+    BEGIN CATCH
+        IF XACT_STATE() <> 1 OR @@TRANCOUNT = 0 THROW;
+        ROLLBACK TRANSACTION recepcion;
+        INSERT INTO @resultados (Id_envio, ok, mensaje) VALUES (@id, 0, ERROR_MESSAGE());
+    END CATCH
+    FETCH NEXT FROM envios INTO @id;
+END
+CLOSE envios;
+DEALLOCATE envios;
+
+-- Resultado por envío + stock que quedó en Quito (para el feed de stock)
+SELECT R.Id_envio, R.ok, R.mensaje, E.Id_producto, I.cantidad
+FROM @resultados R
+LEFT JOIN TRANSFERENCIA_ENVIO E ON E.Id_envio = R.Id_envio
+LEFT JOIN INVENTARIO I ON I.Id_producto = E.Id_producto AND I.Id_sucursal = ?
+ORDER BY R.Id_envio;
+"""
+
+
+def recibir_envios(cursor, ids, usuario):
+    """Recibe varios envíos en un solo viaje a la base. No hace commit.
+
+    Devuelve [(Id_envio, ok, mensaje, Id_producto, cantidad en Quito)].
+    """
+    cursor.execute(_SQL_RECEPCION, (usuario, json.dumps(ids), ID_QUITO))
+    return [tuple(f) for f in cursor.fetchall()]
\ No newline at end of file
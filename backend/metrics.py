@@ -0,0 +1,272 @@
+# backend/metrics.py
+import contextvars
+import logging
+import threading
+import time
+
+from .config import METRICS_SLOW_MS, METRICS_TOKEN
+
+log = logging.getLogger(__name__)
+
+FASES = ('connect', 'query', 'fetch', 'render')
+_BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+_BUCKETS_CONTEO = (0, 1, 2, 5, 10, 25, 50, 100, 500, 1000, 5000)
+
+
+# ==============================================================================
+# MEDICIÓN DE LA PETICIÓN EN CURSO
+# ==============================================================================
+class MedicionPeticion:
+    """Tiempos por fase, filas y viajes a la base de una petición.
+
+    Se comparte con los hilos de fan_out (contextvars), por eso suma bajo lock.
+    """
+
+    MAX_SQL = 3   # sentencias más lentas que se guardan para el log de lentas
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.fases = dict.fromkeys(FASES, 0.0)
+        self.filas = 0
+        self.round_trips = 0
+        self.sql = []   # [(segundos, sql)] las más lentas
+        self.status = None
+        self.renders = []   # pila de inicios de render (plantillas anidadas)
+        self._lock = threading.Lock()
+
+    def sumar(self, fase, segundos, filas=0, round_trips=0, sql=None):
+        with self._lock:
+            self.fases[fase] += segundos
+            self.filas += filas
+            self.round_trips += round_trips
+            if sql is not None:
+                self.sql.append((segundos, sql))
+                if len(self.sql) > self.MAX_SQL:
+                    self.sql.sort(key=lambda x: x[0], reverse=True)
+                    del self.sql[self.MAX_SQL:]
+
+
+_actual = contextvars.ContextVar('techstore_medicion', default=None)
+
+
+def medir(fase, segundos, filas=0, round_trips=0, sql=None):
+    """Suma a la petición en curso (no hace nada fuera de una petición)."""
+    medicion = _actual.get()
+    if medicion is not None:
+        medicion.sumar(fase, segundos, filas, round_trips, sql)
+
+
+class CursorMedido:
+    """Envoltura de un cursor pyodbc que cronometra execute (query) y fetch*."""
+
+    def __init__(self, raw):
+        object.__setattr__(self, '_raw', raw)
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._raw, name, value)   # fast_executemany, arraysize...
+
+    def _ejecutar(self, metodo, sql, *args):
+        inicio = time.perf_counter()
+        try:
+            resultado = metodo(sql, *args)
+        finally:
+            medir('query', time.perf_counter() - inicio, round_trips=1, sql=sql)
+        # pyodbc devuelve el mismo cursor para encadenar .fetchone()
+        return self if resultado is self._raw else resultado
+
+    def execute(self, sql, *args):
+        return self._ejecutar(self._raw.execute, sql, *args)
+
+    def executemany(self, sql, *args):
+        return self._ejecutar(self._raw.executemany, sql, *args)
+
+    def _traer(self, metodo, *args):
+        inicio = time.perf_counter()
+        resultado = metodo(*args)
+        if resultado is None:
+            filas = 0
+        elif isinstance(resultado, list):
+            filas = len(resultado)
+        else:
+            filas = 1
+        medir('fetch', time.perf_counter() - inicio, filas=filas)
+        return resultado
+
+    def fetchone(self):
+        return self._traer(self._raw.fetchone)
+
+    def fetchall(self):
+        return self._traer(self._raw.fetchall)
+
+    def fetchmany(self, *args):
+        return self._traer(self._raw.fetchmany, *args)
+
+    def __iter__(self):
+        while True:
+            fila = self.fetchone()
+            if fila is None:
+                return
+            yield fila
+
+
+# ==============================================================================
+# HISTOGRAMAS (formato de texto de Prometheus)
+# ==============================================================================
+class Histograma:
+    def __init__(self, nombre, ayuda, etiquetas, buckets):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = etiquetas
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._series = {}   # valores de etiquetas -> [conteos por bucket..., +Inf, suma]
+
+    def observar(self, valores, dato):
+        with self._lock:
+            serie = self._series.get(valores)
+            if serie is None:
+                serie = self._series[valores] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, limite in enumerate(self.buckets):
+                if dato <= limite:
+                    serie[i] += 1
+                    break
+            else:
+                serie[len(self.buckets)] += 1
+            serie[-1] += dato
+
+    def resumen(self):
+        """{valores de etiquetas: (observaciones, suma)}."""
+        with self._lock:
+            return {k: (sum(v[:-1]), v[-1]) for k, v in self._series.items()}
+
+    def exponer(self):
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} histogram"]
+        with self._lock:
+            series = {k: list(v) for k, v in self._series.items()}
+        for valores, serie in sorted(series.items()):
+            etiquetas = ','.join(f'{k}="{_escapar(v)}"' for k, v in zip(self.etiquetas, valores))
+            acumulado = 0
+            for limite, cuenta in zip(self.buckets + ('+Inf',), serie[:-1]):
+                acumulado += cuenta
+                lineas.append(f'{self.nombre}_bucket{{{etiquetas},le="{limite}"}} {acumulado}')
+            lineas.append(f'{self.nombre}_sum{{{etiquetas}}} {serie[-1]:.6f}')
+            lineas.append(f'{self.nombre}_count{{{etiquetas}}} {acumulado}')
+        return lineas
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+duracion = Histograma('techstore_request_seconds',
+                      'Duración de la petición por endpoint y fase (total, connect, query, fetch, render).',
+                      ('endpoint', 'fase'), _BUCKETS_SEGUNDOS)
+filas_por_peticion = Histograma('techstore_db_rows_per_request', 'Filas leídas de SQL Server por petición.',
+                                ('endpoint',), _BUCKETS_CONTEO)
+viajes_por_peticion = Histograma('techstore_db_round_trips_per_request',
+                                 'Viajes a SQL Server (execute + commit) por petición.',
+                                 ('endpoint',), _BUCKETS_CONTEO)
+
+_peticiones_lock = threading.Lock()
+_peticiones = {}   # (endpoint, status) -> total
+_lentas = [0]
+
+
+def _registrar(endpoint, m):
+    total = time.perf_counter() - m.inicio
+    duracion.observar((endpoint, 'total'), total)
+    for fase in FASES:
+        duracion.observar((endpoint, fase), m.fases[fase])
+    filas_por_peticion.observar((endpoint,), m.filas)
+    viajes_por_peticion.observar((endpoint,), m.round_trips)
+    with _peticiones_lock:
+        clave = (endpoint, str(m.status or 500))
+        _peticiones[clave] = _peticiones.get(clave, 0) + 1
+
+    if METRICS_SLOW_MS and total * 1000 >= METRICS_SLOW_MS:
+        with _peticiones_lock:
+            _lentas[0] += 1
+        fases = ', '.join(f"{f} {m.fases[f] * 1000:.0f}" for f in FASES)
+        sql = '; '.join(f"[{s * 1000:.0f} ms] {' '.join(q.split())[:300]}"
+                        for s, q in sorted(m.sql, key=lambda x: x[0], reverse=True))
+        log.warning("Petición lenta %s: %.0f ms (%s ms) filas=%d viajes=%d SQL: %s",
+                    endpoint, total * 1000, fases, m.filas, m.round_trips, sql or '-')
+
+
+def exponer():
+    """Todas las métricas en formato de texto de Prometheus."""
+    from .database import pool_stats
+
+    lineas = []
+    for h in (duracion, filas_por_peticion, viajes_por_peticion):
+        lineas += h.exponer()
+
+    lineas += ['# HELP techstore_requests_total Peticiones atendidas por endpoint y código HTTP.',
+               '# TYPE techstore_requests_total counter']
+    with _peticiones_lock:
+        peticiones, lentas = dict(_peticiones), _lentas[0]
+    for (endpoint, status), total in sorted(peticiones.items()):
+        lineas.append(f'techstore_requests_total{{endpoint="{_escapar(endpoint)}",status="{status}"}} {total}')
+    lineas += ['# HELP techstore_slow_requests_total Peticiones que superaron METRICS_SLOW_MS.',
+               '# TYPE techstore_slow_requests_total counter',
+               f'techstore_slow_requests_total {lentas}']
+
+    # Estado del pool de conexiones por nodo
+    for clave, tipo in (('in_use', 'gauge'), ('idle', 'gauge'), ('waits', 'counter'),
+                        ('timeouts', 'counter'), ('misses', 'counter')):
+        nombre = f'techstore_pool_{clave}'
+        lineas += [f'# HELP {nombre} Pool de conexiones: {clave}.', f'# TYPE {nombre} {tipo}']
+        for nodo, datos in pool_stats().items():
+            lineas.append(f'{nombre}{{nodo="{_escapar(nodo)}"}} {datos[clave]}')
+    return '\n'.join(lineas) + '\n'
+
+
+# ==============================================================================
+# INTEGRACIÓN CON FLASK
+# ==============================================================================
+def init_app(app):
+    """Mide cada petición y publica /metrics."""
+    from flask import Response, abort, before_render_template, request, template_rendered
+
+    @app.before_request
+    def _iniciar():
+        request.environ['techstore.medicion'] = _actual.set(MedicionPeticion())
+
+    @app.after_request
+    def _status(response):
+        medicion = _actual.get()
+        if medicion is not None:
+            medicion.status = response.status_code
+        return response
+
+    @app.teardown_request
+    def _terminar(exc):
+        token = request.environ.pop('techstore.medicion', None)
+        medicion = _actual.get()
+        if token is None or medicion is None:
+            return
+        _actual.reset(token)
+        _registrar(request.endpoint or 'desconocido', medicion)
+
+    def _antes_render(sender, **extra):
+        medicion = _actual.get()
+        if medicion is not None:
+            medicion.renders.append(time.perf_counter())
+
+    def _despues_render(sender, **extra):
+        medicion = _actual.get()
+        if medicion is not None and medicion.renders:
+            medir('render', time.perf_counter() - medicion.renders.pop())
+
+    before_render_template.connect(_antes_render, app, weak=False)
+    template_rendered.connect(_despues_render, app, weak=False)
+
+    def metrics():
+        if METRICS_TOKEN and request.headers.get('Authorization') != f'Bearer {METRICS_TOKEN}':
+            abort(401)
+        return Response(exponer(), mimetype='text/plain; version=0.0.4')
+
+    app.add_url_rule('/metrics', 'metrics', metrics)
\ No newline at end of file
@@ -0,0 +1,433 @@
+# backend/nodo_simulado.py
+# Nodos SQL Server simulados para el benchmark (python -m backend.benchmark).
+#
+# Se instala en sys.modules['pyodbc'] ANTES de importar la app: cada nodo es un archivo
+# SQLite con el esquema de TechStore y las consultas T-SQL de la app se traducen al vuelo
+# (TOP 0, OFFSET/FETCH, ISNULL, sys.partitions, JOIN anidado). Los batches que SQLite no puede correr
+# (venta de checkout.py, sp_RegistrarClienteNuevo) se emulan en Python con el mismo
+# resultado. Cada viaje a la base duerme `latencia` segundos, como la red hasta el nodo.
+import json
+import random
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+_CENTAVO = Decimal('0.01')
+
+sqlite3.register_adapter(Decimal, str)
+sqlite3.register_adapter(datetime, lambda d: d.isoformat(' '))
+sqlite3.register_converter('MONEY', lambda b: Decimal(b.decode()).quantize(_CENTAVO))
+sqlite3.register_converter('TIMESTAMP', lambda b: datetime.fromisoformat(b.decode()))
+
+
+# --- Excepciones con los nombres de pyodbc ---
+class Error(Exception):
+    pass
+
+
+class InterfaceError(Error):
+    pass
+
+
+class DatabaseError(Error):
+    pass
+
+
+class OperationalError(DatabaseError):
+    pass
+
+
+class ProgrammingError(DatabaseError):
+    pass
+
+
+class IntegrityError(DatabaseError):
+    pass
+
+
+pooling = False
+
+
+def drivers():
+    return ['ODBC Driver 18 for SQL Server']
+
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS SUCURSAL (Id_sucursal INTEGER PRIMARY KEY, nombre TEXT, direccion TEXT, ciudad TEXT);
+CREATE TABLE IF NOT EXISTS PRODUCTO (Id_producto INTEGER PRIMARY KEY, nombre TEXT NOT NULL, marca TEXT, precio MONEY NOT NULL);
+CREATE TABLE IF NOT EXISTS INVENTARIO (
+    Id_sucursal INTEGER NOT NULL, Id_producto INTEGER NOT NULL, cantidad INTEGER NOT NULL,
+    PRIMARY KEY (Id_sucursal, Id_producto)
+);
+CREATE TABLE IF NOT EXISTS CLIENTE (
+    Id_cliente INTEGER PRIMARY KEY, nombre TEXT, direccion TEXT, telefono TEXT, correo TEXT, Id_sucursal INTEGER
+);
+CREATE INDEX IF NOT EXISTS ix_cliente_correo ON CLIENTE (correo);
+CREATE TABLE IF NOT EXISTS EMPLEADO (
+    Id_empleado INTEGER PRIMARY KEY, nombre TEXT, direccion TEXT, telefono TEXT, correo TEXT, Id_sucursal INTEGER
+);
+CREATE INDEX IF NOT EXISTS ix_empleado_correo ON EMPLEADO (correo);
+CREATE TABLE IF NOT EXISTS FACTURA (
+    Id_factura INTEGER NOT NULL, Id_cliente INTEGER, Id_sucursal INTEGER NOT NULL, total MONEY, fecha TIMESTAMP,
+    PRIMARY KEY (Id_factura, Id_sucursal)
+);
+CREATE INDEX IF NOT EXISTS ix_factura_cliente ON FACTURA (Id_cliente, Id_sucursal, fecha, Id_factura);
+CREATE INDEX IF NOT EXISTS ix_factura_fecha ON FACTURA (Id_sucursal, fecha, Id_factura);
+CREATE TABLE IF NOT EXISTS DETALLE_FACTURA (
+    Id_factura INTEGER NOT NULL, Id_producto INTEGER NOT NULL, Id_sucursal INTEGER NOT NULL,
+    cantidad INTEGER, precio_unidad MONEY, subtotal MONEY
+);
+CREATE INDEX IF NOT EXISTS ix_detalle_factura ON DETALLE_FACTURA (Id_factura, Id_sucursal);
+CREATE TABLE IF NOT EXISTS TRANSFERENCIA_ENVIO (
+    Id_envio INTEGER PRIMARY KEY, Id_producto INTEGER, cantidad INTEGER, fecha_envio TIMESTAMP, estado TEXT
+);
+CREATE TABLE IF NOT EXISTS TRANSFERENCIA_RECEPCION (
+    Id_recepcion INTEGER PRIMARY KEY, Id_envio_original INTEGER, fecha_recepcion TIMESTAMP, usuario TEXT
+);
+"""
+
+# Tipo Python de cada columna (pyodbc lo informa en cursor.description; SQLite no)
+_TIPOS = {'Sede': str, 'Producto': str, 'Marca': str, 'Bodega': str, 'Estado_Local': str,
+          'Stock': int, 'Cant': int, 'P.Unit': Decimal, 'Total': Decimal, 'Fecha': datetime}
+
+
+def _registrar_tipos():
+    conn = sqlite3.connect(':memory:')
+    conn.executescript(_ESQUEMA)
+    tipos = {'INTEGER': int, 'TEXT': str, 'MONEY': Decimal, 'TIMESTAMP': datetime}
+    for (tabla,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall():
+        for _, columna, tipo, *_ in conn.execute(f"PRAGMA table_info({tabla})"):
+            _TIPOS.setdefault(columna, tipos.get(tipo, str))
+    conn.close()
+
+
+_registrar_tipos()
+
+
+# ==============================================================================
+# DATOS DE PRUEBA
+# ==============================================================================
+def poblar(ruta, id_sucursal, productos=2000, clientes=500, empleados=20, facturas=20000,
+           envios=2000, semilla=2026):
+    """Crea la base de un nodo. PRODUCTO y CLIENTE son iguales en todos los nodos (misma semilla).
+
+    Correos: cliente<N>@bench.test y empleado<id_sucursal>_<N>@bench.test.
+    """
+    azar = random.Random(semilla)
+    conn = sqlite3.connect(ruta)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(_ESQUEMA)
+    marcas = ['HP', 'Dell', 'Lenovo', 'Asus', 'Acer', 'Apple', 'Samsung', 'Logitech', 'Xiaomi', 'MSI']
+    tipos = ['Laptop', 'Mouse', 'Teclado', 'Monitor', 'Audífonos', 'Tablet', 'Impresora', 'Disco SSD', 'Router']
+
+    with conn:
+        conn.executemany("INSERT INTO SUCURSAL VALUES (?, ?, ?, ?)",
+                         [(1, 'Quito', 'Av. Amazonas', 'Quito'), (2, 'Guayaquil', 'Av. 9 de Octubre', 'Guayaquil')])
+        precios = {i: Decimal(azar.randint(500, 250000)) / 100 for i in range(1, productos + 1)}
+        conn.executemany("INSERT INTO PRODUCTO VALUES (?, ?, ?, ?)",
+                         [(i, f"{azar.choice(tipos)} {azar.choice(marcas)} {i}", azar.choice(marcas), precios[i])
+                          for i in precios])
+        conn.executemany("INSERT INTO CLIENTE VALUES (?, ?, ?, ?, ?, ?)",
+                         [(i, f"Cliente {i}", f"Calle {i}", f"09{i:08d}", f"cliente{i}@bench.test",
+                           1 + i % 2) for i in range(1, clientes + 1)])
+
+        # Lo que sigue es propio del nodo
+        azar = random.Random(semilla * 10 + id_sucursal)
+        # Stock alto: el checkout del benchmark no debe quedarse sin productos
+        conn.executemany("INSERT INTO INVENTARIO VALUES (?, ?, ?)",
+                         [(id_sucursal, i, azar.randint(100000, 1000000)) for i in precios])
+        conn.executemany("INSERT INTO EMPLEADO VALUES (?, ?, ?, ?, ?, ?)",
+                         [(id_sucursal * 1000 + i, f"Empleado {id_sucursal}-{i}", 'Oficina', '022000000',
+                           f"empleado{id_sucursal}_{i}@bench.test", id_sucursal) for i in range(1, empleados + 1)])
+
+        inicio = datetime(2025, 1, 1)
+        cabeceras, detalles = [], []
+        for id_factura in range(1, facturas + 1):
+            fecha = inicio + timedelta(minutes=id_factura * 20 + azar.randint(0, 19))
+            total = Decimal(0)
+            for id_prod in azar.sample(range(1, productos + 1), azar.randint(1, min(4, productos))):
+                cantidad = azar.randint(1, 3)
+                subtotal = precios[id_prod] * cantidad
+                total += subtotal
+                detalles.append((id_factura, id_prod, id_sucursal, cantidad, precios[id_prod], subtotal))
+            cabeceras.append((id_factura, azar.randint(1, clientes), id_sucursal, total, fecha))
+        conn.executemany("INSERT INTO FACTURA VALUES (?, ?, ?, ?, ?)", cabeceras)
+        conn.executemany("INSERT INTO DETALLE_FACTURA VALUES (?, ?, ?, ?, ?, ?)", detalles)
+
+        conn.executemany("INSERT INTO TRANSFERENCIA_ENVIO VALUES (?, ?, ?, ?, ?)",
+                         [(i, azar.randint(1, productos), azar.randint(1, 20),
+                           inicio + timedelta(hours=i), 'ENVIADO') for i in range(1, envios + 1)])
+        conn.executemany("INSERT INTO TRANSFERENCIA_RECEPCION VALUES (?, ?, ?, ?)",
+                         [(i, i, inicio + timedelta(hours=i + 30), 'bench') for i in range(1, envios + 1, 2)])
+    conn.execute("ANALYZE")
+    conn.close()
+
+
+# ==============================================================================
+# CONFIGURACIÓN Y CONTADORES
+# ==============================================================================
+_config = {'bases': {}, 'latencia': 0.0, 'latencia_conexion': 0.0}
+_lock = threading.Lock()
+_counters = {}   # base -> {'conexiones', 'round_trips', 'commits'}
+
+
+def configurar(bases, latencia=0.0, latencia_conexion=0.0):
+    """bases: {nombre de DATABASE en la cadena ODBC: ruta del archivo SQLite}. Latencias en segundos."""
+    _config.update(bases=dict(bases), latencia=latencia, latencia_conexion=latencia_conexion)
+    with _lock:
+        _counters.clear()
+
+
+def estadisticas():
+    with _lock:
+        return {base: dict(c) for base, c in _counters.items()}
+
+
+def _contar(base, clave):
+    with _lock:
+        c = _counters.setdefault(base, {'conexiones': 0, 'round_trips': 0, 'commits': 0})
+        c[clave] += 1
+
+
+def _viaje(base, clave='round_trips'):
+    _contar(base, clave)
+    if _config['latencia']:
+        time.sleep(_config['latencia'])
+
+
+# ==============================================================================
+# TRADUCCIÓN T-SQL -> SQLite
+# ==============================================================================
+_OFFSET_FETCH = re.compile(r'OFFSET\s+(\?|\d+)\s+ROWS\s+FETCH\s+NEXT\s+(\?|\d+)\s+ROWS\s+ONLY', re.I)
+_TOP_0 = re.compile(r'^\s*SELECT\s+TOP\s+0\s+', re.I)
+_PARTICIONES = re.compile(r'FROM\s+sys\.partitions', re.I)
+_JOIN_ANIDADO = re.compile(r'LEFT JOIN \((\w+ \w+) JOIN (\w+ \w+) ON ([^)]+)\)\s+ON ([^\n]+)', re.I)
+
+
+def _traducir(sql, params):
+    params = list(params)
+    if _PARTICIONES.search(sql):
+        # Conteo aproximado de filas (metadatos en SQL Server): aquí un COUNT(*) de la tabla
+        tabla = params[0]
+        if tabla not in _TABLAS:
+            raise ProgrammingError(f"Tabla desconocida: {tabla}")
+        return f"SELECT COUNT(*) FROM {tabla}", []
+
+    if _TOP_0.match(sql):
+        sql = _TOP_0.sub('SELECT ', sql) + ' LIMIT 0'
+
+    # OFFSET x ROWS FETCH NEXT y ROWS ONLY -> LIMIT y OFFSET x (invirtiendo los parámetros)
+    partes, ultimo = [], 0
+    for m in _OFFSET_FETCH.finditer(sql):
+        partes.append(sql[ultimo:m.start()])
+        offset, limite = m.group(1), m.group(2)
+        if offset == '?' and limite == '?':
+            i = sql.count('?', 0, m.start())
+            params[i], params[i + 1] = params[i + 1], params[i]
+        partes.append(f"LIMIT {limite} OFFSET {offset}")
+        ultimo = m.end()
+    sql = ''.join(partes) + sql[ultimo:]
+
+    # SQLite materializa completo un JOIN entre paréntesis (SQL Server lo resuelve con seeks):
+    # LEFT JOIN (A JOIN B ON x) ON y  ->  LEFT JOIN A ON y LEFT JOIN B ON x  (B es una FK de A)
+    sql = _JOIN_ANIDADO.sub(r'LEFT JOIN \1 ON \4 LEFT JOIN \2 ON \3', sql)
+    # Las fechas se guardan como texto: el CAST a datetime de SQL Server no cambia nada aquí
+    sql = re.sub(r'CAST\(\?\s+AS\s+DATETIME\)', '?', sql, flags=re.I)
+    sql = re.sub(r'\bISNULL\(', 'IFNULL(', sql, flags=re.I)
+    sql = re.sub(r'\bGETDATE\(\)', "datetime('now', 'localtime')", sql, flags=re.I)
+    return sql, params
+
+
+_TABLAS = ('SUCURSAL', 'PRODUCTO', 'INVENTARIO', 'CLIENTE', 'EMPLEADO', 'FACTURA', 'DETALLE_FACTURA',
+           'TRANSFERENCIA_ENVIO', 'TRANSFERENCIA_RECEPCION')
+
+
+# --- Batches emulados ---
+def _venta(conn, params):
+    """Lo mismo que _SQL_VENTA de checkout.py: reserva, factura y detalles; mismas filas de resultado."""
+    id_sucursal, carrito_json, id_cliente = params
+    items = {int(i['id']): int(i['cantidad']) for i in json.loads(carrito_json)}
+    reservas, faltantes = [], []
+    for id_prod, cantidad in items.items():
+        fila = conn.execute("""
+            UPDATE INVENTARIO SET cantidad = cantidad - ?
+            WHERE Id_sucursal = ? AND Id_producto = ? AND cantidad >= ?
+            RETURNING Id_producto, cantidad
+        """, (cantidad, id_sucursal, id_prod, cantidad)).fetchone()
+        if fila:
+            reservas.append(fila)
+        else:
+            nombre = conn.execute("SELECT nombre FROM PRODUCTO WHERE Id_producto = ?", (id_prod,)).fetchone()
+            faltantes.append((0, id_prod, nombre[0] if nombre else None, None))
+    if faltantes:
+        return ['ok', 'Id_producto', 'nombre', 'x'], faltantes
+
+    id_factura = conn.execute("SELECT IFNULL(MAX(Id_factura), 0) + 1 FROM FACTURA").fetchone()[0]
+    precios = dict(conn.execute(f"SELECT Id_producto, precio FROM PRODUCTO WHERE Id_producto IN "
+                                f"({', '.join('?' * len(items))})", list(items)).fetchall())
+    total = sum(precios[i] * c for i, c in items.items())
+    conn.execute("INSERT INTO FACTURA VALUES (?, ?, ?, ?, ?)",
+                 (id_factura, id_cliente, id_sucursal, total, datetime.now()))
+    conn.executemany("INSERT INTO DETALLE_FACTURA VALUES (?, ?, ?, ?, ?, ?)",
+                     [(id_factura, i, id_sucursal, c, precios[i], precios[i] * c) for i, c in items.items()])
+    return ['ok', 'Id_factura', 'Id_producto', 'cantidad'], [(1, id_factura, i, c) for i, c in reservas]
+
+
+def _registrar_cliente(conn, params):
+    conn.execute("INSERT OR IGNORE INTO CLIENTE VALUES (?, ?, ?, ?, ?, NULL)", params)
+    return None, []
+
+
+def _tabla_pedidos(conn, params):
+    """SQL_TABLA_PEDIDOS de checkout.py (también en datos generados antes de que existiera)."""
+    conn.execute("CREATE TABLE IF NOT EXISTS PEDIDO_WEB (clave TEXT PRIMARY KEY, Id_factura INTEGER NOT NULL, "
+                 "aplicado TIMESTAMP DEFAULT CURRENT_TIMESTAMP)")
+    return None, []
+
+
+def _tabla_trabajos(conn, params):
+    """SQL_TABLA_TRABAJOS de jobs.py."""
+    conn.execute("CREATE TABLE IF NOT EXISTS TRABAJO_NODO (id TEXT PRIMARY KEY, resultado TEXT, "
+                 "aplicado TIMESTAMP DEFAULT CURRENT_TIMESTAMP)")
+    return None, []
+
+
+_EMULADOS = (
+    ('OPENJSON(?) WITH (Id_producto INT', _venta),
+    ('EXEC sp_RegistrarClienteNuevo', _registrar_cliente),
+    ("IF OBJECT_ID('dbo.PEDIDO_WEB'", _tabla_pedidos),
+    ("IF OBJECT_ID('dbo.TRABAJO_NODO'", _tabla_trabajos),
+)
+
+
+# ==============================================================================
+# CONEXIÓN Y CURSOR (interfaz de pyodbc que usa la app)
+# ==============================================================================
+class Row(tuple):
+    """Fila con acceso por posición y por nombre de columna, como pyodbc.Row."""
+
+    def __new__(cls, valores, indices):
+        fila = super().__new__(cls, valores)
+        fila._indices = indices
+        return fila
+
+    def __getattr__(self, nombre):
+        try:
+            return self[self._indices[nombre]]
+        except KeyError:
+            raise AttributeError(nombre)
+
+
+class Cursor:
+    def __init__(self, conexion):
+        self._conexion = conexion
+        self._filas = []
+        self.description = None
+        self.rowcount = -1
+        self.fast_executemany = False
+
+    def execute(self, sql, *params):
+        if len(params) == 1 and isinstance(params[0], (list, tuple)):
+            params = params[0]
+        _viaje(self._conexion.base)
+        conn = self._conexion.sqlite()
+        try:
+            for marca, emular in _EMULADOS:
+                if marca in sql:
+                    columnas, filas = emular(conn, params)
+                    self._cargar(columnas, filas)
+                    return self
+            sql, params = _traducir(sql, params)
+            cursor = conn.execute(sql, params)
+            columnas = [d[0] for d in cursor.description] if cursor.description else None
+            self._cargar(columnas, cursor.fetchall())
+            self.rowcount = cursor.rowcount
+        except sqlite3.IntegrityError as e:
+            raise IntegrityError('23000', str(e))
+        except sqlite3.OperationalError as e:
+            if 'locked' in str(e) or 'busy' in str(e):
+                raise OperationalError('HYT00', str(e))
+            raise ProgrammingError('42000', str(e))
+        return self
+
+    def executemany(self, sql, filas):
+        _viaje(self._conexion.base)
+        sql, _ = _traducir(sql, ())
+        self._conexion.sqlite().executemany(sql, filas)
+        self._cargar(None, [])
+        return self
+
+    def _cargar(self, columnas, filas):
+        if columnas is None:
+            self.description, self._filas = None, []
+            return
+        indices = {c: i for i, c in enumerate(columnas)}
+        self.description = [(c, _TIPOS.get(c, str), None, None, None, None, True) for c in columnas]
+        self._filas = [Row(f, indices) for f in filas]
+        self._filas.reverse()   # pop() desde el final: fetchone/fetchmany en O(1)
+
+    def fetchone(self):
+        return self._filas.pop() if self._filas else None
+
+    def fetchmany(self, n=1):
+        return [self._filas.pop() for _ in range(min(n, len(self._filas)))]
+
+    def fetchall(self):
+        filas, self._filas = self._filas[::-1], []
+        return filas
+
+    def nextset(self):
+        return False
+
+    def close(self):
+        self._filas = []
+
+
+class Connection:
+    def __init__(self, base, ruta, timeout=0):
+        self.base = base
+        self.ruta = ruta
+        self.timeout = timeout
+        self.autocommit = False
+        self._conn = None
+
+    def sqlite(self):
+        if self._conn is None:
+            raise InterfaceError('08003', 'Conexión cerrada')
+        return self._conn
+
+    def cursor(self):
+        self.sqlite()
+        return Cursor(self)
+
+    def commit(self):
+        _viaje(self.base, 'commits')
+        self.sqlite().commit()
+
+    def rollback(self):
+        self.sqlite().rollback()
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+def connect(cadena, timeout=0, **kwargs):
+    """Abre una conexión al nodo cuyo DATABASE= aparece en la cadena ODBC."""
+    m = re.search(r'DATABASE=([^;]+)', cadena)
+    base = m.group(1) if m else None
+    ruta = _config['bases'].get(base)
+    if ruta is None:
+        raise OperationalError('08001', f"Nodo simulado desconocido: {base}")
+    _contar(base, 'conexiones')
+    if _config['latencia_conexion']:
+        time.sleep(_config['latencia_conexion'])
+    conexion = Connection(base, ruta, timeout)
+    conexion._conn = sqlite3.connect(ruta, timeout=30, check_same_thread=False,
+                                     detect_types=sqlite3.PARSE_DECLTYPES)
+    conexion._conn.execute("PRAGMA synchronous=NORMAL")
+    return conexion
\ No newline at end of file
@@ -0,0 +1,276 @@
+# backend/order_journal.py
+import json
+import logging
+import os
+import random
+import secrets
+import sqlite3
+import threading
+import time
+
+from .cache import catalog_cache, invalidate_identidad, invalidate_perfil
+from .checkout import SQL_TABLA_PEDIDOS, StockInsuficienteError, aplicar_pedido
+from .config import (CHECKOUT_DIARIO_DB, CHECKOUT_LOTE, CHECKOUT_REINTENTO, CHECKOUT_REINTENTO_MAX,
+                     CHECKOUT_RETENCION_DIAS, CHECKOUT_TURNO, NODOS)
+from .database import db_connection
+from .jobs import es_transitorio
+from .stock_feed import stock_feed
+
+log = logging.getLogger(__name__)
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS pedidos (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,   -- orden de llegada: se aplican en este orden por nodo
+    clave TEXT NOT NULL UNIQUE,              -- idempotencia (también en PEDIDO_WEB del nodo)
+    sucursal TEXT NOT NULL,
+    id_cliente TEXT NOT NULL,
+    cliente TEXT,                            -- JSON del registro rápido, o NULL si ya tiene cuenta
+    items TEXT NOT NULL,                     -- JSON {Id_producto: cantidad}
+    estado TEXT NOT NULL,                    -- pendiente / aplicado / conflicto / error
+    intentos INTEGER NOT NULL DEFAULT 0,
+    proximo REAL NOT NULL DEFAULT 0,
+    id_factura INTEGER,
+    detalle TEXT,
+    creado REAL NOT NULL,
+    terminado REAL
+);
+CREATE INDEX IF NOT EXISTS ix_pedidos_cola ON pedidos (sucursal, estado, seq);
+CREATE TABLE IF NOT EXISTS turnos (sucursal TEXT PRIMARY KEY, dueno TEXT NOT NULL, vence REAL NOT NULL);
+"""
+
+_COLUMNAS = ('seq', 'clave', 'sucursal', 'id_cliente', 'estado', 'intentos', 'id_factura', 'detalle', 'creado',
+             'terminado')
+_CLAVE_VALIDA = frozenset('0123456789abcdef')
+
+
+def nueva_clave():
+    return secrets.token_hex(16)
+
+
+def clave_valida(clave):
+    return isinstance(clave, str) and len(clave) == 32 and set(clave) <= _CLAVE_VALIDA
+
+
+class DiarioVentas:
+    """Diario local (SQLite, solo se agrega) de los pedidos del checkout.
+
+    - registrar() anota el pedido ya validado con fsync (synchronous=FULL): un pedido
+      aceptado no se pierde aunque se caiga el proceso. Tarda milisegundos y no toca el nodo.
+    - Un hilo por nodo aplica los pendientes en orden de llegada, en lotes de `lote` por
+      conexión y un commit por pedido. La clave de cada pedido se guarda en PEDIDO_WEB en
+      la misma transacción que la factura, así que reaplicar uno ya vendido no lo duplica.
+    - Sin stock suficiente el pedido queda en 'conflicto' (con los productos faltantes);
+      otros errores de datos, en 'error'. Ninguno de los dos detiene la cola.
+    - Si el nodo no responde se reintenta el mismo pedido con espera exponencial: los
+      siguientes esperan detrás para respetar el orden.
+    - Con varios procesos, un turno renovable en SQLite deja a uno solo aplicando cada nodo.
+    """
+
+    def __init__(self, ruta=CHECKOUT_DIARIO_DB, lote=CHECKOUT_LOTE, reintento=CHECKOUT_REINTENTO,
+                 reintento_max=CHECKOUT_REINTENTO_MAX, turno=CHECKOUT_TURNO, retencion_dias=CHECKOUT_RETENCION_DIAS):
+        self.ruta = ruta
+        self.lote = lote
+        self.reintento = reintento
+        self.reintento_max = reintento_max
+        self.turno = turno
+        self.retencion = retencion_dias * 86400
+        self.dueno = f"{os.getpid()}-{secrets.token_hex(4)}"
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._despertar = {nodo: threading.Event() for nodo in NODOS}
+        self._hilos = []
+        self._tabla_lista = set()     # nodos donde ya se verificó PEDIDO_WEB
+        self._proxima_purga = 0.0
+        self._counters = {'registrados': 0, 'duplicados': 0, 'aplicados': 0, 'ya_aplicados': 0,
+                          'conflictos': 0, 'errores': 0, 'reintentos': 0, 'lotes': 0}
+
+    # --- API pública ---
+    def asegurar_iniciado(self):
+        if self._hilos:
+            return
+        with self._lock:
+            if self._hilos:
+                return
+            self._conexion().executescript(_ESQUEMA)
+            for nodo in NODOS:
+                hilo = threading.Thread(target=self._bucle, args=(nodo,), name=f'diario-{nodo}', daemon=True)
+                hilo.start()
+                self._hilos.append(hilo)
+
+    def registrar(self, clave, sucursal, id_cliente, cliente, items):
+        """Anota el pedido y devuelve su estado. Repetir la misma clave no crea otro pedido."""
+        if sucursal not in NODOS:
+            # Sin hilo que lo aplique quedaría pendiente para siempre
+            raise ValueError(f"Sucursal desconocida: {sucursal}")
+        self.asegurar_iniciado()
+        conn = self._conexion()
+        with conn:
+            nuevo = conn.execute("""
+                INSERT OR IGNORE INTO pedidos (clave, sucursal, id_cliente, cliente, items, estado, creado)
+                VALUES (?, ?, ?, ?, ?, 'pendiente', ?)
+            """, (clave, sucursal, str(id_cliente), json.dumps(cliente) if cliente else None,
+                  json.dumps(items), time.time())).rowcount
+        self._contar('registrados' if nuevo else 'duplicados')
+        self._despertar[sucursal].set()
+        return self.estado(clave)
+
+    def estado(self, clave):
+        fila = self._conexion().execute(f"SELECT {', '.join(_COLUMNAS)} FROM pedidos WHERE clave = ?",
+                                        (clave,)).fetchone()
+        return dict(zip(_COLUMNAS, fila)) if fila else None
+
+    def esperar(self, clave, timeout):
+        """Estado del pedido en cuanto deja de estar pendiente, o al pasar `timeout` segundos."""
+        limite = time.monotonic() + timeout
+        while True:
+            pedido = self.estado(clave)
+            if pedido is None or pedido['estado'] != 'pendiente' or time.monotonic() >= limite:
+                return pedido
+            time.sleep(0.02)
+
+    def stats(self):
+        self.asegurar_iniciado()
+        conn = self._conexion()
+        pendientes = dict(conn.execute("SELECT sucursal, COUNT(*) FROM pedidos WHERE estado = 'pendiente' "
+                                       "GROUP BY sucursal").fetchall())
+        rechazados = [dict(zip(_COLUMNAS, f)) for f in conn.execute(
+            f"SELECT {', '.join(_COLUMNAS)} FROM pedidos WHERE estado IN ('conflicto', 'error') "
+            f"ORDER BY seq DESC LIMIT 20")]
+        with self._lock:
+            return dict(self._counters, pendientes=pendientes, rechazados_recientes=rechazados)
+
+    # --- Aplicador ---
+    def _bucle(self, sucursal):
+        despertar = self._despertar[sucursal]
+        while True:
+            espera = 1.0
+            try:
+                # Sin mirar el circuito: con el nodo caído acquire() falla al instante (y cuenta
+                # como reintento), y pasada la espera del breaker este intento es la prueba
+                if self._tomar_turno(sucursal):
+                    espera = self._aplicar_lote(sucursal)
+                self._purgar()
+            except Exception as e:
+                log.warning("Diario de pedidos (%s): %s", sucursal, e)
+            despertar.wait(espera)
+            despertar.clear()
+
+    def _tomar_turno(self, sucursal):
+        """True si este proceso es (o pasa a ser) el que aplica los pedidos de `sucursal`."""
+        ahora = time.time()
+        conn = self._conexion()
+        with conn:
+            return conn.execute("""
+                INSERT INTO turnos (sucursal, dueno, vence) VALUES (?, ?, ?)
+                ON CONFLICT (sucursal) DO UPDATE SET dueno = excluded.dueno, vence = excluded.vence
+                WHERE turnos.dueno = excluded.dueno OR turnos.vence < ?
+            """, (sucursal, self.dueno, ahora + self.turno, ahora)).rowcount == 1
+
+    def _aplicar_lote(self, sucursal):
+        """Aplica hasta `lote` pedidos pendientes; devuelve cuánto esperar antes de la próxima vuelta."""
+        conn = self._conexion()
+        filas = conn.execute("""
+            SELECT seq, clave, id_cliente, cliente, items, intentos, proximo FROM pedidos
+            WHERE sucursal = ? AND estado = 'pendiente' ORDER BY seq LIMIT ?
+        """, (sucursal, self.lote)).fetchall()
+        if not filas:
+            return 1.0
+        if filas[0][6] > time.time():
+            return filas[0][6] - time.time()   # El primero espera su reintento y el resto detrás
+
+        pedidos = [{'seq': f[0], 'clave': f[1], 'id_cliente': f[2], 'cliente': json.loads(f[3]) if f[3] else None,
+                    'items': {int(k): v for k, v in json.loads(f[4]).items()}, 'intentos': f[5]} for f in filas]
+        id_sucursal = NODOS[sucursal]['id_sucursal']
+        actual = pedidos[0]
+        self._contar('lotes')
+        try:
+            with db_connection(sucursal) as nodo:
+                cursor = nodo.cursor()
+                if sucursal not in self._tabla_lista:
+                    cursor.execute(SQL_TABLA_PEDIDOS)
+                    nodo.commit()
+                    self._tabla_lista.add(sucursal)
+                # Pedidos del lote que ya se vendieron (p. ej. el proceso murió justo tras el commit)
+                cursor.execute(f"SELECT clave, Id_factura FROM PEDIDO_WEB WHERE clave IN "
+                               f"({', '.join('?' * len(pedidos))})", [p['clave'] for p in pedidos])
+                ya_aplicados = {clave.strip(): id_factura for clave, id_factura in cursor.fetchall()}
+                nodo.commit()
+
+                for actual in pedidos:
+                    if actual['clave'] in ya_aplicados:
+                        self._terminar(actual, 'aplicado', id_factura=ya_aplicados[actual['clave']])
+                        self._contar('ya_aplicados')
+                        continue
+                    try:
+                        id_factura, stock = aplicar_pedido(nodo, sucursal, id_sucursal, actual)
+                    except StockInsuficienteError as e:
+                        self._terminar(actual, 'conflicto', detalle=str(e))
+                        self._contar('conflictos')
+                        continue
+                    except Exception as e:
+                        if es_transitorio(e):
+                            raise
+                        self._terminar(actual, 'error', detalle=str(e))
+                        self._contar('errores')
+                        log.warning("Pedido %s rechazado por %s: %s", actual['clave'], sucursal, e)
+                        continue
+                    self._terminar(actual, 'aplicado', id_factura=id_factura)
+                    self._contar('aplicados')
+                    self._publicar(sucursal, actual, stock)
+                    self._tomar_turno(sucursal)
+        except Exception as e:
+            if not es_transitorio(e):
+                raise
+            espera = min(self.reintento_max, self.reintento * 2 ** actual['intentos']) * random.uniform(0.5, 1.0)
+            with conn:
+                conn.execute("UPDATE pedidos SET intentos = intentos + 1, proximo = ?, detalle = ? WHERE seq = ?",
+                             (time.time() + espera, str(e), actual['seq']))
+            self._contar('reintentos')
+            log.info("Pedido %s sin aplicar en %s (%s); reintento en %.1f s", actual['clave'], sucursal, e, espera)
+            return espera
+        return 0.0 if len(pedidos) == self.lote else 1.0
+
+    def _terminar(self, pedido, estado, id_factura=None, detalle=None):
+        conn = self._conexion()
+        with conn:
+            conn.execute("UPDATE pedidos SET estado = ?, id_factura = ?, detalle = ?, terminado = ? WHERE seq = ?",
+                         (estado, id_factura, detalle, time.time(), pedido['seq']))
+
+    @staticmethod
+    def _publicar(sucursal, pedido, stock):
+        """Lo que antes hacía /checkout tras la venta: cachés y feed de stock."""
+        catalog_cache.invalidate(sucursal)
+        stock_feed.publicar(sucursal, stock)
+        invalidate_perfil(sucursal, pedido['id_cliente'])
+        if pedido['cliente']:
+            # Registro rápido: el correo puede estar en caché como "no registrado"
+            invalidate_identidad('CLIENTE', pedido['cliente'].get('correo'))
+
+    def _purgar(self):
+        ahora = time.time()
+        with self._lock:
+            if ahora < self._proxima_purga:
+                return
+            self._proxima_purga = ahora + 3600
+        conn = self._conexion()
+        with conn:
+            conn.execute("DELETE FROM pedidos WHERE estado != 'pendiente' AND terminado < ?",
+                         (ahora - self.retencion,))
+
+    def _contar(self, clave):
+        with self._lock:
+            self._counters[clave] += 1
+
+    def _conexion(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.ruta)), exist_ok=True)
+            conn = sqlite3.connect(self.ruta, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # FULL (no NORMAL como los otros almacenes): un pedido confirmado al cliente no puede perderse
+            conn.execute("PRAGMA synchronous=FULL")
+            self._local.conn = conn
+        return conn
+
+
+diario_ventas = DiarioVentas()
\ No newline at end of file
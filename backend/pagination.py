@@ -0,0 +1,335 @@
+# backend/pagination.py
+import heapq
+import itertools
+import re
+import threading
+from decimal import Decimal
+
+from .cache import LRUCache
+from .config import (DASHBOARD_PAGE_SIZE, DASHBOARD_MAX_PAGE_SIZE, DASHBOARD_COUNT_CACHE_SIZE, DASHBOARD_COUNT_TTL,
+                     DASHBOARD_FANOUT_MAX_FILAS, FANOUT_TIMEOUT)
+from .fanout import fan_out
+
+_IDENT = re.compile(r'^\w+$')
+
+
+def quote_ident(nombre):
+    """Nombre de columna/tabla entre corchetes (T-SQL)."""
+    return '[' + str(nombre).replace(']', ']]') + ']'
+
+
+def safe_table_name(tabla):
+    """Valida un nombre de tabla recibido por querystring; evita inyección SQL."""
+    if not tabla or not _IDENT.match(tabla):
+        raise ValueError(f"Tabla inválida: {tabla!r}")
+    return tabla
+
+
+class TablaSpec:
+    """Consulta base de una pestaña del dashboard.
+
+    sql: SELECT sin ORDER BY (se usa como tabla derivada).
+    key: columna única y no nula; si se ordena por ella se pagina por búsqueda
+         (keyset). Sin key se pagina con OFFSET/FETCH.
+    tabla_base: tabla física cuyo conteo de filas (sys.partitions) sirve como
+         total aproximado cuando no hay filtro.
+    """
+
+    def __init__(self, sql, params=(), key=None, default_sort=None, default_dir='ASC', tabla_base=None):
+        self.sql = sql
+        self.params = tuple(params)
+        self.key = key
+        self.default_sort = default_sort or key
+        self.default_dir = default_dir
+        self.tabla_base = tabla_base
+
+
+# ==============================================================================
+# CACHÉS AUXILIARES (columnas y conteos)
+# ==============================================================================
+_lock = threading.Lock()
+_columnas = {}   # cache_key -> [(nombre, tipo_python)]
+_conteos = LRUCache(DASHBOARD_COUNT_CACHE_SIZE, DASHBOARD_COUNT_TTL)   # (cache_key, filtro) -> total
+
+
+def _describir(cursor, spec, cache_key):
+    """Columnas de la consulta base (SELECT TOP 0, una sola vez por tabla y sucursal)."""
+    cols = _columnas.get(cache_key)
+    if cols is None:
+        cursor.execute(f"SELECT TOP 0 * FROM ({spec.sql}) AS T", spec.params)
+        cols = [(d[0], d[1]) for d in cursor.description]
+        cursor.fetchall()
+        with _lock:
+            _columnas[cache_key] = cols
+    return cols
+
+
+def _contar(cursor, spec, where_sql, where_params, cache_key, filtro):
+    """Total de filas: metadatos si no hay filtro, COUNT(*) cacheado unos segundos si lo hay."""
+    clave = (cache_key, filtro)
+    guardado = _conteos.get(clave)
+    if guardado is not None:
+        return guardado
+
+    if spec.tabla_base and not where_sql:
+        cursor.execute("""
+            SELECT ISNULL(SUM(p.rows), 0) FROM sys.partitions p
+            WHERE p.object_id = OBJECT_ID(?) AND p.index_id IN (0, 1)
+        """, (spec.tabla_base,))
+    else:
+        cursor.execute(f"SELECT COUNT(*) FROM ({spec.sql}) AS T{where_sql}",
+                       spec.params + tuple(where_params))
+    total = int(cursor.fetchone()[0])
+
+    _conteos.set(clave, total)
+    return total
+
+
+def _convertir(valor, tipo):
+    if tipo in (int, float, Decimal):
+        return tipo(valor)
+    return valor
+
+
+def _entero(valor, defecto, minimo, maximo):
+    try:
+        return max(minimo, min(maximo, int(valor)))
+    except (TypeError, ValueError):
+        return defecto
+
+
+# ==============================================================================
+# PAGINADOR
+# ==============================================================================
+def _leer_args(cols, spec, args):
+    """Orden, dirección, filtro y tamaño de página pedidos en la URL (ya validados)."""
+    tipos = dict(cols)
+    nombres = [c for c, _ in cols]
+
+    por_pagina = _entero(args.get('por_pagina'), DASHBOARD_PAGE_SIZE, 1, DASHBOARD_MAX_PAGE_SIZE)
+    orden = args.get('orden') if args.get('orden') in tipos else (spec.default_sort or nombres[0])
+    direccion = args.get('dir', spec.default_dir if orden == spec.default_sort else 'ASC').upper()
+    direccion = 'DESC' if direccion == 'DESC' else 'ASC'
+
+    # --- Filtro (columna elegida, texto libre) ---
+    where, where_params = [], []
+    col, q = args.get('col'), (args.get('q') or '').strip()
+    if q and col in tipos:
+        if tipos[col] in (int, float, Decimal):
+            try:
+                where_params.append(_convertir(q, tipos[col]))
+                where.append(f"{quote_ident(col)} = ?")
+            except (ValueError, ArithmeticError):
+                where.append("1 = 0")   # Texto en columna numérica: no hay coincidencias
+        else:
+            where.append(f"CAST({quote_ident(col)} AS NVARCHAR(4000)) LIKE ?")
+            where_params.append(f"%{q}%")
+    else:
+        col, q = None, ''
+
+    return {
+        'tipos': tipos, 'nombres': nombres, 'por_pagina': por_pagina,
+        'orden': orden, 'dir': direccion, 'col': col, 'q': q,
+        'where': where, 'where_params': where_params,
+        'desempate': spec.key or nombres[0],
+        'pagina': _entero(args.get('pagina'), 1, 1, 10 ** 9),
+    }
+
+
+def _orden_sql(p, dir_sql):
+    orden_sql = f"{quote_ident(p['orden'])} {dir_sql}"
+    if p['desempate'] != p['orden']:
+        orden_sql += f", {quote_ident(p['desempate'])} {dir_sql}"
+    return orden_sql
+
+
+def _info(p, total, anterior, siguiente, base, keyset=False):
+    return {
+        'total': total,
+        'por_pagina': p['por_pagina'],
+        'orden': p['orden'],
+        'dir': p['dir'],
+        'col': p['col'],
+        'q': p['q'],
+        'pagina': None if keyset else p['pagina'],
+        'anterior': anterior,
+        'siguiente': siguiente,
+        'base': base,
+    }
+
+
+def _base(p):
+    base = {'orden': p['orden'], 'dir': p['dir'], 'por_pagina': p['por_pagina']}
+    if p['col']:
+        base.update(col=p['col'], q=p['q'])
+    return base
+
+
+def paginar(cursor, spec, args, cache_key):
+    """Ejecuta una página de `spec` según los parámetros de la URL.
+
+    Parámetros reconocidos: orden, dir, col, q, por_pagina, pagina (OFFSET)
+    y desde / hasta (keyset). Devuelve (columnas, filas, info_de_pagina).
+    """
+    cols = _describir(cursor, spec, cache_key)
+    p = _leer_args(cols, spec, args)
+    tipos, nombres, por_pagina, direccion = p['tipos'], p['nombres'], p['por_pagina'], p['dir']
+    where, where_params = p['where'], p['where_params']
+    filtro_sql = ' WHERE ' + ' AND '.join(where) if where else ''
+
+    total = _contar(cursor, spec, filtro_sql, where_params, cache_key, (p['col'], p['q']))
+
+    # --- Página ---
+    keyset = spec.key is not None and p['orden'] == spec.key
+    desde, hasta = args.get('desde'), args.get('hasta')
+    pagina = p['pagina']
+    invertido = False
+    page_where, page_params = list(where), list(where_params)
+
+    if keyset and (desde or hasta):
+        asc = direccion == 'ASC'
+        if hasta:
+            # Página anterior: recorremos hacia atrás y luego volteamos el resultado
+            invertido = True
+            op = '<' if asc else '>'
+            ref = hasta
+        else:
+            op = '>' if asc else '<'
+            ref = desde
+        try:
+            page_params.append(_convertir(ref, tipos[spec.key]))
+            page_where.append(f"{quote_ident(spec.key)} {op} ?")
+        except (ValueError, ArithmeticError):
+            invertido, desde, hasta = False, None, None
+
+    dir_sql = direccion
+    if invertido:
+        dir_sql = 'ASC' if direccion == 'DESC' else 'DESC'
+
+    offset = 0 if keyset else (pagina - 1) * por_pagina
+    sql_where = ' WHERE ' + ' AND '.join(page_where) if page_where else ''
+    # Pedimos una fila extra para saber si hay más páginas sin contar
+    cursor.execute(
+        f"SELECT * FROM ({spec.sql}) AS T{sql_where} ORDER BY {_orden_sql(p, dir_sql)} "
+        f"OFFSET ? ROWS FETCH NEXT ? ROWS ONLY",
+        spec.params + tuple(page_params) + (offset, por_pagina + 1))
+    filas = cursor.fetchall()
+    hay_mas = len(filas) > por_pagina
+    filas = filas[:por_pagina]
+    if invertido:
+        filas.reverse()
+
+    # --- Enlaces de navegación (argumentos para url_for) ---
+    base = _base(p)
+    anterior = siguiente = None
+    if keyset:
+        idx = nombres.index(spec.key)
+        en_medio = bool(desde or hasta)
+        tiene_anterior = hay_mas if invertido else en_medio
+        tiene_siguiente = True if invertido else hay_mas
+        if filas and tiene_anterior:
+            anterior = dict(base, hasta=filas[0][idx])
+        if filas and tiene_siguiente:
+            siguiente = dict(base, desde=filas[-1][idx])
+    else:
+        if pagina > 1:
+            anterior = dict(base, pagina=pagina - 1)
+        if hay_mas:
+            siguiente = dict(base, pagina=pagina + 1)
+
+    return nombres, filas, _info(p, total, anterior, siguiente, base, keyset)
+
+
+def _clave_orden(valor):
+    # Como SQL Server: NULL antes que cualquier valor; texto sin distinguir mayúsculas
+    if isinstance(valor, str):
+        valor = valor.casefold()
+    return (valor is not None, valor)
+
+
+def paginar_nodos(specs, args, cache_key, timeout=FANOUT_TIMEOUT, max_filas=DASHBOARD_FANOUT_MAX_FILAS):
+    """Como paginar(), pero consulta todos los nodos en paralelo y mezcla las filas.
+
+    specs: {nodo: TablaSpec}, con las mismas columnas en cada nodo. Siempre pagina con
+    OFFSET: cada nodo devuelve sus primeras offset + por_pagina + 1 filas ya ordenadas
+    y la página se corta después de mezclarlas. Como eso crece con la página, no se pasa
+    de la fila `max_filas` (info['limitada'] avisa que hay más). Si un nodo falla, la
+    página sale con los demás e info['nodos_caidos'] = {nodo: error}.
+    """
+    def leer(cols, spec):
+        p = _leer_args(cols, spec, args)
+        p['pagina'] = min(p['pagina'], max(1, max_filas // p['por_pagina']))
+        return p
+
+    def trabajo(nodo, conn):
+        cursor = conn.cursor()
+        spec = specs[nodo]
+        cols = _describir(cursor, spec, (cache_key, nodo))
+        p = leer(cols, spec)
+        where = ' WHERE ' + ' AND '.join(p['where']) if p['where'] else ''
+        total = _contar(cursor, spec, where, p['where_params'], (cache_key, nodo), (p['col'], p['q']))
+        cursor.execute(
+            f"SELECT * FROM ({spec.sql}) AS T{where} ORDER BY {_orden_sql(p, p['dir'])} "
+            f"OFFSET 0 ROWS FETCH NEXT ? ROWS ONLY",
+            spec.params + tuple(p['where_params']) + (p['pagina'] * p['por_pagina'] + 1,))
+        return cols, p, total, cursor.fetchall()
+
+    resultados = fan_out(trabajo, list(specs), timeout)
+    respondieron = [r.valor for r in resultados.values() if r.ok]
+    caidos = {r.nodo: r.error for r in resultados.values() if not r.ok}
+    if not respondieron:
+        raise RuntimeError('; '.join(caidos.values()))
+
+    p = respondieron[0][1]
+    nombres = p['nombres']
+    i_orden, i_desempate = nombres.index(p['orden']), nombres.index(p['desempate'])
+    mezcla = heapq.merge(
+        *(filas for _, _, _, filas in respondieron),
+        key=lambda f: (_clave_orden(f[i_orden]), _clave_orden(f[i_desempate])),
+        reverse=p['dir'] == 'DESC')
+
+    por_pagina, pagina = p['por_pagina'], p['pagina']
+    offset = (pagina - 1) * por_pagina
+    filas = list(itertools.islice(mezcla, offset, offset + por_pagina + 1))
+    hay_mas = len(filas) > por_pagina
+    limitada = hay_mas and (pagina + 1) * por_pagina > max(max_filas, por_pagina)
+
+    base = _base(p)
+    anterior = dict(base, pagina=pagina - 1) if pagina > 1 else None
+    siguiente = dict(base, pagina=pagina + 1) if hay_mas and not limitada else None
+    info = _info(p, sum(total for _, _, total, _ in respondieron), anterior, siguiente, base)
+    info['nodos_caidos'] = caidos
+    info['limitada'] = limitada
+    return nombres, filas[:por_pagina], info
+
+def paginar_local(conn, spec, cols, args):
+    """paginar() sobre una copia local en SQLite (LIMIT/OFFSET; el conteo es barato).
+
+    cols: [(nombre, tipo_python)] de la consulta, conocidos de antemano.
+    """
+    p = _leer_args(cols, spec, args)
+    where = ' WHERE ' + ' AND '.join(p['where']) if p['where'] else ''
+    params = spec.params + tuple(p['where_params'])
+
+    total = conn.execute(f"SELECT COUNT(*) FROM ({spec.sql}) AS T{where}", params).fetchone()[0]
+    por_pagina, pagina = p['por_pagina'], p['pagina']
+    filas = conn.execute(
+        f"SELECT * FROM ({spec.sql}) AS T{where} ORDER BY {_orden_sql(p, p['dir'])} LIMIT ? OFFSET ?",
+        params + (por_pagina + 1, (pagina - 1) * por_pagina)).fetchall()
+    hay_mas = len(filas) > por_pagina
+
+    base = _base(p)
+    anterior = dict(base, pagina=pagina - 1) if pagina > 1 else None
+    siguiente = dict(base, pagina=pagina + 1) if hay_mas else None
+    return p['nombres'], filas[:por_pagina], _info(p, total, anterior, siguiente, base)
+
+def consulta_exportar(cursor, spec, args, cache_key):
+    """SELECT completo de `spec` con el filtro y orden de la URL, sin paginar.
+
+    Devuelve (columnas, sql, params) para recorrerlo con fetchmany.
+    """
+    cols = _describir(cursor, spec, cache_key)
+    p = _leer_args(cols, spec, args)
+    where = ' WHERE ' + ' AND '.join(p['where']) if p['where'] else ''
+    sql = f"SELECT * FROM ({spec.sql}) AS T{where} ORDER BY {_orden_sql(p, p['dir'])}"
+    return p['nombres'], sql, spec.params + tuple(p['where_params'])
\ No newline at end of file
@@ -0,0 +1,263 @@
+# backend/product_import.py
+import csv
+import io
+import json
+import time
+from decimal import Decimal, InvalidOperation
+
+from .config import IMPORT_BATCH_SIZE, IMPORT_MAX_ERRORES
+
+ID_GUAYAQUIL = 2
+COLUMNAS = ('id_producto', 'nombre', 'marca', 'precio', 'stock_gye', 'stock_uio')
+OBLIGATORIAS = ('id_producto', 'nombre', 'precio')
+
+
+class ArchivoInvalidoError(ValueError):
+    pass
+
+
+class ResultadoImportacion:
+    """Resumen de una importación: conteos, errores por fila y tiempos."""
+
+    def __init__(self):
+        self.leidas = 0
+        self.validas = 0
+        self.insertadas = 0
+        self.envios_quito = 0
+        self.total_errores = 0
+        self.errores = []      # [(línea, Id_producto o None, mensaje)] hasta IMPORT_MAX_ERRORES
+        self.tiempos = {}      # fase -> segundos
+        self.round_trips = 0
+
+    def error(self, linea, id_prod, mensaje):
+        self.total_errores += 1
+        if len(self.errores) < IMPORT_MAX_ERRORES:
+            self.errores.append((linea, id_prod, mensaje))
+
+    @property
+    def segundos(self):
+        return sum(self.tiempos.values())
+
+    @property
+    def filas_por_segundo(self):
+        return round(self.leidas / self.segundos, 1) if self.segundos else 0.0
+
+    def to_dict(self):
+        return {
+            'leidas': self.leidas, 'validas': self.validas, 'insertadas': self.insertadas,
+            'envios_quito': self.envios_quito, 'total_errores': self.total_errores,
+            'errores': [{'linea': l, 'id_producto': i, 'mensaje': m} for l, i, m in self.errores],
+            'tiempos': {k: round(v, 3) for k, v in self.tiempos.items()},
+            'segundos': round(self.segundos, 3), 'filas_por_segundo': self.filas_por_segundo,
+            'round_trips': self.round_trips,
+        }
+
+
+# ==============================================================================
+# LECTURA Y VALIDACIÓN (en streaming)
+# ==============================================================================
+def leer_filas(archivo, nombre_archivo):
+    """Produce (línea, dict) desde un CSV, JSON Lines o arreglo JSON subido.
+
+    CSV y JSON Lines se leen de a una línea; un arreglo JSON se carga completo.
+    """
+    texto = io.TextIOWrapper(archivo, encoding='utf-8-sig', newline='')
+    extension = nombre_archivo.rsplit('.', 1)[-1].lower() if '.' in nombre_archivo else ''
+
+    if extension == 'csv':
+        lector = csv.DictReader(texto)
+        if not lector.fieldnames:
+            raise ArchivoInvalidoError("El CSV está vacío.")
+        encabezados = [(c or '').strip().lower() for c in lector.fieldnames]
+        faltan = [c for c in OBLIGATORIAS if c not in encabezados]
+        if faltan:
+            raise ArchivoInvalidoError(f"Faltan columnas en el CSV: {', '.join(faltan)}.")
+        lector.fieldnames = encabezados
+        for fila in lector:
+            yield lector.line_num, fila
+    elif extension == 'jsonl':
+        for linea, contenido in enumerate(texto, start=1):
+            if contenido.strip():
+                try:
+                    yield linea, json.loads(contenido)
+                except ValueError:
+                    yield linea, None
+    elif extension == 'json':
+        try:
+            datos = json.load(texto)
+        except ValueError as e:
+            raise ArchivoInvalidoError(f"JSON inválido: {e}")
+        if not isinstance(datos, list):
+            raise ArchivoInvalidoError("El JSON debe ser una lista de productos.")
+        for i, fila in enumerate(datos, start=1):
+            yield i, fila
+    else:
+        raise ArchivoInvalidoError("Formato no soportado: usa .csv, .json o .jsonl.")
+
+
+def _entero(fila, campo, defecto=None):
+    valor = fila.get(campo)
+    if valor in (None, ''):
+        if defecto is None:
+            raise ValueError(f"'{campo}' es obligatorio")
+        return defecto
+    try:
+        numero = int(str(valor).strip())
+    except ValueError:
+        raise ValueError(f"'{campo}' debe ser un número entero")
+    if numero < 0:
+        raise ValueError(f"'{campo}' no puede ser negativo")
+    return numero
+
+
+def validar(fila):
+    """Fila lista para la tabla temporal (sin la línea), o ValueError con el motivo."""
+    if not isinstance(fila, dict):
+        raise ValueError("fila con formato inválido")
+    fila = {str(k).strip().lower(): v for k, v in fila.items() if k is not None}
+
+    id_prod = _entero(fila, 'id_producto')
+    if id_prod == 0:
+        raise ValueError("'id_producto' debe ser mayor a cero")
+    nombre = str(fila.get('nombre') or '').strip()
+    if not nombre:
+        raise ValueError("'nombre' es obligatorio")
+    marca = str(fila.get('marca') or '').strip() or None
+    try:
+        precio = Decimal(str(fila.get('precio')).strip())
+    except (InvalidOperation, TypeError):
+        raise ValueError("'precio' debe ser numérico")
+    if not precio.is_finite() or precio < 0:
+        raise ValueError("'precio' debe ser mayor o igual a cero")
+
+    return (id_prod, nombre, marca, precio.quantize(Decimal('0.01')),
+            _entero(fila, 'stock_gye', 0), _entero(fila, 'stock_uio', 0))
+
+
+# ==============================================================================
+# CARGA EN SQL SERVER (una transacción)
+# ==============================================================================
+# La conexión vuelve al pool: si una importación anterior quedó a medias la tabla sigue ahí
+_SQL_TEMPORAL = """
+IF OBJECT_ID('tempdb..#import') IS NOT NULL DROP TABLE #import;
+CREATE TABLE #import (
+    linea INT NOT NULL,
+    Id_producto INT NOT NULL PRIMARY KEY,
+    nombre NVARCHAR(255) NOT NULL,
+    marca NVARCHAR(255) NULL,
+    precio DECIMAL(18, 2) NOT NULL,
+    stock_gye INT NOT NULL,
+    stock_uio INT NOT NULL,
+    nuevo BIT NOT NULL DEFAULT 1
+)
+"""
+
+_SQL_INSERT_TEMPORAL = """
+INSERT INTO #import (linea, Id_producto, nombre, marca, precio, stock_gye, stock_uio)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+# Todo el alta en un batch: productos nuevos, stock en Matriz y las transferencias a
+# Quito. sp_Enviar_A_Quito se sigue usando (mantiene su lógica de logística), pero en
+# un bucle del lado del servidor: un viaje para N envíos en vez de N viajes.
+_SQL_APLICAR = """
+SET NOCOUNT ON;
+SET XACT_ABORT ON;
+
+UPDATE I SET nuevo = 0
+FROM #import I
+WHERE EXISTS (SELECT 1 FROM PRODUCTO P WHERE P.Id_producto = I.Id_producto);
+
+INSERT INTO PRODUCTO (Id_producto, nombre, marca, precio)
+SELECT Id_producto, nombre, marca, precio FROM #import WHERE nuevo = 1;
+
+INSERT INTO INVENTARIO (Id_sucursal, Id_producto, cantidad)
+SELECT ?, Id_producto, stock_gye + stock_uio FROM #import
+WHERE nuevo = 1 AND stock_gye + stock_uio > 0;
+
+DECLARE @id INT, @cant INT;
+DECLARE envios CURSOR LOCAL FAST_FORWARD FOR
+    SELECT Id_producto, stock_uio FROM #import WHERE nuevo = 1 AND stock_uio > 0 ORDER BY linea;
+OPEN envios;
+FETCH NEXT FROM envios INTO @id, @cant;
+WHILE @@FETCH_STATUS = 0
+BEGIN
+    EXEC sp_Enviar_A_Quito @IdProducto = @id, @Cantidad = @cant;
+    FETCH NEXT FROM envios INTO @id, @cant;
+END
+CLOSE envios;
+DEALLOCATE envios;
+"""
+
+_SQL_RESUMEN = """
+SELECT linea, Id_producto, nuevo, CASE WHEN stock_uio > 0 THEN 1 ELSE 0 END FROM #import
+"""
+
+
+def importar_productos(conn, filas, batch_size=IMPORT_BATCH_SIZE):
+    """Valida y carga `filas` (de leer_filas) en Guayaquil. El llamador hace commit.
+
+    Las filas inválidas o repetidas se reportan y se omiten; los Id_producto que ya
+    existen en PRODUCTO también (no se sobrescriben).
+    """
+    r = ResultadoImportacion()
+    cursor = conn.cursor()
+    cursor.fast_executemany = True
+    cursor.execute(_SQL_TEMPORAL)
+    r.round_trips += 1
+
+    inicio = time.perf_counter()
+    cargar_s = 0.0
+    vistos = set()
+    lote = []
+
+    def volcar():
+        nonlocal cargar_s
+        t = time.perf_counter()
+        cursor.executemany(_SQL_INSERT_TEMPORAL, lote)
+        cargar_s += time.perf_counter() - t
+        r.round_trips += 1
+        lote.clear()
+
+    # Validación y carga de la tabla temporal en la misma pasada, por lotes
+    for linea, fila in filas:
+        r.leidas += 1
+        try:
+            valores = validar(fila)
+        except ValueError as e:
+            id_crudo = fila.get('id_producto') if isinstance(fila, dict) else None
+            r.error(linea, id_crudo, str(e))
+            continue
+        if valores[0] in vistos:
+            r.error(linea, valores[0], "Id_producto repetido en el archivo")
+            continue
+        vistos.add(valores[0])
+        lote.append((linea,) + valores)
+        r.validas += 1
+        if len(lote) >= batch_size:
+            volcar()
+    if lote:
+        volcar()
+    r.tiempos['validar'] = time.perf_counter() - inicio - cargar_s
+    r.tiempos['cargar'] = cargar_s
+
+    if r.validas:
+        t = time.perf_counter()
+        cursor.execute(_SQL_APLICAR, (ID_GUAYAQUIL,))
+        # Consumimos todos los resultados: así termina el batch y salen sus errores
+        while cursor.nextset():
+            pass
+        cursor.execute(_SQL_RESUMEN)
+        for linea, id_prod, nuevo, envio in cursor.fetchall():
+            if nuevo:
+                r.insertadas += 1
+                r.envios_quito += envio
+            else:
+                r.error(linea, id_prod, "El producto ya existe; no se modificó")
+        r.round_trips += 2
+        r.tiempos['aplicar'] = time.perf_counter() - t
+
+    r.errores.sort(key=lambda e: e[0])
+    cursor.execute("DROP TABLE #import")
+    r.round_trips += 1
+    return r
\ No newline at end of file
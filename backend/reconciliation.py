@@ -0,0 +1,326 @@
+# backend/reconciliation.py
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+from .config import (RECONCILIACION_ATASCO_HORAS, RECONCILIACION_DB, RECONCILIACION_GRACIA_MIN,
+                     RECONCILIACION_INTERVALO, RECONCILIACION_LOTE, RECONCILIACION_TIMEOUT)
+from .fanout import fan_out
+
+log = logging.getLogger(__name__)
+
+MATRIZ, SUCURSAL = 'Guayaquil', 'Quito'
+
+# Las fechas se guardan como texto ISO (igual que en reports.py)
+sqlite3.register_adapter(datetime, lambda d: d.isoformat(' '))
+sqlite3.register_converter('TIMESTAMP', lambda b: datetime.fromisoformat(b.decode()))
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS marca (
+    id INTEGER PRIMARY KEY CHECK (id = 1), ultimo_envio INTEGER NOT NULL, ejecutado TIMESTAMP
+);
+-- Envíos ya vistos que aún no terminan (en camino o con incidencia): se revisan en cada pasada
+CREATE TABLE IF NOT EXISTS pendientes (Id_envio INTEGER PRIMARY KEY);
+CREATE TABLE IF NOT EXISTS incidencias (
+    Id_envio INTEGER NOT NULL, tipo TEXT NOT NULL, detalle TEXT, detectado TIMESTAMP,
+    PRIMARY KEY (Id_envio, tipo)
+);
+"""
+
+# Cada lado ordenado por Id_envio. {filtro}: keyset (Id_envio > ?) o lista de pendientes.
+_SQL_LADO = {
+    MATRIZ: """
+        SELECT TOP (?) E.Id_envio, E.Id_producto, E.cantidad, E.fecha_envio, E.estado
+        FROM TRANSFERENCIA_ENVIO E
+        WHERE {filtro}
+        ORDER BY E.Id_envio
+    """,
+    SUCURSAL: """
+        SELECT TOP (?) E.Id_envio, E.Id_producto, E.cantidad, E.fecha_envio, COUNT(R.Id_recepcion)
+        FROM TRANSFERENCIA_ENVIO E
+        LEFT JOIN TRANSFERENCIA_RECEPCION R ON R.Id_envio_original = E.Id_envio
+        WHERE {filtro}
+        GROUP BY E.Id_envio, E.Id_producto, E.cantidad, E.fecha_envio
+        ORDER BY E.Id_envio
+    """,
+}
+
+INCIDENCIAS = {
+    'falta_en_quito': "El envío no existe en el nodo Quito.",
+    'falta_en_matriz': "Quito tiene un envío que Guayaquil no registra.",
+    'cantidad_distinta': "Producto o cantidad distintos entre nodos.",
+    'duplicado': "Envío repetido o recibido más de una vez.",
+    'estado_distinto': "Guayaquil y Quito no coinciden en si se recibió.",
+    'atascado': "Sin recepción después del plazo.",
+}
+
+
+class ConciliacionError(RuntimeError):
+    pass
+
+
+class Conciliador:
+    """Compara TRANSFERENCIA_ENVIO de Guayaquil con lo que Quito ve y recibió.
+
+    Cada pasada:
+    1. Revisa los envíos pendientes de pasadas anteriores (en camino o con incidencia).
+    2. Recorre los envíos nuevos (Id_envio > marca) en bloques por keyset, pidiendo el
+       bloque siguiente de ambos nodos en paralelo, y los cruza como un merge-join.
+    Las incidencias abiertas quedan en SQLite; un envío recibido y consistente se cierra.
+    """
+
+    def __init__(self, ruta=RECONCILIACION_DB, intervalo=RECONCILIACION_INTERVALO, lote=RECONCILIACION_LOTE,
+                 timeout=RECONCILIACION_TIMEOUT, atasco_horas=RECONCILIACION_ATASCO_HORAS,
+                 gracia_min=RECONCILIACION_GRACIA_MIN):
+        self.ruta = ruta
+        self.intervalo = intervalo
+        self.lote = lote
+        self.timeout = timeout
+        self.atasco = timedelta(hours=atasco_horas)
+        self.gracia = timedelta(minutes=gracia_min)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._ejecutando = threading.Lock()   # una pasada a la vez
+        self._hilo = None
+        self._despertar = threading.Event()
+        self._ultima = {}   # resumen de la última pasada
+        self._counters = {'pasadas': 0, 'errores': 0, 'envios_revisados': 0}
+
+    # --- API pública ---
+    def asegurar_iniciado(self):
+        if self._hilo is None:
+            with self._lock:
+                if self._hilo is None:
+                    self._conexion().executescript(_ESQUEMA)
+                    self._hilo = threading.Thread(target=self._bucle, name='conciliacion', daemon=True)
+                    self._hilo.start()
+
+    def solicitar(self):
+        self._despertar.set()
+
+    def incidencias(self, limite=50):
+        """[(Id_envio, tipo, detalle, detectado)] abiertas, las más recientes primero."""
+        try:
+            return self._conexion().execute(
+                "SELECT Id_envio, tipo, detalle, detectado FROM incidencias ORDER BY Id_envio DESC LIMIT ?",
+                (limite,)).fetchall()
+        except sqlite3.OperationalError:
+            return []   # Todavía no se creó el esquema
+
+    def stats(self):
+        conn = self._conexion()
+        with self._lock:
+            datos = dict(self._counters, ultima=dict(self._ultima))
+        try:
+            datos['abiertas'] = dict(conn.execute("SELECT tipo, COUNT(*) FROM incidencias GROUP BY tipo").fetchall())
+            datos['pendientes'] = conn.execute("SELECT COUNT(*) FROM pendientes").fetchone()[0]
+            fila = conn.execute("SELECT ultimo_envio FROM marca").fetchone()
+            datos['marca'] = fila[0] if fila else None
+        except sqlite3.OperationalError:
+            pass
+        return datos
+
+    def ejecutar(self):
+        """Una pasada completa. Devuelve el resumen (también queda en stats())."""
+        with self._ejecutando:
+            inicio = time.monotonic()
+            conn = self._conexion()
+            conn.executescript(_ESQUEMA)
+            ahora = datetime.now()
+            fila = conn.execute("SELECT ultimo_envio FROM marca").fetchone()
+            marca = fila[0] if fila else 0
+            resumen = {'revisados': 0, 'pendientes_revisados': 0, 'nuevas': 0, 'cerradas': 0}
+
+            # 1. Pendientes de pasadas anteriores, por listas de ids
+            pendientes = [f[0] for f in conn.execute("SELECT Id_envio FROM pendientes ORDER BY Id_envio")]
+            for i in range(0, len(pendientes), 500):
+                ids = pendientes[i:i + 500]
+                filtro = "E.Id_envio IN (" + ', '.join('?' * len(ids)) + ")"
+                lados = self._bloque({MATRIZ: (filtro, ids), SUCURSAL: (filtro, ids)}, len(ids) * 2)
+                pares = _merge(deque(lados[MATRIZ]), deque(lados[SUCURSAL]), True, True)
+                # Ya no existe en ningún nodo (p. ej. se eliminó el producto): se olvida
+                borrados = [(i,) for i in set(ids) - {p[0] for p in pares}]
+                with conn:
+                    self._aplicar(conn, pares, ahora, resumen)
+                    conn.executemany("DELETE FROM pendientes WHERE Id_envio = ?", borrados)
+                    conn.executemany("DELETE FROM incidencias WHERE Id_envio = ?", borrados)
+                resumen['pendientes_revisados'] += len(ids)
+
+            # 2. Envíos nuevos desde la marca
+            for pares, ultimo in self._recorrer(marca):
+                with conn:   # Incidencias y marca avanzan juntas: una caída no salta envíos
+                    self._aplicar(conn, pares, ahora, resumen)
+                    conn.execute("INSERT OR REPLACE INTO marca (id, ultimo_envio, ejecutado) VALUES (1, ?, ?)",
+                                 (ultimo, ahora))
+                marca = ultimo
+                resumen['revisados'] += len(pares)
+
+            with conn:
+                conn.execute("UPDATE marca SET ejecutado = ?", (ahora,))
+            resumen['segundos'] = round(time.monotonic() - inicio, 3)
+            resumen['marca'] = marca
+            with self._lock:
+                self._ultima = dict(resumen, ejecutado=str(ahora))
+                self._counters['pasadas'] += 1
+                self._counters['envios_revisados'] += resumen['revisados'] + resumen['pendientes_revisados']
+            return resumen
+
+    # --- Internos ---
+    def _bloque(self, filtros, tope):
+        """Ejecuta en paralelo {nodo: (filtro, params)} y devuelve {nodo: filas}."""
+        def trabajo(nodo, conn):
+            filtro, params = filtros[nodo]
+            cursor = conn.cursor()
+            cursor.execute(_SQL_LADO[nodo].format(filtro=filtro), (tope, *params))
+            return cursor.fetchall()
+
+        resultados = fan_out(trabajo, list(filtros), timeout=self.timeout)
+        caidos = {nodo: r.error for nodo, r in resultados.items() if not r.ok}
+        if caidos:
+            # Sin uno de los lados no se puede comparar: la marca no avanza
+            raise ConciliacionError("Sin respuesta de " + ', '.join(f"{n} ({e})" for n, e in caidos.items()))
+        return {nodo: r.valor for nodo, r in resultados.items()}
+
+    def _recorrer(self, desde):
+        """Produce (pares, último Id_envio decidido) por bloques, desde la marca.
+
+        Cada lado tiene su cursor de keyset; solo se pide bloque nuevo a los lados que
+        se quedaron sin filas, y se cruzan hasta donde ambos lados permiten decidir.
+        """
+        claves = {MATRIZ: desde, SUCURSAL: desde}
+        buffers = {MATRIZ: deque(), SUCURSAL: deque()}
+        agotado = {MATRIZ: False, SUCURSAL: False}
+        while True:
+            faltan = [n for n in buffers if not buffers[n] and not agotado[n]]
+            if faltan:
+                lados = self._bloque({n: ("E.Id_envio > ?", (claves[n],)) for n in faltan}, self.lote)
+                for nodo, filas in lados.items():
+                    agotado[nodo] = len(filas) < self.lote
+                    if filas:
+                        claves[nodo] = filas[-1][0]
+                        buffers[nodo].extend(filas)
+            if not buffers[MATRIZ] and not buffers[SUCURSAL]:
+                return
+            pares = _merge(buffers[MATRIZ], buffers[SUCURSAL], agotado[MATRIZ], agotado[SUCURSAL])
+            if pares:
+                yield pares, pares[-1][0]
+
+    def _aplicar(self, conn, pares, ahora, resumen):
+        """Clasifica cada par y actualiza pendientes e incidencias."""
+        for id_envio, matriz, sucursal in pares:
+            encontradas = self._clasificar(matriz, sucursal, ahora)
+            if encontradas is None:   # Aún no se puede decidir (en camino, dentro de plazo)
+                conn.execute("INSERT OR IGNORE INTO pendientes (Id_envio) VALUES (?)", (id_envio,))
+                continue
+            anteriores = {f[0] for f in conn.execute("SELECT tipo FROM incidencias WHERE Id_envio = ?", (id_envio,))}
+            for tipo in set(encontradas) - anteriores:
+                conn.execute("INSERT INTO incidencias (Id_envio, tipo, detalle, detectado) VALUES (?, ?, ?, ?)",
+                             (id_envio, tipo, encontradas[tipo], ahora))
+                resumen['nuevas'] += 1
+            cerradas = anteriores - set(encontradas)
+            for tipo in cerradas:
+                conn.execute("DELETE FROM incidencias WHERE Id_envio = ? AND tipo = ?", (id_envio, tipo))
+            resumen['cerradas'] += len(cerradas)
+            if encontradas:
+                conn.execute("INSERT OR IGNORE INTO pendientes (Id_envio) VALUES (?)", (id_envio,))
+            else:
+                conn.execute("DELETE FROM pendientes WHERE Id_envio = ?", (id_envio,))
+
+    def _clasificar(self, matriz, sucursal, ahora):
+        """{tipo: detalle} de un envío ({} si está cerrado y en orden), o None si sigue en curso."""
+        if matriz == 'duplicado' or sucursal == 'duplicado':
+            return {'duplicado': "Id_envio repetido en TRANSFERENCIA_ENVIO."}
+        if matriz is None:
+            return {'falta_en_matriz': f"Quito: producto {sucursal[1]}, cantidad {sucursal[2]}."}
+        _, id_prod, cantidad, fecha_envio, estado = matriz
+        edad = ahora - fecha_envio if fecha_envio else timedelta(0)
+        if sucursal is None:
+            if edad < self.gracia:
+                return None
+            return {'falta_en_quito': f"Producto {id_prod}, cantidad {cantidad}, enviado {fecha_envio}."}
+
+        incidencias = {}
+        if (sucursal[1], sucursal[2]) != (id_prod, cantidad):
+            incidencias['cantidad_distinta'] = (f"Guayaquil: producto {id_prod} x {cantidad}; "
+                                                f"Quito: producto {sucursal[1]} x {sucursal[2]}.")
+        recepciones = sucursal[4]
+        if recepciones > 1:
+            incidencias['duplicado'] = f"Recibido {recepciones} veces."
+        recibido_matriz = (estado or '').strip().upper() == 'RECIBIDO'
+        if recepciones and not recibido_matriz and edad >= self.gracia:
+            incidencias['estado_distinto'] = f"Quito lo recibió; Guayaquil dice '{estado}'."
+        elif recibido_matriz and not recepciones:
+            incidencias['estado_distinto'] = "Guayaquil lo marca RECIBIDO pero Quito no tiene recepción."
+        if not recepciones and not recibido_matriz:
+            if edad < self.atasco and not incidencias:
+                return None
+            if edad >= self.atasco:
+                incidencias['atascado'] = f"En camino desde {fecha_envio}."
+        return incidencias
+
+    def _conexion(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.ruta)), exist_ok=True)
+            conn = sqlite3.connect(self.ruta, detect_types=sqlite3.PARSE_DECLTYPES, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _bucle(self):
+        while True:
+            try:
+                self.ejecutar()
+            except Exception as e:
+                with self._lock:
+                    self._counters['errores'] += 1
+                log.warning("Conciliación de logística falló: %s", e)
+            self._despertar.wait(self.intervalo)
+            self._despertar.clear()
+
+
+def _merge(matriz, sucursal, fin_matriz, fin_sucursal):
+    """Merge-join por Id_envio de dos deques ordenados: [(Id_envio, fila_matriz, fila_sucursal)].
+
+    Consume solo lo que se puede decidir: si un lado se vació y no está agotado, lo que
+    queda del otro espera al bloque siguiente. Un Id_envio repetido en un lado se marca
+    'duplicado' en vez de la fila.
+    """
+    pares = []
+    while True:
+        if matriz and sucursal:
+            km, ks = matriz[0][0], sucursal[0][0]
+            if km == ks:
+                par = (km, matriz.popleft(), sucursal.popleft())
+            elif km < ks:
+                par = (km, matriz.popleft(), None)
+            else:
+                par = (ks, None, sucursal.popleft())
+        elif matriz and fin_sucursal:
+            par = (matriz[0][0], matriz.popleft(), None)
+        elif sucursal and fin_matriz:
+            par = (sucursal[0][0], None, sucursal.popleft())
+        else:
+            return pares
+        if pares and pares[-1][0] == par[0]:
+            # Mismo Id_envio otra vez en uno de los lados
+            anterior = pares.pop()
+            par = (par[0], 'duplicado' if par[1] or anterior[1] == 'duplicado' else anterior[1],
+                   'duplicado' if par[2] or anterior[2] == 'duplicado' else anterior[2])
+        pares.append(par)
+
+
+conciliador = Conciliador()
+
+
+if __name__ == '__main__':
+    # python -m backend.reconciliation: una pasada (para cron / tareas programadas)
+    import json
+    logging.basicConfig(level=logging.INFO)
+    print(json.dumps(conciliador.ejecutar(), indent=2, default=str))
+    for incidencia in conciliador.incidencias():
+        print(*incidencia, sep=' | ')
\ No newline at end of file
@@ -0,0 +1,240 @@
+# backend/reports.py
+import logging
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from decimal import Decimal
+
+from .config import NODOS, REPORTES_DB, REPORTES_INTERVALO, REPORTES_LOTE
+from .fanout import fan_out
+from .pagination import TablaSpec, paginar_local
+
+log = logging.getLogger(__name__)
+
+_CENTAVO = Decimal('0.01')
+
+# Tipos que SQLite no maneja de forma nativa: se guardan como texto y se recuperan por el tipo declarado
+sqlite3.register_adapter(Decimal, str)
+sqlite3.register_adapter(datetime, lambda d: d.isoformat(' '))
+sqlite3.register_converter('MONEY', lambda b: Decimal(b.decode()).quantize(_CENTAVO))
+sqlite3.register_converter('TIMESTAMP', lambda b: datetime.fromisoformat(b.decode()))
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS ventas (
+    Sede TEXT NOT NULL, Id_factura INTEGER NOT NULL, Fecha TIMESTAMP, Id_producto INTEGER NOT NULL,
+    Producto TEXT, Cant INTEGER, PUnit MONEY, Total MONEY
+);
+CREATE INDEX IF NOT EXISTS ix_ventas_fecha ON ventas (Fecha, Id_factura);
+-- Una línea por producto y factura: volver a traer una factura (p. ej. la de la marca) no la duplica.
+-- Por Id_producto y no por nombre: dos productos distintos pueden llamarse igual
+CREATE UNIQUE INDEX IF NOT EXISTS ux_ventas_producto ON ventas (Sede, Id_factura, Id_producto);
+CREATE TABLE IF NOT EXISTS inventario (
+    Sede TEXT NOT NULL, Id_producto INTEGER NOT NULL, Producto TEXT, Marca TEXT, Stock INTEGER
+);
+CREATE INDEX IF NOT EXISTS ix_inventario_producto ON inventario (Id_producto);
+CREATE TABLE IF NOT EXISTS marcas (
+    nodo TEXT PRIMARY KEY, fecha TIMESTAMP, Id_factura INTEGER, datos_al TIMESTAMP
+);
+"""
+
+# Pestañas servidas desde la copia: consulta local + columnas (nombre, tipo) como en paginar()
+_TABLAS = {
+    'INVENTARIO': (
+        TablaSpec("SELECT Sede, Id_producto, Producto, Marca, Stock FROM inventario",
+                  default_sort='Id_producto'),
+        [('Sede', str), ('Id_producto', int), ('Producto', str), ('Marca', str), ('Stock', int)],
+    ),
+    'FACTURA': (
+        TablaSpec("SELECT Fecha, Sede, Producto, Cant, PUnit AS [P.Unit], Total FROM ventas",
+                  default_sort='Fecha', default_dir='DESC'),
+        [('Fecha', datetime), ('Sede', str), ('Producto', str), ('Cant', int),
+         ('P.Unit', Decimal), ('Total', Decimal)],
+    ),
+}
+
+# Facturas posteriores a la marca (fecha, Id_factura) del nodo, en lotes acotados
+_SQL_VENTAS = """
+    WITH F AS (
+        SELECT TOP (?) F.Id_factura, F.fecha
+        FROM FACTURA F
+        WHERE F.Id_sucursal = ? {seek}
+        ORDER BY F.fecha, F.Id_factura
+    )
+    SELECT F.Id_factura, F.fecha, D.Id_producto, P.nombre, D.cantidad, D.precio_unidad, D.subtotal
+    FROM F
+    JOIN DETALLE_FACTURA D ON D.Id_factura = F.Id_factura AND D.Id_sucursal = ?
+    JOIN PRODUCTO P ON D.Id_producto = P.Id_producto
+    ORDER BY F.fecha, F.Id_factura
+"""
+# La marca vuelve como parámetro datetime2, pero FACTURA.fecha es datetime (ticks de 1/300 s):
+# sin el CAST, .003 no es igual a .00333 y la última factura se volvería a traer en cada pasada
+_SEEK = ("AND (F.fecha > CAST(? AS DATETIME) "
+         "OR (F.fecha = CAST(? AS DATETIME) AND F.Id_factura > ?))")
+
+_SQL_INVENTARIO = """
+    SELECT P.Id_producto, P.nombre, P.marca, I.cantidad
+    FROM INVENTARIO I
+    JOIN PRODUCTO P ON I.Id_producto = P.Id_producto
+    WHERE I.Id_sucursal = ?
+"""
+
+
+def _migrar(conn):
+    """Una copia de antes de Id_producto en ventas no se puede completar: se descarta y se
+    vuelve a traer entera desde los nodos (las marcas se borran con ella)."""
+    columnas = [fila[1] for fila in conn.execute("PRAGMA table_info(ventas)")]
+    if columnas and 'Id_producto' not in columnas:
+        with conn:
+            conn.execute("DROP TABLE ventas")
+            conn.execute("DELETE FROM marcas")
+        log.info("Copia de reportes con esquema viejo: se vuelve a cargar desde los nodos")
+
+
+class ReportStore:
+    """Copia local (SQLite) de los reportes globales del dashboard.
+
+    Un hilo en segundo plano la actualiza cada `intervalo` segundos:
+    - ventas: solo las facturas posteriores a la marca (fecha, Id_factura) de cada nodo.
+    - inventario: se reemplaza completo por nodo (una fila por producto, es pequeño).
+    Los nodos se consultan en paralelo; si uno falla se conserva su última copia.
+    """
+
+    def __init__(self, ruta=REPORTES_DB, intervalo=REPORTES_INTERVALO, lote=REPORTES_LOTE):
+        self.ruta = ruta
+        self.intervalo = intervalo
+        self.lote = lote
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._hilo = None
+        self._despertar = threading.Event()
+        self._errores = {}   # nodo -> último error (se limpia al actualizar bien)
+        self._counters = {'refrescos': 0, 'errores': 0, 'ventas_nuevas': 0, 'segundos_ultimo': 0.0}
+
+    # --- API pública ---
+    def asegurar_iniciado(self):
+        """Arranca el hilo de actualización la primera vez que se pide un reporte."""
+        if self._hilo is None:
+            with self._lock:
+                if self._hilo is None:
+                    _migrar(self._conexion())
+                    self._conexion().executescript(_ESQUEMA)
+                    self._hilo = threading.Thread(target=self._bucle, name='reportes', daemon=True)
+                    self._hilo.start()
+
+    def solicitar_refresco(self):
+        self._despertar.set()
+
+    def paginar(self, tabla, args):
+        """Página del reporte desde la copia local, o None si la copia aún no tiene datos.
+
+        info incluye 'datos_al' (la actualización más vieja entre los nodos) y
+        'nodos_caidos' ({nodo: error} de los que fallaron en la última pasada).
+        """
+        self.asegurar_iniciado()
+        conn = self._conexion()
+        marcas = {nodo: datos_al for nodo, datos_al in
+                  conn.execute("SELECT nodo, datos_al FROM marcas WHERE datos_al IS NOT NULL")}
+        if not marcas:
+            return None
+
+        spec, cols = _TABLAS[tabla]
+        columnas, filas, info = paginar_local(conn, spec, cols, args)
+        info['datos_al'] = min(marcas.values())
+        with self._lock:
+            info['nodos_caidos'] = dict(self._errores)
+        for nodo in NODOS:
+            if nodo not in marcas:
+                info['nodos_caidos'].setdefault(nodo, 'Sin copia todavía.')
+        return columnas, filas, info
+
+    def stats(self):
+        conn = self._conexion()
+        with self._lock:
+            datos = dict(self._counters, errores_por_nodo=dict(self._errores))
+        try:
+            datos['filas'] = {t: conn.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0]
+                              for t in ('ventas', 'inventario')}
+            datos['datos_al'] = {nodo: str(d) for nodo, d in conn.execute("SELECT nodo, datos_al FROM marcas")}
+        except sqlite3.OperationalError:
+            pass   # Todavía no se creó el esquema
+        return datos
+
+    def refrescar(self):
+        """Una pasada de actualización. Devuelve True si quedaron facturas pendientes."""
+        inicio = time.monotonic()
+        conn = self._conexion()
+        marcas = {fila[0]: fila[1:] for fila in conn.execute("SELECT nodo, fecha, Id_factura FROM marcas")}
+
+        def trabajo(nodo, conn_nodo):
+            id_suc = NODOS[nodo]['id_sucursal']
+            fecha, id_factura = marcas.get(nodo, (None, None))
+            cursor = conn_nodo.cursor()
+            if fecha is None:
+                cursor.execute(_SQL_VENTAS.format(seek=''), (self.lote, id_suc, id_suc))
+            else:
+                cursor.execute(_SQL_VENTAS.format(seek=_SEEK), (self.lote, id_suc, fecha, fecha, id_factura, id_suc))
+            ventas = cursor.fetchall()
+            cursor.execute(_SQL_INVENTARIO, (id_suc,))
+            return ventas, cursor.fetchall()
+
+        resultados = fan_out(trabajo, list(NODOS))
+        pendientes, nuevas = False, 0
+        with conn:   # Una sola transacción local para todos los nodos
+            for nodo, r in resultados.items():
+                if not r.ok:
+                    continue
+                ventas, inventario = r.valor
+                if ventas:
+                    insertadas = conn.executemany(
+                        "INSERT OR IGNORE INTO ventas (Sede, Id_factura, Fecha, Id_producto, Producto, Cant, PUnit, "
+                        "Total) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        [(nodo,) + tuple(v) for v in ventas])
+                    ultima = ventas[-1]
+                    marca = (ultima[1], ultima[0])
+                    nuevas += insertadas.rowcount   # Sin contar líneas (factura, producto) que ya estaban
+                    # Si el lote vino lleno puede haber más facturas esperando
+                    pendientes = pendientes or len({v[0] for v in ventas}) >= self.lote
+                else:
+                    marca = marcas.get(nodo, (None, None))
+                conn.execute("DELETE FROM inventario WHERE Sede = ?", (nodo,))
+                conn.executemany(
+                    "INSERT INTO inventario (Sede, Id_producto, Producto, Marca, Stock) VALUES (?, ?, ?, ?, ?)",
+                    [(nodo,) + tuple(i) for i in inventario])
+                conn.execute("INSERT OR REPLACE INTO marcas (nodo, fecha, Id_factura, datos_al) VALUES (?, ?, ?, ?)",
+                             (nodo,) + tuple(marca) + (datetime.now(),))
+
+        with self._lock:
+            self._errores = {nodo: r.error for nodo, r in resultados.items() if not r.ok}
+            self._counters['refrescos'] += 1
+            self._counters['errores'] += len(self._errores)
+            self._counters['ventas_nuevas'] += nuevas
+            self._counters['segundos_ultimo'] = round(time.monotonic() - inicio, 3)
+        return pendientes
+
+    # --- Internos ---
+    def _conexion(self):
+        """Una conexión SQLite por hilo (WAL: los lectores no bloquean al actualizador)."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.ruta, detect_types=sqlite3.PARSE_DECLTYPES, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _bucle(self):
+        while True:
+            try:
+                pendientes = self.refrescar()
+            except Exception as e:
+                pendientes = False
+                with self._lock:
+                    self._counters['errores'] += 1
+                log.warning("Actualización de reportes falló: %s", e)
+            if not pendientes:
+                self._despertar.wait(self.intervalo)
+                self._despertar.clear()
+
+
+report_store = ReportStore()
\ No newline at end of file
@@ -1,13 +1,35 @@
 # backend/routes/actions.py
 import json
-from flask import Blueprint, request, redirect, session, url_for
-from backend.database import get_db_connection
+import time
+from flask import Blueprint, jsonify, request, redirect, render_template, session, url_for
+from backend.database import db_connection
+from backend.jobs import runner, tarea
+from backend.cache import catalog_cache, invalidate_identidad
+from backend.checkout import normalizar_carrito
+from backend.config import CHECKOUT_ESPERA, NODOS, RECEPCION_MAX_LOTE
+from backend.logistics import LoteInvalidoError, normalizar_envios, recibir_envios
+from backend.order_journal import clave_valida, diario_ventas, nueva_clave
+from backend.product_import import ArchivoInvalidoError, importar_productos, leer_filas
+from backend.reconciliation import conciliador
+from backend.sessions import confirmar_compra
+from backend.stock_feed import leer_stock, stock_feed
 
 # --- CONFIGURACIÓN ---
 actions_bp = Blueprint('actions', __name__)
 ID_QUITO = 1
 ID_GUAYAQUIL = 2
 
+
+def _encolar(tipo, parametros, tabla):
+    """Encola un trabajo largo y vuelve al dashboard, que consulta su avance.
+
+    Con ?formato=json responde 202 con el id y la URL de estado.
+    """
+    id_trabajo = runner.encolar(tipo, parametros, usuario=session.get('user_name'))
+    if request.args.get('formato') == 'json':
+        return jsonify(trabajo=id_trabajo, estado=url_for('views.estado_trabajo', id_trabajo=id_trabajo)), 202
+    return redirect(url_for('views.dashboard', tabla=tabla, trabajo=id_trabajo))
+
 # ==============================================================================
 # 1. GESTIÓN DE SESIÓN Y NAVEGACIÓN
 # ==============================================================================
@@ -18,8 +40,11 @@ def cambiar_sucursal():
         session['sucursal'] = session.get('assigned_branch', session.get('sucursal'))
         return redirect(request.referrer or url_for('views.dashboard'))
 
-    # Si es cliente o invitado, sí dejamos cambiar
-    session['sucursal'] = request.form['nueva_sucursal']
+    # Si es cliente o invitado, sí dejamos cambiar (solo a una sucursal que exista)
+    nueva = request.form.get('nueva_sucursal')
+    if nueva not in NODOS:
+        return redirect(url_for('views.index', error="Sucursal desconocida."))
+    session['sucursal'] = nueva
     return redirect(request.referrer or url_for('views.index'))
 
 # ==============================================================================
@@ -27,96 +52,60 @@ def cambiar_sucursal():
 # ==============================================================================
 @actions_bp.route('/checkout', methods=['POST'])
 def checkout():
+    """Anota el pedido en el diario local y responde sin depender del nodo.
+
+    Un hilo lo aplica en SQL Server (backend/order_journal.py). Si el nodo confirma dentro
+    de CHECKOUT_ESPERA segundos se responde como antes (éxito o sin stock); si no, el
+    pedido queda en cola y la tienda muestra su estado hasta que se confirme; el carrito y
+    el auto-login del registro rápido esperan a esa confirmación.
+    """
     # 1. Seguridad
     if session.get('user_role') == 'admin':
         return redirect(url_for('views.index', error="⛔ Los empleados no pueden comprar."))
 
     sucursal = session.get('sucursal', 'Quito')
-    id_suc_actual = ID_QUITO if sucursal == 'Quito' else ID_GUAYAQUIL
+    if sucursal not in NODOS:
+        return redirect(url_for('views.index', error="Sucursal desconocida."))
     
-    conn = None
     try:
         # 2. Obtener datos del Carrito (JSON String)
         cart_data_str = request.form.get('cart_data')
         if not cart_data_str:
             return redirect(url_for('views.index', error="El carrito está vacío."))
         
-        # Convertimos el texto JSON a una lista de Python
-        carrito = json.loads(cart_data_str) 
-
-        conn = get_db_connection(sucursal)
-        cursor = conn.cursor()
+        # Convertimos el texto JSON a {Id_producto: cantidad} validado
+        items = normalizar_carrito(json.loads(cart_data_str))
 
         # 3. Identificar Cliente (Igual que antes)
-        id_cliente = None
         if 'user_id' in session and session.get('user_role') == 'cliente':
-            id_cliente = session['user_id']
+            id_cliente, cliente = session['user_id'], None
         else:
-            # Registro rápido de cliente
+            # Registro rápido de cliente: se hace en el nodo junto con la venta
             id_cliente = request.form['id_cliente']
-            if sucursal == 'Quito':
-                cursor.execute("""
-                    EXEC sp_RegistrarClienteNuevo 
-                    @IdCliente = ?, @Nombre = ?, @Direccion = ?, @Telefono = ?, @Correo = ?
-                """, (id_cliente, request.form['nombre'], request.form['direccion'], request.form['telefono'], request.form['correo']))
-            else:
-                cursor.execute("SELECT 1 FROM CLIENTE WHERE Id_cliente = ?", (id_cliente,))
-                if not cursor.fetchone():
-                    cursor.execute("""
-                        INSERT INTO CLIENTE (Id_cliente, nombre, direccion, telefono, correo, Id_sucursal)
-                        VALUES (?, ?, ?, ?, ?, ?)
-                    """, (id_cliente, request.form['nombre'], request.form['direccion'], request.form['telefono'], request.form['correo'], ID_GUAYAQUIL))
-            
-            # Auto-Login
-            session['user_id'] = id_cliente
-            session['user_name'] = request.form['nombre']
-            session['user_role'] = 'cliente'
-
-        # 4. Crear Cabecera de Factura
-        # Calculamos el total sumando el backend para seguridad
-        total_factura = sum(item['precio'] * item['cantidad'] for item in carrito)
-        
-        row_fact = cursor.execute("SELECT ISNULL(MAX(Id_factura), 0) + 1 FROM FACTURA").fetchone()
-        id_factura = int(row_fact[0])
-        
-        cursor.execute("""
-            INSERT INTO FACTURA (Id_factura, Id_cliente, Id_sucursal, total, fecha)
-            VALUES (?, ?, ?, ?, GETDATE())
-        """, (id_factura, id_cliente, id_suc_actual, total_factura))
-
-        # 5. Insertar Detalles (Bucle por cada producto del carrito)
-        for item in carrito:
-            id_prod = item['id']
-            cantidad = int(item['cantidad'])
-            precio = float(item['precio'])
-            subtotal = precio * cantidad
-
-            # a. Validar stock real en DB antes de insertar
-            cursor.execute("SELECT cantidad FROM INVENTARIO WHERE Id_producto = ? AND Id_sucursal = ?", (id_prod, id_suc_actual))
-            stock_row = cursor.fetchone()
-            if not stock_row or stock_row[0] < cantidad:
-                raise Exception(f"Stock insuficiente para {item['nombre']}.")
-
-            # b. Insertar detalle
-            cursor.execute("""
-                INSERT INTO DETALLE_FACTURA (Id_factura, Id_producto, Id_sucursal, cantidad, precio_unidad, subtotal)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, (id_factura, id_prod, id_suc_actual, cantidad, precio, subtotal))
-            
-            # c. Restar inventario
-            cursor.execute("""
-                UPDATE INVENTARIO SET cantidad = cantidad - ? 
-                WHERE Id_producto = ? AND Id_sucursal = ?
-            """, (cantidad, id_prod, id_suc_actual))
-
-        conn.commit()
-        return redirect(url_for('views.index')) # Éxito
-
+            cliente = {k: request.form[k] for k in ('nombre', 'direccion', 'telefono', 'correo')}
+
+        # 4. Al diario (milisegundos). La clave del formulario evita vender dos veces si se reenvía
+        clave = request.form.get('clave_pedido')
+        if not clave_valida(clave):
+            clave = nueva_clave()
+        diario_ventas.registrar(clave, sucursal, id_cliente, cliente, items)
+        pedido = diario_ventas.esperar(clave, CHECKOUT_ESPERA)
     except Exception as e:
-        if conn: conn.rollback()
         return redirect(url_for('views.index', error=f"Error en la compra: {str(e)}"))
-    finally:
-        if conn: conn.close()
+
+    if pedido['estado'] in ('conflicto', 'error'):
+        # Rechazado por el nodo (p. ej. se acabó el stock): el carrito se conserva
+        return redirect(url_for('views.index', error=f"Error en la compra: {pedido['detalle']}"))
+
+    if pedido['estado'] == 'pendiente':
+        # Nodo lento o caído: el carrito y la sesión quedan como están hasta que el nodo lo
+        # aplique; la tienda sigue el pedido y entonces completa la compra (views.index)
+        seguido = {'clave': clave, 'id_cliente': id_cliente, 'nombre': cliente['nombre'] if cliente else None}
+        session['pedidos'] = session.get('pedidos', [])[-9:] + [seguido]
+        return redirect(url_for('views.index'))
+
+    confirmar_compra(id_cliente, cliente['nombre'] if cliente else None)
+    return redirect(url_for('views.index')) # Éxito
 
 # ==============================================================================
 # 3. GESTIÓN DE INVENTARIO (PRODUCTOS)
@@ -128,63 +117,107 @@ def add_product():
         return redirect(url_for('views.dashboard', tabla='PRODUCTO', error="Acceso denegado."))
 
     try:
-        conn = get_db_connection('Guayaquil')
-        cursor = conn.cursor()
-        
-        # Datos básicos
-        id_prod = request.form['id_producto']
-        stock_gye = int(request.form['stock_gye'])
-        stock_uio = int(request.form['stock_uio'])
-        stock_total_fisico = stock_gye + stock_uio
-
-        # 1. Crear en Catálogo Global
-        cursor.execute("INSERT INTO PRODUCTO (Id_producto, nombre, marca, precio) VALUES (?, ?, ?, ?)",
-                       (id_prod, request.form['nombre'], request.form['marca'], request.form['precio']))
-        
-        # 2. Ingresar todo a Bodega Matriz (Físico)
-        if stock_total_fisico > 0:
-            cursor.execute("INSERT INTO INVENTARIO (Id_sucursal, Id_producto, cantidad) VALUES (?, ?, ?)",
-                           (ID_GUAYAQUIL, id_prod, stock_total_fisico))
-        
-        # 3. Transferencia Automática a Quito (si aplica)
-        if stock_uio > 0:
-            cursor.execute("EXEC sp_Enviar_A_Quito @IdProducto = ?, @Cantidad = ?", (id_prod, stock_uio))
-
-        conn.commit()
-        conn.close()
-        return redirect(url_for('views.dashboard', tabla='PRODUCTO'))
-        
+        # Se valida aquí para avisar al instante; el alta corre en segundo plano
+        parametros = {'id_producto': request.form['id_producto'], 'nombre': request.form['nombre'],
+                      'marca': request.form['marca'], 'precio': request.form['precio'],
+                      'stock_gye': int(request.form['stock_gye']), 'stock_uio': int(request.form['stock_uio'])}
+        return _encolar('agregar_producto', parametros, 'PRODUCTO')
     except Exception as e:
         return redirect(url_for('views.dashboard', tabla='PRODUCTO', error=f"Error al agregar: {str(e)}"))
 
+def _catalogo_cambiado(p, resultado):
+    catalog_cache.invalidate()  # Catálogo global + stock de ambas sedes
+    stock_feed.reiniciar()      # Producto nuevo o borrado: los clientes recargan el catálogo
+
+# Las tareas no hacen commit: el runner lo hace junto con la clave del trabajo (backend/jobs.py)
+@tarea('agregar_producto', nodo='Guayaquil', despues=_catalogo_cambiado)
+def _agregar_producto(conn, p, avance):
+    cursor = conn.cursor()
+    stock_total_fisico = p['stock_gye'] + p['stock_uio']
+
+    # 1. Crear en Catálogo Global
+    cursor.execute("INSERT INTO PRODUCTO (Id_producto, nombre, marca, precio) VALUES (?, ?, ?, ?)",
+                   (p['id_producto'], p['nombre'], p['marca'], p['precio']))
+
+    # 2. Ingresar todo a Bodega Matriz (Físico)
+    if stock_total_fisico > 0:
+        cursor.execute("INSERT INTO INVENTARIO (Id_sucursal, Id_producto, cantidad) VALUES (?, ?, ?)",
+                       (ID_GUAYAQUIL, p['id_producto'], stock_total_fisico))
+
+    # 3. Transferencia Automática a Quito (si aplica)
+    if p['stock_uio'] > 0:
+        avance(50, "Enviando stock a Quito")
+        cursor.execute("EXEC sp_Enviar_A_Quito @IdProducto = ?, @Cantidad = ?", (p['id_producto'], p['stock_uio']))
+
+    return {'mensaje': f"Producto {p['id_producto']} agregado."}
+
+@actions_bp.route('/importar_productos', methods=['POST'])
+def importar_productos_masivo():
+    """Alta masiva desde CSV/JSON en una sola transacción. Solo Matriz (Guayaquil).
+
+    Con ?formato=json devuelve el resumen como JSON (para cargas por script).
+    """
+    if session.get('sucursal') != 'Guayaquil' or session.get('user_role') != 'admin':
+        return redirect(url_for('views.dashboard', tabla='PRODUCTO', error="Acceso denegado."))
+
+    archivo = request.files.get('archivo')
+    if archivo is None or not archivo.filename:
+        return redirect(url_for('views.dashboard', tabla='PRODUCTO', error="Selecciona un archivo CSV o JSON."))
+
+    try:
+        with db_connection('Guayaquil') as conn:
+            resultado = importar_productos(conn, leer_filas(archivo.stream, archivo.filename))
+            conn.commit()
+        if resultado.insertadas:
+            catalog_cache.invalidate()  # Catálogo global + stock de ambas sedes
+            stock_feed.reiniciar()
+    except ArchivoInvalidoError as e:
+        return redirect(url_for('views.dashboard', tabla='PRODUCTO', error=f"Archivo inválido: {str(e)}"))
+    except Exception as e:
+        return redirect(url_for('views.dashboard', tabla='PRODUCTO', error=f"Error al importar (no se guardó nada): {str(e)}"))
+
+    if request.args.get('formato') == 'json':
+        return jsonify(resultado.to_dict())
+    return render_template('importacion.html', r=resultado, archivo=archivo.filename,
+                           sucursal=session.get('sucursal'))
+
 @actions_bp.route('/edit_product', methods=['POST'])
 def edit_product():
     """Editar detalles del producto. Solo Guayaquil."""
     if session.get('sucursal') != 'Guayaquil':
         return redirect(url_for('views.dashboard', tabla='PRODUCTO', error="Solo Guayaquil modifica."))
 
+    # Se valida antes de tocar la base: después del commit ya no hay cómo avisar
+    try:
+        id_prod, stock = int(request.form['id_producto']), int(request.form['stock'])
+    except (KeyError, ValueError):
+        return redirect(url_for('views.dashboard', tabla='PRODUCTO', error="Id y stock deben ser números enteros."))
+    if stock < 0:
+        return redirect(url_for('views.dashboard', tabla='PRODUCTO', error="El stock no puede ser negativo."))
+
     try:
-        conn = get_db_connection('Guayaquil')
-        cursor = conn.cursor()
+        with db_connection('Guayaquil') as conn:
+            cursor = conn.cursor()
         
-        # Actualizar info
-        cursor.execute("UPDATE PRODUCTO SET nombre = ?, marca = ?, precio = ? WHERE Id_producto = ?", 
-                       (request.form['nombre'], request.form['marca'], request.form['precio'], request.form['id_producto']))
+            # Actualizar info
+            cursor.execute("UPDATE PRODUCTO SET nombre = ?, marca = ?, precio = ? WHERE Id_producto = ?", 
+                           (request.form['nombre'], request.form['marca'], request.form['precio'], id_prod))
         
-        # Actualizar stock local (Upsert simple)
-        cursor.execute("""
-            MERGE INVENTARIO AS target
-            USING (SELECT ? AS id_suc, ? AS id_prod) AS source
-            ON (target.Id_sucursal = source.id_suc AND target.Id_producto = source.id_prod)
-            WHEN MATCHED THEN
-                UPDATE SET cantidad = ?
-            WHEN NOT MATCHED THEN
-                INSERT (Id_sucursal, Id_producto, cantidad) VALUES (source.id_suc, source.id_prod, ?);
-        """, (ID_GUAYAQUIL, request.form['id_producto'], request.form['stock'], request.form['stock']))
-
-        conn.commit()
-        conn.close()
-        return redirect(url_for('views.dashboard', tabla='PRODUCTO'))
+            # Actualizar stock local (Upsert simple)
+            cursor.execute("""
+                MERGE INVENTARIO AS target
+                USING (SELECT ? AS id_suc, ? AS id_prod) AS source
+                ON (target.Id_sucursal = source.id_suc AND target.Id_producto = source.id_prod)
+                WHEN MATCHED THEN
+                    UPDATE SET cantidad = ?
+                WHEN NOT MATCHED THEN
+                    INSERT (Id_sucursal, Id_producto, cantidad) VALUES (source.id_suc, source.id_prod, ?);
+            """, (ID_GUAYAQUIL, id_prod, stock, stock))
+
+            conn.commit()
+            catalog_cache.invalidate()
+            stock_feed.publicar('Guayaquil', [(id_prod, stock)])
+            return redirect(url_for('views.dashboard', tabla='PRODUCTO'))
     except Exception as e:
         return redirect(url_for('views.dashboard', tabla='PRODUCTO', error=str(e)))
 
@@ -195,28 +228,31 @@ def delete_product():
         return redirect(url_for('views.dashboard', tabla='PRODUCTO', error="Solo Matriz puede eliminar."))
 
     try:
-        conn = get_db_connection('Guayaquil')
-        cursor = conn.cursor()
-        id_prod = request.form['id_producto']
-
-        # --- PASO 1: Eliminar Referencias (Limpieza de Historial) ---
-        # ¡ADVERTENCIA!: Esto borrará este producto de todas las facturas históricas en Guayaquil.    
-        # 1.1 Borrar de Envíos Logísticos
-        cursor.execute("DELETE FROM TRANSFERENCIA_ENVIO WHERE Id_producto = ?", (id_prod,))     
-        # 1.2 Borrar de Detalles de Factura (Ventas Locales Guayaquil)
-        cursor.execute("DELETE FROM DETALLE_FACTURA WHERE Id_producto = ? AND Id_sucursal = ?", (id_prod, ID_GUAYAQUIL))       
-        # 1.3 Borrar de Inventario (Stock Local Guayaquil)
-        cursor.execute("DELETE FROM INVENTARIO WHERE Id_producto = ? AND Id_sucursal = ?", (id_prod, ID_GUAYAQUIL))
-        cursor.execute("DELETE FROM PRODUCTO WHERE Id_producto = ?", (id_prod,))
-
-        conn.commit()
-        conn.close()
-        return redirect(url_for('views.dashboard', tabla='PRODUCTO'))
-        
+        return _encolar('eliminar_producto', {'id_producto': request.form['id_producto']}, 'PRODUCTO')
     except Exception as e:
-        # Si aún falla (ej. si hay referencias en otra tabla que olvidamos), mostramos el error
         return redirect(url_for('views.dashboard', tabla='PRODUCTO', error=f"Error crítico: {str(e)}"))
 
+@tarea('eliminar_producto', nodo='Guayaquil', despues=_catalogo_cambiado)
+def _eliminar_producto(conn, p, avance):
+    # Si falla (ej. si hay referencias en otra tabla que olvidamos), el error queda en el trabajo
+    cursor = conn.cursor()
+    id_prod = p['id_producto']
+
+    # --- PASO 1: Eliminar Referencias (Limpieza de Historial) ---
+    # ¡ADVERTENCIA!: Esto borrará este producto de todas las facturas históricas en Guayaquil.
+    # 1.1 Borrar de Envíos Logísticos
+    cursor.execute("DELETE FROM TRANSFERENCIA_ENVIO WHERE Id_producto = ?", (id_prod,))
+    avance(25, "Envíos eliminados")
+    # 1.2 Borrar de Detalles de Factura (Ventas Locales Guayaquil)
+    cursor.execute("DELETE FROM DETALLE_FACTURA WHERE Id_producto = ? AND Id_sucursal = ?", (id_prod, ID_GUAYAQUIL))
+    avance(50, "Detalles de factura eliminados")
+    # 1.3 Borrar de Inventario (Stock Local Guayaquil)
+    cursor.execute("DELETE FROM INVENTARIO WHERE Id_producto = ? AND Id_sucursal = ?", (id_prod, ID_GUAYAQUIL))
+    cursor.execute("DELETE FROM PRODUCTO WHERE Id_producto = ?", (id_prod,))
+    avance(75, "Confirmando")
+
+    return {'mensaje': f"Producto {id_prod} eliminado."}
+
 @actions_bp.route('/delete_local_inventory', methods=['POST'])
 def delete_local_inventory():
     """Eliminación Local (Sucursales). Solo limpia stock, no el producto."""
@@ -225,13 +261,14 @@ def delete_local_inventory():
         return redirect(url_for('views.dashboard', tabla='PRODUCTO', error="Usa el botón de eliminar global."))
 
     try:
-        conn = get_db_connection(sucursal)
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM INVENTARIO WHERE Id_producto = ? AND Id_sucursal = ?", 
-                       (request.form['id_producto'], ID_QUITO))
-        conn.commit()
-        conn.close()
-        return redirect(url_for('views.dashboard', tabla='PRODUCTO'))
+        with db_connection(sucursal) as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM INVENTARIO WHERE Id_producto = ? AND Id_sucursal = ?", 
+                           (request.form['id_producto'], ID_QUITO))
+            conn.commit()
+            catalog_cache.invalidate(sucursal)
+            stock_feed.publicar(sucursal, [(request.form['id_producto'], 0)])
+            return redirect(url_for('views.dashboard', tabla='PRODUCTO'))
     except Exception as e:
         return redirect(url_for('views.dashboard', tabla='PRODUCTO', error=f"Error: {str(e)}"))
 
@@ -244,18 +281,18 @@ def add_employee():
     id_sucursal_destino = ID_QUITO if sucursal == 'Quito' else ID_GUAYAQUIL
 
     try:
-        conn = get_db_connection(sucursal)
-        cursor = conn.cursor()
-        cursor.execute("""
-            INSERT INTO EMPLEADO (Id_empleado, nombre, direccion, telefono, correo, Id_sucursal) 
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, (
-            request.form['id_empleado'], request.form['nombre'], request.form['direccion'], 
-            request.form['telefono'], request.form['correo'], id_sucursal_destino
-        ))
-        conn.commit()
-        conn.close()
-        return redirect(url_for('views.dashboard', tabla='EMPLEADO'))
+        with db_connection(sucursal) as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                INSERT INTO EMPLEADO (Id_empleado, nombre, direccion, telefono, correo, Id_sucursal) 
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (
+                request.form['id_empleado'], request.form['nombre'], request.form['direccion'], 
+                request.form['telefono'], request.form['correo'], id_sucursal_destino
+            ))
+            conn.commit()
+            invalidate_identidad('EMPLEADO', request.form['correo'])
+            return redirect(url_for('views.dashboard', tabla='EMPLEADO'))
     except Exception as e:
         return redirect(url_for('views.dashboard', tabla='EMPLEADO', error=f"Error RRHH: {str(e)}"))
 
@@ -267,24 +304,24 @@ def edit_employee():
         return redirect(url_for('auth.login'))
 
     try:
-        conn = get_db_connection(sucursal)
-        cursor = conn.cursor()
+        with db_connection(sucursal) as conn:
+            cursor = conn.cursor()
         
-        # Ejecutamos la actualización
-        cursor.execute("""
-            UPDATE EMPLEADO 
-            SET nombre = ?, correo = ?, telefono = ?, direccion = ?
-            WHERE Id_empleado = ?
-        """, (
-            request.form['nombre'], 
-            request.form['correo'], 
-            request.form['telefono'], 
-            request.form['direccion'], 
-            request.form['id_empleado']
-        ))
-        conn.commit()
-        conn.close()
-        return redirect(url_for('views.dashboard', tabla='EMPLEADO'))
+            # Ejecutamos la actualización
+            cursor.execute("""
+                UPDATE EMPLEADO 
+                SET nombre = ?, correo = ?, telefono = ?, direccion = ?
+                WHERE Id_empleado = ?
+            """, (
+                request.form['nombre'], 
+                request.form['correo'], 
+                request.form['telefono'], 
+                request.form['direccion'], 
+                request.form['id_empleado']
+            ))
+            conn.commit()
+            invalidate_identidad('EMPLEADO')
+            return redirect(url_for('views.dashboard', tabla='EMPLEADO'))
     except Exception as e:
         return redirect(url_for('views.dashboard', tabla='EMPLEADO', error=f"Error al editar: {str(e)}"))
 
@@ -295,13 +332,13 @@ def delete_employee():
         return redirect(url_for('auth.login'))
 
     try:
-        conn = get_db_connection(sucursal)
-        cursor = conn.cursor()
-        # Ejecutamos la eliminación
-        cursor.execute("DELETE FROM EMPLEADO WHERE Id_empleado = ?", (request.form['id_empleado'],))
-        conn.commit()
-        conn.close()
-        return redirect(url_for('views.dashboard', tabla='EMPLEADO'))
+        with db_connection(sucursal) as conn:
+            cursor = conn.cursor()
+            # Ejecutamos la eliminación
+            cursor.execute("DELETE FROM EMPLEADO WHERE Id_empleado = ?", (request.form['id_empleado'],))
+            conn.commit()
+            invalidate_identidad('EMPLEADO')
+            return redirect(url_for('views.dashboard', tabla='EMPLEADO'))
     except Exception as e:
         return redirect(url_for('views.dashboard', tabla='EMPLEADO', error=f"Error al eliminar: {str(e)}"))
     
@@ -314,13 +351,15 @@ def enviar_mercaderia():
         return redirect(url_for('views.dashboard', tabla='LOGISTICA', error="Solo Matriz envía."))
 
     try:
-        conn = get_db_connection('Guayaquil')
-        cursor = conn.cursor()
-        cursor.execute("EXEC sp_Enviar_A_Quito @IdProducto = ?, @Cantidad = ?", 
-                       (request.form['id_producto'], request.form['cantidad']))
-        conn.commit()
-        conn.close()
-        return redirect(url_for('views.dashboard', tabla='LOGISTICA'))
+        with db_connection('Guayaquil') as conn:
+            cursor = conn.cursor()
+            cursor.execute("EXEC sp_Enviar_A_Quito @IdProducto = ?, @Cantidad = ?", 
+                           (request.form['id_producto'], request.form['cantidad']))
+            stock = leer_stock(cursor, ID_GUAYAQUIL, [request.form['id_producto']])
+            conn.commit()
+            catalog_cache.invalidate()
+            stock_feed.publicar('Guayaquil', stock)
+            return redirect(url_for('views.dashboard', tabla='LOGISTICA'))
     except Exception as e:
         return redirect(url_for('views.dashboard', tabla='LOGISTICA', error=f"Error Envío: {str(e)}"))
 
@@ -330,12 +369,85 @@ def recibir_mercaderia():
         return redirect(url_for('views.dashboard', tabla='LOGISTICA', error="Solo Sucursal recibe."))
 
     try:
-        conn = get_db_connection('Quito')
-        cursor = conn.cursor()
-        cursor.execute("EXEC sp_Recibir_De_Guayaquil @IdEnvio = ?, @Usuario = ?", 
-                       (request.form['id_envio'], session.get('user_name', 'Admin')))
-        conn.commit()
-        conn.close()
-        return redirect(url_for('views.dashboard', tabla='LOGISTICA'))
+        return _encolar('recibir_envio', {'id_envio': request.form['id_envio'],
+                                          'usuario': session.get('user_name', 'Admin')}, 'LOGISTICA')
+    except Exception as e:
+        return redirect(url_for('views.dashboard', tabla='LOGISTICA', error=f"Error Recepción: {str(e)}"))
+
+def _stock_quito_cambiado(p, resultado):
+    catalog_cache.invalidate('Quito')
+    stock_feed.publicar('Quito', [tuple(s) for s in resultado['stock']])
+
+@tarea('recibir_envio', nodo='Quito', despues=_stock_quito_cambiado)
+def _recibir_envio(conn, p, avance):
+    cursor = conn.cursor()
+    cursor.execute("EXEC sp_Recibir_De_Guayaquil @IdEnvio = ?, @Usuario = ?", (p['id_envio'], p['usuario']))
+    # Stock que quedó en Quito del producto recibido (mismo viaje de la transacción)
+    cursor.execute("""
+        SELECT I.Id_producto, I.cantidad FROM TRANSFERENCIA_ENVIO E
+        JOIN INVENTARIO I ON I.Id_producto = E.Id_producto AND I.Id_sucursal = ?
+        WHERE E.Id_envio = ?
+    """, (ID_QUITO, p['id_envio']))
+    return {'mensaje': f"Envío #{p['id_envio']} recibido.", 'stock': [list(f) for f in cursor.fetchall()]}
+
+@actions_bp.route('/recibir_mercaderia_lote', methods=['POST'])
+def recibir_mercaderia_lote():
+    """Recibe varios envíos con una conexión, una transacción y un solo viaje a la base.
+
+    Un envío que falla no impide recibir los demás; el resultado se informa por envío.
+    Corre en segundo plano: al terminar, el dashboard abre el detalle en
+    /recibir_mercaderia_lote/<id_trabajo>. Con ?formato=json responde 202 con el id del
+    trabajo, cuyo resultado trae el detalle por envío.
+    """
+    if session.get('sucursal') != 'Quito':
+        return redirect(url_for('views.dashboard', tabla='LOGISTICA', error="Solo Sucursal recibe."))
+
+    try:
+        ids = normalizar_envios(request.form.getlist('id_envio'), RECEPCION_MAX_LOTE)
+        return _encolar('recibir_lote', {'ids': ids, 'usuario': session.get('user_name', 'Admin')}, 'LOGISTICA')
+    except LoteInvalidoError as e:
+        return redirect(url_for('views.dashboard', tabla='LOGISTICA', error=str(e)))
     except Exception as e:
-        return redirect(url_for('views.dashboard', tabla='LOGISTICA', error=f"Error Recepción: {str(e)}"))
\ No newline at end of file
+        return redirect(url_for('views.dashboard', tabla='LOGISTICA',
+                                error=f"Error Recepción (no se recibió ningún envío): {str(e)}"))
+
+def _lote_recibido(p, resultado):
+    recibidos = [e for e in resultado['envios'] if e['ok']]
+    if recibidos:
+        catalog_cache.invalidate('Quito')
+        stock_feed.publicar('Quito', {e['id_producto']: e['cantidad'] for e in recibidos
+                                      if e['id_producto'] is not None}.items())
+
+@tarea('recibir_lote', nodo='Quito', despues=_lote_recibido)
+def _recibir_lote(conn, p, avance):
+    inicio = time.perf_counter()
+    resultados = recibir_envios(conn.cursor(), p['ids'], p['usuario'])
+
+    recibidos = [r for r in resultados if r[1]]
+    return {'recibidos': len(recibidos), 'fallidos': len(resultados) - len(recibidos),
+            'segundos': round(time.perf_counter() - inicio, 3),
+            'envios': [{'id_envio': r[0], 'ok': bool(r[1]), 'mensaje': r[2], 'id_producto': r[3], 'cantidad': r[4]}
+                       for r in resultados],
+            'mensaje': f"{len(recibidos)} de {len(resultados)} envíos recibidos."}
+
+@actions_bp.route('/recibir_mercaderia_lote/<id_trabajo>')
+def detalle_recepcion_lote(id_trabajo):
+    """Detalle por envío de una recepción por lote ya terminada."""
+    if session.get('user_role') != 'admin':
+        return redirect(url_for('auth.login'))
+    trabajo = runner.estado(id_trabajo)
+    if trabajo is None or trabajo['tipo'] != 'recibir_lote' or trabajo['estado'] != 'ok':
+        return redirect(url_for('views.dashboard', tabla='LOGISTICA', trabajo=id_trabajo if trabajo else None))
+    r = trabajo['resultado']
+    resultados = [(e['id_envio'], e['ok'], e['mensaje'], e['id_producto'], e['cantidad']) for e in r['envios']]
+    return render_template('recepcion.html', resultados=resultados, recibidos=r['recibidos'],
+                           segundos=r['segundos'], sucursal='Quito')
+
+@actions_bp.route('/conciliar_logistica', methods=['POST'])
+def conciliar_logistica():
+    """Adelanta la pasada de conciliación de envíos (corre en segundo plano)."""
+    if session.get('user_role') != 'admin':
+        return redirect(url_for('auth.login'))
+    conciliador.asegurar_iniciado()
+    conciliador.solicitar()
+    return redirect(url_for('views.dashboard', tabla='LOGISTICA'))
\ No newline at end of file
@@ -0,0 +1,174 @@
+# backend/routes/api.py
+import gzip
+import json
+
+from flask import Blueprint, Response, jsonify, request, session
+
+from backend.cache import LRUCache, catalog_cache
+from backend.config import API_CACHE_SIZE, API_COMPRESS_MIN_BYTES, NODOS, STOCK_FEED_POLL_MAX
+from backend.routes.views import _cargar_catalogo
+from backend.sessions import guardar_carrito, leer_carrito, normalizar_items
+from backend.stock_feed import stock_feed
+
+try:
+    import brotli
+except ImportError:   # Opcional: sin el paquete solo se ofrece gzip
+    brotli = None
+
+# --- CONFIGURACIÓN ---
+api_bp = Blueprint('api', __name__, url_prefix='/api')
+
+# Cuerpos por (ETag, codificación): con el catálogo sin cambios no se vuelve a serializar ni comprimir
+_cuerpos = LRUCache(API_CACHE_SIZE, ttl=float('inf'))
+# Stock por Id_producto de cada carga del catálogo, para /stock/<id> sin recorrer la lista
+_indices = LRUCache(len(NODOS) * 2, ttl=float('inf'))
+
+
+def _catalogo(sucursal):
+    """(filas, etiqueta) del catálogo de la sucursal, desde catalog_cache."""
+    id_suc = NODOS[sucursal]['id_sucursal']
+    return catalog_cache.get_etiquetado(sucursal, lambda: _cargar_catalogo(sucursal, id_suc))
+
+
+def _indice_stock(sucursal, filas, etiqueta):
+    indice = _indices.get((sucursal, etiqueta))
+    if indice is None:
+        indice = {f[0]: f[4] for f in filas}
+        _indices.set((sucursal, etiqueta), indice)
+    return indice
+
+
+def _producto(fila):
+    return {'id': fila[0], 'nombre': fila[1], 'marca': fila[2], 'precio': float(fila[3]), 'stock': fila[4]}
+
+
+def _codificacion():
+    """Mejor codificación aceptada por el cliente entre br, gzip e identidad."""
+    aceptadas = request.accept_encodings
+    if brotli is not None and aceptadas['br']:
+        return 'br'
+    if aceptadas['gzip']:
+        return 'gzip'
+    return None
+
+
+def _comprimir(cuerpo, codificacion):
+    if codificacion == 'br':
+        return brotli.compress(cuerpo, quality=5)
+    return gzip.compress(cuerpo, compresslevel=6)
+
+
+def _respuesta(etag, construir):
+    """Respuesta JSON condicional (304 si el cliente ya tiene `etag`) y comprimida.
+
+    `construir()` devuelve el objeto a serializar; solo se llama si el cuerpo no está en caché.
+    """
+    if request.if_none_match.contains_weak(etag):
+        respuesta = Response(status=304)
+    else:
+        codificacion = _codificacion()
+        clave = (etag, codificacion)
+        cuerpo = _cuerpos.get(clave)
+        if cuerpo is None:
+            cuerpo = _cuerpos.get((etag, None))
+            if cuerpo is None:
+                cuerpo = json.dumps(construir(), ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+                _cuerpos.set((etag, None), cuerpo)
+            if codificacion and len(cuerpo) >= API_COMPRESS_MIN_BYTES:
+                cuerpo = _comprimir(cuerpo, codificacion)
+                _cuerpos.set(clave, cuerpo)
+            else:
+                codificacion = None
+        respuesta = Response(cuerpo, mimetype='application/json')
+        if codificacion:
+            respuesta.headers['Content-Encoding'] = codificacion
+
+    # ETag débil: vale para todas las codificaciones del mismo contenido
+    respuesta.set_etag(etag, weak=True)
+    respuesta.headers['Cache-Control'] = 'no-cache'   # El cliente siempre revalida (barato: 304)
+    respuesta.vary.add('Accept-Encoding')
+    return respuesta
+
+
+# ==============================================================================
+# CATÁLOGO Y STOCK
+# ==============================================================================
+@api_bp.route('/productos')
+def productos():
+    """Catálogo con el stock de la sucursal (?sucursal=, por defecto la de la sesión)."""
+    sucursal = request.args.get('sucursal') or session.get('sucursal', 'Quito')
+    if sucursal not in NODOS:
+        return jsonify(error=f"Sucursal desconocida: {sucursal}"), 400
+
+    # Versión del feed leída ANTES del catálogo: los cambios posteriores llegan por /stock/cambios
+    version = stock_feed.version(sucursal)
+    try:
+        filas, etiqueta = _catalogo(sucursal)
+    except Exception as e:
+        return jsonify(error=f"Error de conexión: {str(e)}"), 503
+
+    respuesta = _respuesta(f"productos-{sucursal}-{etiqueta}",
+                           lambda: {'sucursal': sucursal, 'productos': [_producto(f) for f in filas]})
+    respuesta.headers['X-Stock-Version'] = str(version)
+    return respuesta
+
+
+@api_bp.route('/stock/cambios')
+def stock_cambios():
+    """Long-polling del feed de stock: ?sucursal=&since=<versión>&espera=<segundos>.
+
+    Sin `since` devuelve la versión actual. Con reset=true el cliente debe recargar /api/productos.
+    """
+    sucursal = request.args.get('sucursal') or session.get('sucursal', 'Quito')
+    if sucursal not in NODOS:
+        return jsonify(error=f"Sucursal desconocida: {sucursal}"), 400
+    since = request.args.get('since', type=int)
+    if since is None:
+        return jsonify(version=stock_feed.version(sucursal), cambios=[], reset=False)
+    espera = min(max(request.args.get('espera', STOCK_FEED_POLL_MAX, type=float), 0), STOCK_FEED_POLL_MAX)
+
+    resultado = stock_feed.desde(sucursal, since, espera)
+    if resultado is None:
+        # Todas las esperas ocupadas: no bloqueamos otro hilo del servidor
+        respuesta = jsonify(error="Demasiadas esperas en curso, reintenta.")
+        respuesta.status_code = 429
+        respuesta.headers['Retry-After'] = '5'
+        return respuesta
+
+    return jsonify(version=resultado['version'], reset=resultado['reset'],
+                   cambios=[{'version': v, 'id': i, 'stock': c} for v, i, c in resultado['cambios']])
+
+
+@api_bp.route('/carrito', methods=['GET', 'PUT'])
+def carrito():
+    """Carrito guardado en la sesión (y en la cuenta del cliente, si inició sesión)."""
+    if request.method == 'PUT':
+        try:
+            guardar_carrito(normalizar_items(request.get_json(silent=True)))
+        except ValueError as e:
+            return jsonify(error=str(e)), 400
+    return jsonify(items=leer_carrito())
+
+
+@api_bp.route('/stock/<int:id_producto>')
+def stock(id_producto):
+    """Stock de un producto en cada sede. Si una sede no responde se informa y no se envía ETag."""
+    por_sede, caidos, etiquetas = {}, {}, []
+    for sucursal in NODOS:
+        try:
+            filas, etiqueta = _catalogo(sucursal)
+        except Exception as e:
+            caidos[sucursal] = str(e)
+            continue
+        etiquetas.append(f"{sucursal}.{etiqueta}")
+        cantidad = _indice_stock(sucursal, filas, etiqueta).get(id_producto)
+        if cantidad is not None:
+            por_sede[sucursal] = cantidad
+
+    if not por_sede and not caidos:
+        return jsonify(error=f"Producto {id_producto} no encontrado"), 404
+    if caidos:
+        return jsonify(id=id_producto, stock=por_sede, nodos_caidos=caidos)
+
+    return _respuesta(f"stock-{id_producto}-{'-'.join(etiquetas)}",
+                      lambda: {'id': id_producto, 'stock': por_sede})
\ No newline at end of file
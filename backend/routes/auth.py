@@ -1,75 +1,112 @@
 # backend/routes/auth.py
 from flask import Blueprint, render_template, request, redirect, url_for, session
-from backend.database import get_db_connection
+from backend.cache import clave_identidad, identidad_cache, normalizar_correo
+from backend.config import FANOUT_TIMEOUT, IDENTIDAD_CACHE_TTL_NEGATIVO, LOGIN_HINT_TIMEOUT
+from backend.fanout import fan_out
+from backend.sessions import recuperar_carrito, rotar_sid
 
 auth_bp = Blueprint('auth', __name__)
 
+_FALTA = object()
+
+
+def _buscar_identidad(cursor, tabla, nodo, correo):
+    """(Id, nombre) de EMPLEADO o CLIENTE por correo, o None. Guarda el resultado en identidad_cache."""
+    columna_id = 'Id_empleado' if tabla == 'EMPLEADO' else 'Id_cliente'
+    cursor.execute(f"SELECT {columna_id}, nombre FROM {tabla} WHERE correo = ?", (correo,))
+    fila = cursor.fetchone()
+    fila = tuple(fila) if fila else None
+    identidad_cache.set(clave_identidad(tabla, nodo, correo), fila,
+                        ttl=None if fila else IDENTIDAD_CACHE_TTL_NEGATIVO)
+    return fila
+
+
+def _identidad_en_cache(nodo, correo, con_cliente):
+    """(empleado, cliente) desde identidad_cache, o None si falta alguna búsqueda."""
+    empleado = identidad_cache.get(clave_identidad('EMPLEADO', nodo, correo), _FALTA)
+    if empleado is _FALTA:
+        return None
+    if empleado or not con_cliente:
+        return empleado, None
+    cliente = identidad_cache.get(clave_identidad('CLIENTE', nodo, correo), _FALTA)
+    if cliente is _FALTA:
+        return None
+    return None, cliente
+
 @auth_bp.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
-        correo = request.form['correo']
+        # Una sola forma del correo para la consulta y para la clave del caché
+        correo = normalizar_correo(request.form['correo'])
         sucursal_seleccionada = request.form['sucursal']
         
         # Guardamos la elección en sesión
         session['sucursal'] = sucursal_seleccionada
         
-        try:
-            # 1. Intentamos conectar a la sede seleccionada
-            conn = get_db_connection(sucursal_seleccionada)
+        otra_sede = 'Guayaquil' if sucursal_seleccionada == 'Quito' else 'Quito'
+
+        def buscar(nodo, conn):
             cursor = conn.cursor()
-            
             # --- VALIDACIÓN DE EMPLEADO (ADMIN) ---
-            cursor.execute("SELECT Id_empleado, nombre FROM EMPLEADO WHERE correo = ?", (correo,))
-            empleado = cursor.fetchone()
-            
-            if empleado:
-                # ¡Éxito! Es empleado de esta sede
-                session['user_id'] = empleado[0]
-                session['user_name'] = empleado[1]
-                session['user_role'] = 'admin'
-                session['assigned_branch'] = sucursal_seleccionada 
-                
-                conn.close()
-                return redirect(url_for('views.dashboard'))
-            
+            empleado = _buscar_identidad(cursor, 'EMPLEADO', nodo, correo)
+            if nodo == otra_sede or empleado:
+                return empleado, None
+
             # --- VALIDACIÓN DE CLIENTE (GLOBAL) ---
             # Los clientes son globales, así que deberían poder entrar en cualquier lado
-            cursor.execute("SELECT Id_cliente, nombre FROM CLIENTE WHERE correo = ?", (correo,))
-            cliente = cursor.fetchone()
-            
-            if cliente:
-                session['user_id'] = cliente[0]
-                session['user_name'] = cliente[1]
-                session['user_role'] = 'cliente'
-                session['user_email'] = correo
-                conn.close()
-                return redirect(url_for('views.index'))
-
-            conn.close()
-
-            # --- INTELIGENCIA DE ERROR: ¿ESTÁ EN LA OTRA SEDE? ---
-            # Si llegamos aquí, no se encontró en la sede seleccionada.
-            # Vamos a buscar en la "otra" sede para dar un mensaje útil.
-            
-            otra_sede = 'Guayaquil' if sucursal_seleccionada == 'Quito' else 'Quito'
-            try:
-                conn_otra = get_db_connection(otra_sede)
-                cursor_otra = conn_otra.cursor()
-                cursor_otra.execute("SELECT nombre FROM EMPLEADO WHERE correo = ?", (correo,))
-                empleado_otro = cursor_otra.fetchone()
-                conn_otra.close()
-
-                if empleado_otro:
-                    return render_template('login.html', 
-                        error=f"⚠️ Error de Sede: El usuario '{empleado_otro[0]}' pertenece a {otra_sede}. Cambia la opción en el selector.")
-            except:
-                pass # Si falla la conexión a la otra sede, ignoramos esta validación extra.
-
-            # Si no está en ninguna parte
-            return render_template('login.html', error="❌ Credenciales incorrectas o usuario no registrado.")
-            
-        except Exception as e:
-            return render_template('login.html', error=f"Error de conexión con {sucursal_seleccionada}: {str(e)}")
+            return None, _buscar_identidad(cursor, 'CLIENTE', nodo, correo)
+
+        # 1. Sede seleccionada: caché de identidades (también recuerda los correos que no
+        #    existen) y, si falta, la base. Con respuesta positiva el login no espera a nadie más.
+        propio = _identidad_en_cache(sucursal_seleccionada, correo, con_cliente=True)
+        if propio is None:
+            res = fan_out(buscar, [sucursal_seleccionada], timeout=FANOUT_TIMEOUT)[sucursal_seleccionada]
+            if not res.ok:
+                return render_template('login.html', error=f"Error de conexión con {sucursal_seleccionada}: {res.error}")
+            propio = res.valor
+
+        # 2. La otra sede solo sirve para el aviso de sede equivocada: se consulta únicamente
+        #    si aquí no se encontró al usuario, y con su propio límite corto.
+        otro = None
+        if not any(propio):
+            otro = _identidad_en_cache(otra_sede, correo, con_cliente=False)
+            if otro is None:
+                res = fan_out(buscar, [otra_sede], timeout=LOGIN_HINT_TIMEOUT)[otra_sede]
+                if res.ok:
+                    otro = res.valor
+
+        empleado, cliente = propio
+
+        # Sesión nueva al autenticarse: el id que traía el navegador deja de valer
+        if empleado or cliente:
+            rotar_sid()
+
+        if empleado:
+            # ¡Éxito! Es empleado de esta sede
+            session['user_id'] = empleado[0]
+            session['user_name'] = empleado[1]
+            session['user_role'] = 'admin'
+            session['assigned_branch'] = sucursal_seleccionada 
+            return redirect(url_for('views.dashboard'))
+        
+        if cliente:
+            session['user_id'] = cliente[0]
+            session['user_name'] = cliente[1]
+            session['user_role'] = 'cliente'
+            session['user_email'] = correo
+            # Carrito guardado desde otro dispositivo + el que ya tenía en este
+            recuperar_carrito()
+            return redirect(url_for('views.index'))
+
+        # --- INTELIGENCIA DE ERROR: ¿ESTÁ EN LA OTRA SEDE? ---
+        # No se encontró en la sede seleccionada. Si la otra sede falló, simplemente no damos el aviso.
+        empleado_otro = otro[0] if otro else None
+        if empleado_otro:
+            return render_template('login.html', 
+                error=f"⚠️ Error de Sede: El usuario '{empleado_otro[1]}' pertenece a {otra_sede}. Cambia la opción en el selector.")
+
+        # Si no está en ninguna parte
+        return render_template('login.html', error="❌ Credenciales incorrectas o usuario no registrado.")
 
     return render_template('login.html')
 
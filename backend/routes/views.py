@@ -1,6 +1,22 @@
 # backend/routes/views.py
-from flask import Blueprint, redirect, render_template, session, request, url_for
-from backend.database import get_db_connection
+from datetime import datetime
+
+from flask import Blueprint, Response, jsonify, redirect, render_template, session, request, url_for
+from backend.database import db_connection, node_status, nodo_disponible, pool_stats
+from backend.export import generar_csv, generar_xlsx, iterar_filas
+from backend.cache import catalog_cache, identidad_cache, perfil_cache
+from backend.checkout import checkout_stats
+from backend.config import NODOS, PERFIL_PAGE_SIZE
+from backend.fanout import fanout_stats
+from backend.jobs import runner
+from backend.order_journal import diario_ventas, nueva_clave
+from backend.pagination import TablaSpec, paginar, paginar_nodos, quote_ident, safe_table_name
+from backend.reconciliation import INCIDENCIAS, conciliador
+from backend.reports import report_store
+from backend.search import indice_busqueda
+from backend.sessions import confirmar_compra, leer_carrito, session_stats
+from backend.stock_feed import stock_feed
+from backend.templating import fragment_cache
 
 # --- CONFIGURACIÓN ---
 views_bp = Blueprint('views', __name__)
@@ -8,36 +24,177 @@ views_bp = Blueprint('views', __name__)
 ID_QUITO = 1
 ID_GUAYAQUIL = 2
 
+# Clave primaria de las tablas simples (permite paginar por búsqueda en vez de OFFSET)
+CLAVES_TABLAS = {'CLIENTE': 'Id_cliente', 'EMPLEADO': 'Id_empleado'}
+
 # ==============================================================================
 # 1. VISTA PÚBLICA (Catálogo)
 # ==============================================================================
+def _cargar_catalogo(sucursal, id_suc_actual):
+    """Productos con el stock de la sucursal (consulta al nodo remoto)."""
+    with db_connection(sucursal) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT P.Id_producto, P.nombre, P.marca, P.precio, ISNULL(I.cantidad, 0) as cantidad 
+            FROM PRODUCTO P
+            LEFT JOIN INVENTARIO I ON P.Id_producto = I.Id_producto AND I.Id_sucursal = ?
+        """, (id_suc_actual,))
+        return cursor.fetchall()
+
 @views_bp.route('/')
 def index():
     """Página principal: Muestra productos con stock según la sucursal seleccionada."""
     sucursal = session.get('sucursal', 'Quito')
     id_suc_actual = ID_QUITO if sucursal == 'Quito' else ID_GUAYAQUIL
     productos = []
+    version_catalogo = None   # Sin versión (copia de respaldo) los fragmentos no se cachean
     error_msg = request.args.get('error')
+    version_stock = stock_feed.version(sucursal)   # Antes del catálogo: cursor del feed de stock
+    # Con el nodo caído se sigue vendiendo: los pedidos esperan en el diario (order_journal.py)
+    nodo_caido = not nodo_disponible(sucursal)
 
-    conn = None
     try:
-        conn = get_db_connection(sucursal)
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT P.Id_producto, P.nombre, P.marca, P.precio, ISNULL(I.cantidad, 0) as cantidad 
-            FROM PRODUCTO P
-            LEFT JOIN INVENTARIO I ON P.Id_producto = I.Id_producto AND I.Id_sucursal = ?
-        """, (id_suc_actual,))
-        productos = cursor.fetchall()
+        # El catálogo cambia poco: se sirve desde caché y solo se consulta el nodo al expirar
+        productos, version_catalogo = catalog_cache.get_etiquetado(
+            sucursal, lambda: _cargar_catalogo(sucursal, id_suc_actual))
     except Exception as e:
         error_msg = f"Error de conexión: {str(e)}"
-    finally:
-        if conn: conn.close()
-    return render_template('index.html', productos=productos, sucursal=sucursal, error=error_msg)
+        # Nodo caído: última copia del catálogo (aunque esté vieja)
+        productos = catalog_cache.ultimo(sucursal) or []
+        nodo_caido = True
+
+    # Pedidos que quedaron en cola (nodo lento o caído): se muestran hasta que se resuelven.
+    # Antes del carrito: al confirmarse uno recién entonces se vacía (y entra el cliente nuevo)
+    pedidos = []
+    if session.get('pedidos'):
+        seguidos = []
+        for seguido in session['pedidos']:
+            pedido = diario_ventas.estado(seguido['clave'])
+            if pedido is None:
+                continue
+            pedidos.append(pedido)
+            if pedido['estado'] == 'pendiente':
+                seguidos.append(seguido)
+            elif pedido['estado'] == 'aplicado':
+                confirmar_compra(seguido['id_cliente'], seguido['nombre'])
+        if seguidos != session['pedidos']:
+            session['pedidos'] = seguidos
+
+    # Carrito guardado en la sesión, con el stock de esta sucursal como tope
+    stock = {str(p[0]): p[4] for p in productos}
+    carrito = []
+    for item in leer_carrito():
+        disponible = stock.get(item['id'], 0)
+        if disponible > 0:
+            carrito.append(dict(item, stockMax=disponible, cantidad=min(item['cantidad'], disponible)))
+
+    return render_template('index.html', productos=productos, sucursal=sucursal, error=error_msg,
+                           version_stock=version_stock, nodo_caido=nodo_caido, carrito=carrito,
+                           version_catalogo=version_catalogo, pedidos=pedidos, clave_pedido=nueva_clave())
+
+@views_bp.route('/buscar')
+def buscar():
+    """Búsqueda en el catálogo de la sucursal: ?q=&marca=&en_stock=1.
+
+    Se resuelve en el índice en memoria (backend/search.py); la base solo se consulta
+    cuando catalog_cache recarga el catálogo.
+    """
+    sucursal = session.get('sucursal', 'Quito')
+    id_suc_actual = ID_QUITO if sucursal == 'Quito' else ID_GUAYAQUIL
+    try:
+        filas, etiqueta = catalog_cache.get_etiquetado(sucursal, lambda: _cargar_catalogo(sucursal, id_suc_actual))
+    except Exception as e:
+        return jsonify(error=f"Error de conexión: {str(e)}"), 503
+
+    resultado = indice_busqueda.buscar(sucursal, filas, etiqueta, request.args.get('q', ''),
+                                       marca=request.args.get('marca'),
+                                       en_stock=request.args.get('en_stock') == '1')
+    return jsonify(resultado)
 
 # ==============================================================================
 # 2. VISTA ADMINISTRADOR (Dashboard)
 # ==============================================================================
+def _spec_dashboard(tabla, sucursal, id_suc_actual):
+    """Consulta base (sin ORDER BY) de cada pestaña del dashboard."""
+    if tabla == 'PRODUCTO':
+        return TablaSpec("""
+            SELECT 
+                P.Id_producto, P.nombre, P.marca, P.precio, 
+                ISNULL(I.cantidad, 0) as Stock,
+                ? as Bodega
+            FROM PRODUCTO P
+            LEFT JOIN INVENTARIO I ON P.Id_producto = I.Id_producto AND I.Id_sucursal = ?
+        """, (sucursal, id_suc_actual), key='Id_producto', tabla_base='PRODUCTO')
+
+    if tabla == 'SUCURSAL':
+        return TablaSpec("SELECT Id_sucursal, nombre, direccion, ciudad FROM SUCURSAL",
+                         key='Id_sucursal', tabla_base='SUCURSAL')
+
+    if tabla == 'LOGISTICA':
+        if sucursal == 'Guayaquil':
+            # GUAYAQUIL: Tabla local TRANSFERENCIA_ENVIO
+            return TablaSpec("""
+                SELECT E.Id_envio, P.nombre, E.cantidad, E.fecha_envio, E.estado 
+                FROM TRANSFERENCIA_ENVIO E
+                JOIN PRODUCTO P ON E.Id_producto = P.Id_producto
+            """, key='Id_envio', default_dir='DESC', tabla_base='TRANSFERENCIA_ENVIO')
+        # QUITO: Usamos una consulta unificada local
+        return TablaSpec("""
+            SELECT 
+                E.Id_envio, 
+                P.nombre, 
+                E.cantidad, 
+                E.fecha_envio,
+                CASE 
+                    WHEN R.Id_recepcion IS NOT NULL THEN 'RECIBIDO' 
+                    ELSE 'EN CAMINO' 
+                END as Estado_Local
+            FROM TRANSFERENCIA_ENVIO E
+            JOIN PRODUCTO P ON E.Id_producto = P.Id_producto
+            LEFT JOIN TRANSFERENCIA_RECEPCION R ON E.Id_envio = R.Id_envio_original
+        """, key='Id_envio', default_dir='DESC', tabla_base='TRANSFERENCIA_ENVIO')
+
+    # Tablas simples (CLIENTE, EMPLEADO, ...): el nombre viene de la URL, se valida
+    tabla = safe_table_name(tabla)
+    return TablaSpec(f"SELECT * FROM {quote_ident(tabla)}", key=CLAVES_TABLAS.get(tabla), tabla_base=tabla)
+
+def _specs_globales(tabla):
+    """Pestañas globales: la misma consulta sobre la parte local de cada nodo, en paralelo.
+
+    Cada fila queda etiquetada con la Sede del nodo que la devolvió. Reemplaza a las vistas
+    V_INVENTARIO_GLOBAL_DETALLADO / V_REPORTE_VENTAS_DETALLADO, que cruzaban por el
+    servidor vinculado y fallaban enteras si el otro nodo no respondía.
+    """
+    if tabla == 'INVENTARIO':
+        return {nodo: TablaSpec("""
+            SELECT 
+                ? as Sede,
+                P.Id_producto,
+                P.nombre as Producto,
+                P.marca as Marca,
+                I.cantidad as Stock
+            FROM INVENTARIO I
+            JOIN PRODUCTO P ON I.Id_producto = P.Id_producto
+            WHERE I.Id_sucursal = ?
+        """, (nodo, cfg['id_sucursal']), default_sort='Id_producto') for nodo, cfg in NODOS.items()}
+
+    if tabla == 'FACTURA':
+        return {nodo: TablaSpec("""
+            SELECT 
+                F.fecha as Fecha,
+                ? as Sede,
+                P.nombre as Producto,
+                D.cantidad as Cant,
+                D.precio_unidad as 'P.Unit',
+                D.subtotal as Total
+            FROM FACTURA F
+            JOIN DETALLE_FACTURA D ON D.Id_factura = F.Id_factura AND D.Id_sucursal = F.Id_sucursal
+            JOIN PRODUCTO P ON D.Id_producto = P.Id_producto
+            WHERE F.Id_sucursal = ?
+        """, (nodo, cfg['id_sucursal']), default_sort='Fecha', default_dir='DESC') for nodo, cfg in NODOS.items()}
+
+    return None
+
 @views_bp.route('/dashboard')
 def dashboard():
     if session.get('user_role') != 'admin':
@@ -51,92 +208,135 @@ def dashboard():
 
     datos = []
     columnas = []
+    pagina = None
+    incidencias = []
 
-    conn = None
     try:
-        conn = get_db_connection(sucursal)
-        cursor = conn.cursor()
-        
-        if tabla == 'PRODUCTO':
-            cursor.execute("""
-                SELECT 
-                    P.Id_producto, P.nombre, P.marca, P.precio, 
-                    ISNULL(I.cantidad, 0) as Stock,
-                    ? as Bodega
-                FROM PRODUCTO P
-                LEFT JOIN INVENTARIO I ON P.Id_producto = I.Id_producto AND I.Id_sucursal = ?
-            """, (sucursal, id_suc_actual))
-
-        elif tabla == 'SUCURSAL':
-            cursor.execute("SELECT Id_sucursal, nombre, direccion, ciudad FROM SUCURSAL")
-
-        elif tabla == 'LOGISTICA':
-            if sucursal == 'Guayaquil':
-                # GUAYAQUIL: Tabla local TRANSFERENCIA_ENVIO
-                cursor.execute("""
-                    SELECT E.Id_envio, P.nombre, E.cantidad, E.fecha_envio, E.estado 
-                    FROM TRANSFERENCIA_ENVIO E
-                    JOIN PRODUCTO P ON E.Id_producto = P.Id_producto
-                    ORDER BY E.Id_envio DESC
-                """)
-            else:
-                # QUITO: Usamos una consulta unificada local
-                cursor.execute("""
-                    SELECT 
-                        E.Id_envio, 
-                        P.nombre, 
-                        E.cantidad, 
-                        E.fecha_envio,
-                        CASE 
-                            WHEN R.Id_recepcion IS NOT NULL THEN 'RECIBIDO' 
-                            ELSE 'EN CAMINO' 
-                        END as Estado_Local
-                    FROM TRANSFERENCIA_ENVIO E
-                    JOIN PRODUCTO P ON E.Id_producto = P.Id_producto
-                    LEFT JOIN TRANSFERENCIA_RECEPCION R ON E.Id_envio = R.Id_envio_original
-                    ORDER BY E.Id_envio DESC
-                """)
-
-        elif tabla == 'INVENTARIO':
-            # [CORRECCIÓN]: Usamos la vista detallada nueva
-            cursor.execute("SELECT * FROM V_INVENTARIO_GLOBAL_DETALLADO")
-
-        elif tabla == 'FACTURA':
-            # [CORRECCIÓN]: Usamos la vista detallada nueva
-            cursor.execute("""
-                SELECT 
-                    fecha as Fecha,
-                    Sede,
-                    Producto,
-                    cantidad as Cant,
-                    precio_unidad as 'P.Unit',
-                    subtotal as Total
-                FROM V_REPORTE_VENTAS_DETALLADO 
-                ORDER BY fecha DESC
-            """)
-
+        specs = _specs_globales(tabla)
+        if specs:
+            # Reportes globales: copia local actualizada en segundo plano. Mientras no
+            # exista, consulta en vivo a todos los nodos a la vez.
+            resultado = report_store.paginar(tabla, request.args)
+            if resultado is None:
+                resultado = paginar_nodos(specs, request.args, tabla)
+            columnas, datos, pagina = resultado
+            if pagina['nodos_caidos']:
+                error_msg = "Datos parciales, sin respuesta de: " + ', '.join(
+                    f"{nodo} ({err})" for nodo, err in pagina['nodos_caidos'].items())
         else:
-            cursor.execute(f"SELECT * FROM {tabla}")
-            
-        if cursor.description:
-            columnas = [col[0] for col in cursor.description]
-            datos = cursor.fetchall()
-            
+            spec = _spec_dashboard(tabla, sucursal, id_suc_actual)
+            with db_connection(sucursal) as conn:
+                # Orden, filtro y página se resuelven en SQL: nunca traemos la tabla completa
+                columnas, datos, pagina = paginar(conn.cursor(), spec, request.args, (sucursal, tabla))
+
     except Exception as e:
         error_msg = f"Error al cargar {tabla}: {str(e)}"
-    finally:
-        if conn: conn.close()
+
+    if tabla == 'LOGISTICA':
+        # La conciliación corre en segundo plano; aquí solo se leen sus incidencias abiertas
+        conciliador.asegurar_iniciado()
+        incidencias = conciliador.incidencias()
 
     return render_template('dashboard.html', 
                            datos=datos, 
                            columnas=columnas, 
                            sucursal=sucursal, 
                            tabla_activa=tabla, 
+                           pagina=pagina,
+                           incidencias=incidencias,
+                           tipos_incidencia=INCIDENCIAS,
                            error=error_msg)
 
+@views_bp.route('/dashboard/exportar')
+def exportar():
+    """Descarga la pestaña (con su filtro y orden) en CSV o Excel, leyendo por bloques."""
+    if session.get('user_role') != 'admin':
+        return redirect(url_for('auth.login'))
+
+    sucursal = session.get('sucursal', 'Quito')
+    tabla = request.args.get('tabla', 'PRODUCTO')
+    formato = 'xlsx' if request.args.get('formato') == 'xlsx' else 'csv'
+    id_suc_actual = ID_GUAYAQUIL if sucursal == 'Guayaquil' else ID_QUITO
+
+    try:
+        specs = _specs_globales(tabla)
+        if specs:
+            fuentes = [(nodo, spec, (tabla, nodo)) for nodo, spec in specs.items()]
+        else:
+            fuentes = [(sucursal, _spec_dashboard(tabla, sucursal, id_suc_actual), (sucursal, tabla))]
+        bloques = iterar_filas(fuentes, request.args.to_dict())
+        columnas = next(bloques)
+    except Exception as e:
+        return redirect(url_for('views.dashboard', tabla=tabla, error=f"Error al exportar {tabla}: {str(e)}"))
+
+    nombre = f"{tabla}_{sucursal}_{datetime.now():%Y%m%d_%H%M}"
+    if formato == 'xlsx':
+        cuerpo = generar_xlsx(columnas, bloques, hoja=tabla)
+        mimetype = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    else:
+        cuerpo = generar_csv(columnas, bloques)
+        mimetype = 'text/csv'   # Flask añade '; charset=utf-8'
+    return Response(cuerpo, mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename="{nombre}.{formato}"',
+                             'X-Accel-Buffering': 'no'})
+
 # ==============================================================================
 # 3. VISTA CLIENTE (Perfil)
 # ==============================================================================
+def _cargar_historial(cursor, id_cliente, id_suc_actual, antes=None):
+    """Una página de facturas (más recientes primero) con sus detalles, en una sola consulta.
+
+    `antes` es el Id_factura de la última factura ya mostrada (paginación por búsqueda).
+    Devuelve (facturas, id_para_la_siguiente_pagina o None).
+    """
+    cruce, seek, params = '', '', []
+    if antes is not None:
+        cruce = "CROSS JOIN (SELECT fecha, Id_factura FROM FACTURA WHERE Id_factura = ? AND Id_sucursal = ?) X"
+        seek = "AND (F.fecha < X.fecha OR (F.fecha = X.fecha AND F.Id_factura < X.Id_factura))"
+        params += [antes, id_suc_actual]
+    # Pedimos una factura extra para saber si hay más páginas
+    params += [id_cliente, id_suc_actual, PERFIL_PAGE_SIZE + 1, id_suc_actual]
+
+    cursor.execute(f"""
+        WITH F AS (
+            SELECT F.Id_factura, F.fecha, F.total
+            FROM FACTURA F {cruce}
+            WHERE F.Id_cliente = ? AND F.Id_sucursal = ? {seek}
+            ORDER BY F.fecha DESC, F.Id_factura DESC
+            OFFSET 0 ROWS FETCH NEXT ? ROWS ONLY
+        )
+        SELECT F.Id_factura, F.fecha, F.total, P.nombre, P.marca, D.cantidad, D.precio_unidad, D.subtotal
+        FROM F
+        LEFT JOIN (DETALLE_FACTURA D JOIN PRODUCTO P ON D.Id_producto = P.Id_producto)
+            ON D.Id_factura = F.Id_factura AND D.Id_sucursal = ?
+        ORDER BY F.fecha DESC, F.Id_factura DESC
+    """, params)
+
+    # Agrupamos las filas planas por factura (vienen ordenadas)
+    facturas = []
+    for row in cursor.fetchall():
+        if not facturas or facturas[-1]['id'] != row[0]:
+            facturas.append({'id': row[0], 'fecha': row[1], 'total': row[2], 'productos': []})
+        if row[3] is not None:
+            facturas[-1]['productos'].append(tuple(row[3:]))
+
+    siguiente = None
+    if len(facturas) > PERFIL_PAGE_SIZE:
+        facturas = facturas[:PERFIL_PAGE_SIZE]
+        siguiente = facturas[-1]['id']
+    return facturas, siguiente
+
+def _historial_html(cursor, sucursal, id_cliente, id_suc_actual, antes=None):
+    """Página del historial ya renderizada; se reutiliza hasta que el cliente vuelva a comprar."""
+    clave = (sucursal, str(id_cliente), antes)
+    html = perfil_cache.get(clave)
+    if html is None:
+        facturas, siguiente = _cargar_historial(cursor, id_cliente, id_suc_actual, antes)
+        html = render_template('perfil_facturas.html', facturas=facturas, siguiente=siguiente,
+                               primera_pagina=antes is None)
+        perfil_cache.set(clave, html)
+    return html
+
 @views_bp.route('/perfil')
 def perfil():
     """Perfil de Usuario: Datos personales e historial de compras."""
@@ -150,52 +350,114 @@ def perfil():
     id_suc_actual = ID_QUITO if sucursal == 'Quito' else ID_GUAYAQUIL
 
     cliente_info = None
-    historial_facturas = []
+    historial = ''
 
-    conn = None
     try:
-        conn = get_db_connection(sucursal)
-        cursor = conn.cursor()
+        with db_connection(sucursal) as conn:
+            cursor = conn.cursor()
 
-        # [CORRECCIÓN AQUI] 
-        # Quitamos "AND Id_sucursal = ?". 
-        # Buscamos al cliente por su ID sin importar donde se registró.
-        cursor.execute("SELECT * FROM CLIENTE WHERE Id_cliente = ?", (id_cliente,))
-        cliente_info = cursor.fetchone()
+            # [CORRECCIÓN AQUI] 
+            # Quitamos "AND Id_sucursal = ?". 
+            # Buscamos al cliente por su ID sin importar donde se registró.
+            cursor.execute("SELECT * FROM CLIENTE WHERE Id_cliente = ?", (id_cliente,))
+            cliente_info = cursor.fetchone()
 
-        # B. Historial: Cabeceras de Factura
-        # Aquí SI mantenemos el filtro de sucursal para ver solo compras en ESTA tienda.
-        cursor.execute("""
-            SELECT Id_factura, fecha, total 
-            FROM FACTURA 
-            WHERE Id_cliente = ? AND Id_sucursal = ?
-            ORDER BY fecha DESC
-        """, (id_cliente, id_suc_actual))
-        facturas_raw = cursor.fetchall()
-
-        # C. Historial: Detalles (Productos por factura)
-        for f in facturas_raw:
-            id_fact = f[0]
-            cursor.execute("""
-                SELECT P.nombre, P.marca, D.cantidad, D.precio_unidad, D.subtotal
-                FROM DETALLE_FACTURA D
-                JOIN PRODUCTO P ON D.Id_producto = P.Id_producto
-                WHERE D.Id_factura = ? AND D.Id_sucursal = ?
-            """, (id_fact, id_suc_actual))
-            
-            historial_facturas.append({
-                'id': id_fact,
-                'fecha': f[1],
-                'total': f[2],
-                'productos': cursor.fetchall()
-            })
+            # B. Historial: primera página de facturas + detalles
+            # Aquí SI mantenemos el filtro de sucursal para ver solo compras en ESTA tienda.
+            historial = _historial_html(cursor, sucursal, id_cliente, id_suc_actual)
 
     except Exception as e:
         print(f"Error en perfil: {e}")
-    finally:
-        if conn: conn.close()
 
     return render_template('profile.html', 
                            cliente=cliente_info, 
-                           facturas=historial_facturas, 
-                           sucursal=sucursal)
\ No newline at end of file
+                           historial=historial, 
+                           sucursal=sucursal)
+
+@views_bp.route('/perfil/facturas')
+def perfil_facturas():
+    """Siguiente página del historial ("Cargar más"); devuelve solo el fragmento HTML."""
+    if 'user_id' not in session or session.get('user_role') != 'cliente':
+        return '', 401
+
+    sucursal = session.get('sucursal', 'Quito')
+    id_suc_actual = ID_QUITO if sucursal == 'Quito' else ID_GUAYAQUIL
+    antes = request.args.get('antes', type=int)
+
+    try:
+        with db_connection(sucursal) as conn:
+            return _historial_html(conn.cursor(), sucursal, session['user_id'], id_suc_actual, antes)
+    except Exception as e:
+        print(f"Error en perfil: {e}")
+        return '<div class="text-center text-danger small p-3">No se pudo cargar el historial.</div>', 500
+
+# ==============================================================================
+# 4. ESTADO INTERNO (Solo Admin)
+# ==============================================================================
+@views_bp.route('/estado/pool')
+def estado_pool():
+    """Contadores del pool de conexiones por nodo (hits, misses, esperas...)."""
+    if session.get('user_role') != 'admin':
+        return redirect(url_for('auth.login'))
+    return jsonify(pool_stats())
+
+@views_bp.route('/estado/cache')
+def estado_cache():
+    """Contadores de los cachés en memoria (hits, recargas, invalidaciones)."""
+    if session.get('user_role') != 'admin':
+        return redirect(url_for('auth.login'))
+    return jsonify(catalogo=catalog_cache.stats(), perfil=perfil_cache.stats(), reportes=report_store.stats(),
+                   stock_feed=stock_feed.stats(), identidad=identidad_cache.stats(), sesiones=session_stats(),
+                   busqueda=indice_busqueda.stats(), fragmentos=fragment_cache.stats())
+
+@views_bp.route('/trabajos/<id_trabajo>')
+def estado_trabajo(id_trabajo):
+    """Estado de un trabajo en segundo plano (el dashboard lo consulta hasta que termina)."""
+    if session.get('user_role') != 'admin':
+        return jsonify(error="Acceso denegado."), 403
+    trabajo = runner.estado(id_trabajo)
+    if trabajo is None:
+        return jsonify(error="Trabajo no encontrado."), 404
+    if trabajo['tipo'] == 'recibir_lote' and trabajo['estado'] == 'ok':
+        trabajo['detalle'] = url_for('actions.detalle_recepcion_lote', id_trabajo=id_trabajo)
+    return jsonify(trabajo)
+
+@views_bp.route('/estado/trabajos')
+def estado_trabajos():
+    """Cola de trabajos: cuántos hay por estado, en curso por nodo y reintentos."""
+    if session.get('user_role') != 'admin':
+        return redirect(url_for('auth.login'))
+    return jsonify(runner.stats())
+
+@views_bp.route('/estado/nodos')
+def estado_nodos():
+    """Circuito de cada nodo (cerrado / abierto / semiabierto), último error y latencia del monitor."""
+    if session.get('user_role') != 'admin':
+        return redirect(url_for('auth.login'))
+    pools = pool_stats()
+    return jsonify({nodo: pools[nodo]['breaker'] if nodo in pools else {'estado': estado}
+                    for nodo, estado in node_status().items()})
+
+@views_bp.route('/estado/checkout')
+def estado_checkout():
+    """Ventas, reintentos por deadlock y viajes a la base por venta."""
+    if session.get('user_role') != 'admin':
+        return redirect(url_for('auth.login'))
+    return jsonify(dict(checkout_stats(), diario=diario_ventas.stats()))
+
+@views_bp.route('/estado/logistica')
+def estado_logistica():
+    """Última conciliación de envíos entre nodos e incidencias abiertas."""
+    if session.get('user_role') != 'admin':
+        return redirect(url_for('auth.login'))
+    datos = conciliador.stats()
+    datos['incidencias'] = [{'id_envio': i, 'tipo': t, 'detalle': d, 'detectado': str(f)}
+                            for i, t, d, f in conciliador.incidencias(500)]
+    return jsonify(datos)
+
+@views_bp.route('/estado/fanout')
+def estado_fanout():
+    """Respuestas, errores, timeouts y tiempo medio de las consultas en paralelo por nodo."""
+    if session.get('user_role') != 'admin':
+        return redirect(url_for('auth.login'))
+    return jsonify(fanout_stats())
\ No newline at end of file
@@ -0,0 +1,230 @@
+# backend/search.py
+import bisect
+import threading
+import time
+import unicodedata
+from collections import Counter
+
+from .config import BUSQUEDA_MAX_RESULTADOS
+
+# Puntaje por término según cómo coincidió con una palabra del producto
+_EXACTA, _PREFIJO, _APROXIMADA = 3, 2, 1
+
+
+def normalizar(texto):
+    """Minúsculas y sin tildes: 'Audífonos' -> 'audifonos'."""
+    texto = unicodedata.normalize('NFKD', str(texto or '').casefold())
+    return ''.join(c for c in texto if not unicodedata.combining(c))
+
+
+def palabras(texto):
+    return [p for p in ''.join(c if c.isalnum() else ' ' for c in normalizar(texto)).split() if p]
+
+
+def trigramas(palabra):
+    relleno = f"  {palabra} "
+    return {relleno[i:i + 3] for i in range(len(relleno) - 2)}
+
+
+def distancia(a, b, maximo):
+    """Levenshtein con transposiciones (Damerau restringido); corta si supera `maximo`."""
+    if abs(len(a) - len(b)) > maximo:
+        return maximo + 1
+    previa2, previa = None, list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        actual = [i] + [0] * len(b)
+        for j, cb in enumerate(b, 1):
+            actual[j] = min(previa[j] + 1, actual[j - 1] + 1, previa[j - 1] + (ca != cb))
+            if i > 1 and j > 1 and ca == b[j - 2] and a[i - 2] == cb:
+                actual[j] = min(actual[j], previa2[j - 2] + 1)
+        if min(actual) > maximo:
+            return maximo + 1
+        previa2, previa = previa, actual
+    return previa[-1]
+
+
+def _tolerancia(termino):
+    """Errores de tipeo admitidos según el largo del término."""
+    return 0 if len(termino) < 4 else 1 if len(termino) < 8 else 2
+
+
+class IndiceCatalogo:
+    """Índice invertido en memoria del catálogo de una sucursal.
+
+    - palabras -> Id_producto (nombre y marca), con el vocabulario ordenado para
+      buscar por prefijo con bisect.
+    - trigramas -> palabras del vocabulario, para tolerar errores de tipeo.
+    - marca -> Id_producto, para las facetas.
+    Se sincroniza con las filas del catálogo (catalog_cache) comparando por producto:
+    solo se reindexan los que cambiaron.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.etiqueta = None
+        self._docs = {}        # Id_producto -> (nombre, marca, precio, stock, palabras)
+        self._postings = {}    # palabra -> set(Id_producto)
+        self._vocabulario = []  # palabras ordenadas
+        self._trigramas = {}   # trigrama -> set(palabra)
+        self._marcas = {}      # marca -> set(Id_producto)
+        self._counters = {'consultas': 0, 'sincronizaciones': 0, 'reindexados': 0}
+
+    # --- Mantenimiento ---
+    def sincronizar(self, filas, etiqueta):
+        """Aplica las diferencias entre el índice y `filas` (Id_producto, nombre, marca, precio, stock)."""
+        with self._lock:
+            if etiqueta == self.etiqueta:
+                return 0
+            nuevas = {f[0]: (f[1], f[2], float(f[3]), int(f[4] or 0)) for f in filas}
+            cambios = 0
+            for id_prod in [i for i in self._docs if i not in nuevas]:
+                self._quitar(id_prod)
+                cambios += 1
+            for id_prod, (nombre, marca, precio, stock) in nuevas.items():
+                doc = self._docs.get(id_prod)
+                if doc is not None and doc[:2] == (nombre, marca):
+                    if doc[2:4] != (precio, stock):
+                        # Solo cambió precio o stock: no hace falta retokenizar
+                        self._docs[id_prod] = (nombre, marca, precio, stock, doc[4])
+                    continue
+                if doc is not None:
+                    self._quitar(id_prod)
+                self._agregar(id_prod, nombre, marca, precio, stock)
+                cambios += 1
+            self.etiqueta = etiqueta
+            self._counters['sincronizaciones'] += 1
+            self._counters['reindexados'] += cambios
+            return cambios
+
+    def _agregar(self, id_prod, nombre, marca, precio, stock):
+        terminos = set(palabras(nombre)) | set(palabras(marca))
+        self._docs[id_prod] = (nombre, marca, precio, stock, terminos)
+        for palabra in terminos:
+            ids = self._postings.get(palabra)
+            if ids is None:
+                ids = self._postings[palabra] = set()
+                bisect.insort(self._vocabulario, palabra)
+                for t in trigramas(palabra):
+                    self._trigramas.setdefault(t, set()).add(palabra)
+            ids.add(id_prod)
+        self._marcas.setdefault(marca or '', set()).add(id_prod)
+
+    def _quitar(self, id_prod):
+        nombre, marca, _, _, terminos = self._docs.pop(id_prod)
+        for palabra in terminos:
+            ids = self._postings[palabra]
+            ids.discard(id_prod)
+            if not ids:
+                del self._postings[palabra]
+                del self._vocabulario[bisect.bisect_left(self._vocabulario, palabra)]
+                for t in trigramas(palabra):
+                    self._trigramas[t].discard(palabra)
+                    if not self._trigramas[t]:
+                        del self._trigramas[t]
+        ids = self._marcas.get(marca or '')
+        if ids is not None:
+            ids.discard(id_prod)
+            if not ids:
+                del self._marcas[marca or '']
+
+    # --- Consulta ---
+    def _coincidencias(self, termino):
+        """{Id_producto: puntaje} de un término: exacto, por prefijo o, si nada, aproximado."""
+        puntajes = {}
+        inicio = bisect.bisect_left(self._vocabulario, termino)
+        for palabra in self._vocabulario[inicio:]:
+            if not palabra.startswith(termino):
+                break
+            puntos = _EXACTA if palabra == termino else _PREFIJO
+            for id_prod in self._postings[palabra]:
+                if puntajes.get(id_prod, 0) < puntos:
+                    puntajes[id_prod] = puntos
+        if puntajes:
+            return puntajes
+
+        maximo = _tolerancia(termino)
+        if not maximo:
+            return puntajes
+        # Candidatas: palabras que comparten trigramas con el término
+        comunes = Counter()
+        for t in trigramas(termino):
+            comunes.update(self._trigramas.get(t, ()))
+        minimo = max(1, len(termino) - 2 - 3 * maximo)   # trigramas que deja intactos `maximo` errores
+        for palabra, n in comunes.items():
+            if n >= minimo and (distancia(termino, palabra, maximo) <= maximo
+                                or distancia(termino, palabra[:len(termino)], maximo) <= maximo):
+                for id_prod in self._postings[palabra]:
+                    puntajes.setdefault(id_prod, _APROXIMADA)
+        return puntajes
+
+    def buscar(self, texto='', marca=None, en_stock=False, limite=BUSQUEDA_MAX_RESULTADOS):
+        """Productos que contienen todos los términos de `texto` (el último puede ser un prefijo).
+
+        Devuelve {'total', 'productos': [...], 'marcas': {marca: cantidad}}; las facetas
+        de marca se cuentan antes de aplicar el filtro `marca`.
+        """
+        with self._lock:
+            self._counters['consultas'] += 1
+            terminos = palabras(texto)
+            if terminos:
+                puntajes = None
+                for termino in terminos:
+                    coincidencias = self._coincidencias(termino)
+                    if puntajes is None:
+                        puntajes = coincidencias
+                    else:
+                        puntajes = {i: p + coincidencias[i] for i, p in puntajes.items() if i in coincidencias}
+                    if not puntajes:
+                        break
+            else:
+                puntajes = dict.fromkeys(self._docs, 0)
+
+            if en_stock:
+                puntajes = {i: p for i, p in puntajes.items() if self._docs[i][3] > 0}
+            facetas = Counter(self._docs[i][1] or '' for i in puntajes)
+            if marca is not None:
+                puntajes = {i: p for i, p in puntajes.items() if (self._docs[i][1] or '') == marca}
+
+            # Más puntaje primero; a igualdad, los que tienen stock y luego por nombre
+            orden = sorted(puntajes, key=lambda i: (-puntajes[i], self._docs[i][3] <= 0, self._docs[i][0]))
+            productos = [{'id': i, 'nombre': self._docs[i][0], 'marca': self._docs[i][1],
+                          'precio': self._docs[i][2], 'stock': self._docs[i][3]} for i in orden[:limite]]
+        return {'total': len(orden), 'productos': productos, 'marcas': dict(facetas.most_common())}
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, productos=len(self._docs), palabras=len(self._vocabulario),
+                        trigramas=len(self._trigramas), marcas=len(self._marcas))
+
+
+class IndiceBusqueda:
+    """Un IndiceCatalogo por sucursal, sincronizado con catalog_cache antes de cada consulta."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._indices = {}
+
+    def indice(self, sucursal):
+        with self._lock:
+            indice = self._indices.get(sucursal)
+            if indice is None:
+                indice = self._indices[sucursal] = IndiceCatalogo()
+            return indice
+
+    def buscar(self, sucursal, filas, etiqueta, texto='', marca=None, en_stock=False):
+        """`filas` y `etiqueta` vienen de catalog_cache.get_etiquetado(); si la etiqueta no
+        cambió desde la última consulta no hay nada que sincronizar."""
+        inicio = time.perf_counter()
+        indice = self.indice(sucursal)
+        indice.sincronizar(filas, etiqueta)
+        resultado = indice.buscar(texto, marca, en_stock)
+        resultado['ms'] = round((time.perf_counter() - inicio) * 1000, 3)
+        return resultado
+
+    def stats(self):
+        with self._lock:
+            indices = dict(self._indices)
+        return {sucursal: indice.stats() for sucursal, indice in indices.items()}
+
+
+indice_busqueda = IndiceBusqueda()
\ No newline at end of file
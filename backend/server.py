@@ -0,0 +1,219 @@
+# backend/server.py
+import argparse
+import logging
+import signal
+import threading
+import time
+
+from .config import (SERVER_HOST, SERVER_PORT, SERVER_THREADS, SERVER_CONNECTION_LIMIT, SERVER_BACKLOG,
+                     SERVER_KEEPALIVE, SERVER_SHUTDOWN_TIMEOUT)
+
+log = logging.getLogger(__name__)
+
+
+# ==============================================================================
+# CONTADORES DE PETICIONES (middleware WSGI)
+# ==============================================================================
+class RequestStats:
+    """Envuelve la app WSGI y cuenta peticiones en curso y peticiones por segundo.
+
+    Mientras el servidor se detiene (draining) responde 503 a las peticiones nuevas
+    para que las que ya estaban en curso terminen sin competir con más trabajo.
+    """
+
+    VENTANA = 10   # segundos usados para calcular peticiones/segundo
+
+    def __init__(self, app):
+        self.app = app
+        self.draining = False
+        self._lock = threading.Condition()
+        self._en_curso = 0
+        self._total = 0
+        self._rechazadas = 0
+        self._segundos = [0] * self.VENTANA   # segundo (epoch) de cada casilla
+        self._cuentas = [0] * self.VENTANA
+
+    def __call__(self, environ, start_response):
+        if self.draining:
+            with self._lock:
+                self._rechazadas += 1
+            start_response('503 Service Unavailable', [('Content-Type', 'text/plain; charset=utf-8'),
+                                                        ('Connection', 'close'), ('Retry-After', '5')])
+            return [b'Servidor deteniendose.']
+
+        with self._lock:
+            self._en_curso += 1
+        try:
+            resultado = self.app(environ, start_response)
+        except BaseException:
+            self._terminar()
+            raise
+        return _RespuestaContada(resultado, self._terminar)
+
+    def _terminar(self):
+        segundo = int(time.time())
+        i = segundo % self.VENTANA
+        with self._lock:
+            self._en_curso -= 1
+            self._total += 1
+            if self._segundos[i] != segundo:
+                self._segundos[i], self._cuentas[i] = segundo, 0
+            self._cuentas[i] += 1
+            self._lock.notify_all()
+
+    def esperar_vacio(self, timeout):
+        """Espera a que no queden peticiones en curso. Devuelve False si se agotó el tiempo."""
+        with self._lock:
+            return self._lock.wait_for(lambda: self._en_curso == 0, timeout)
+
+    def snapshot(self):
+        ahora = int(time.time())
+        with self._lock:
+            # Solo segundos ya completos: el actual todavía se está llenando
+            recientes = sum(c for s, c in zip(self._segundos, self._cuentas)
+                            if ahora - self.VENTANA <= s < ahora)
+            return {
+                'en_curso': self._en_curso,
+                'total': self._total,
+                'rechazadas': self._rechazadas,
+                'rps': round(recientes / self.VENTANA, 2),
+            }
+
+
+class _RespuestaContada:
+    """Iterable de respuesta que avisa una sola vez cuando el servidor termina de enviarla."""
+
+    def __init__(self, resultado, al_cerrar):
+        self._resultado = resultado
+        self._al_cerrar = al_cerrar
+        self._cerrada = False
+
+    def __iter__(self):
+        return iter(self._resultado)
+
+    def close(self):
+        if self._cerrada:
+            return
+        self._cerrada = True
+        try:
+            if hasattr(self._resultado, 'close'):
+                self._resultado.close()
+        finally:
+            self._al_cerrar()
+
+
+# ==============================================================================
+# SERVIDOR WSGI DE PRODUCCIÓN
+# ==============================================================================
+class ProductionServer:
+    """Servidor waitress con un número fijo de hilos y apagado ordenado.
+
+    Mantiene la misma interfaz que el servidor de werkzeug (serve_forever / shutdown)
+    para que el launcher pueda usar cualquiera de los dos.
+    """
+
+    def __init__(self, app, host, port, threads=SERVER_THREADS, connection_limit=SERVER_CONNECTION_LIMIT,
+                 backlog=SERVER_BACKLOG, keepalive=SERVER_KEEPALIVE):
+        # Import diferido: waitress solo hace falta en modo producción
+        from waitress.server import create_server
+
+        self.stats = RequestStats(app)
+        self._map = {}
+        self._detener = threading.Event()
+        self._detenido = threading.Event()
+        self._server = create_server(
+            self.stats, map=self._map, host=host, port=port,
+            threads=threads, connection_limit=connection_limit,
+            backlog=backlog, channel_timeout=keepalive, ident='TechStore')
+        self.host, self.port = host, self._server.effective_port
+
+    def serve_forever(self):
+        from waitress import wasyncore
+
+        adj = self._server.adj
+        try:
+            # Bucle propio (en vez de server.run()) para poder salir cuando se pide detener
+            while not self._detener.is_set():
+                wasyncore.loop(timeout=adj.asyncore_loop_timeout, map=self._map,
+                               use_poll=adj.asyncore_use_poll, count=1)
+        finally:
+            # Todo el cierre ocurre en el hilo del servidor: wasyncore no es thread-safe
+            self._server.close()
+            for canal in list(self._map.values()):
+                canal.close()
+            self._server.task_dispatcher.shutdown(timeout=SERVER_SHUTDOWN_TIMEOUT)
+            self._detenido.set()
+
+    def shutdown(self, timeout=SERVER_SHUTDOWN_TIMEOUT):
+        """Deja de aceptar trabajo nuevo, espera las peticiones en curso y cierra el socket."""
+        self.stats.draining = True
+        if not self.stats.esperar_vacio(timeout):
+            log.warning("Apagado: %d peticiones seguían en curso tras %gs.",
+                        self.stats.snapshot()['en_curso'], timeout)
+        self._detener.set()
+        self._server.trigger.pull_trigger()   # despierta el bucle si está en poll
+        self._detenido.wait(timeout)
+
+
+# ==============================================================================
+# ENTRADA SIN INTERFAZ GRÁFICA
+# ==============================================================================
+def main(argv=None, inicio=None):
+    """Arranca el servidor sin PyQt6. `inicio` (perf_counter) permite medir el arranque
+    desde antes de importar el paquete; si no se indica se mide desde aquí."""
+    inicio = inicio if inicio is not None else time.perf_counter()
+
+    parser = argparse.ArgumentParser(prog='python -m backend',
+                                     description="Servidor de producción de TechStore (waitress).")
+    parser.add_argument('--host', default=SERVER_HOST)
+    parser.add_argument('--port', type=int, default=SERVER_PORT)
+    parser.add_argument('--threads', '--workers', dest='threads', type=int, default=SERVER_THREADS)
+    parser.add_argument('--connection-limit', type=int, default=SERVER_CONNECTION_LIMIT)
+    parser.add_argument('--backlog', type=int, default=SERVER_BACKLOG)
+    parser.add_argument('--keepalive', type=int, default=SERVER_KEEPALIVE)
+    parser.add_argument('--dev', action='store_true', help="Usar el servidor de desarrollo de werkzeug.")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    from . import create_app
+    from .database import close_pools
+
+    t_app = time.perf_counter()
+    app = create_app()
+    t_app = time.perf_counter() - t_app
+
+    t_socket = time.perf_counter()
+    server = None
+    if not args.dev:
+        try:
+            server = ProductionServer(
+                app, args.host, args.port, threads=args.threads,
+                connection_limit=args.connection_limit, backlog=args.backlog, keepalive=args.keepalive)
+        except ImportError:
+            log.warning("waitress no está instalado; se usa el servidor de desarrollo de werkzeug.")
+    if server is None:
+        from werkzeug.serving import make_server
+        server = make_server(args.host, args.port, app, threaded=True)
+    t_socket = time.perf_counter() - t_socket
+
+    def _detener(signum, frame):
+        log.info("Señal %s recibida, deteniendo servidor...", signum)
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGINT, _detener)
+    signal.signal(signal.SIGTERM, _detener)
+
+    modo = f"waitress, {args.threads} hilos" if isinstance(server, ProductionServer) else 'werkzeug'
+    log.info("TechStore escuchando en %s:%s (%s)", args.host, server.port, modo)
+    log.info("Arranque en %.0f ms (create_app %.0f ms, socket %.0f ms)",
+             (time.perf_counter() - inicio) * 1000, t_app * 1000, t_socket * 1000)
+    try:
+        server.serve_forever()
+    finally:
+        close_pools()
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
\ No newline at end of file
@@ -0,0 +1,340 @@
+# backend/sessions.py
+import json
+import logging
+import os
+import re
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, session
+from flask.sessions import SecureCookieSession, SessionInterface
+
+from .config import (CARRITO_MAX_ITEMS, CARRITO_TTL, SESSION_BACKEND, SESSION_BARRIDO, SESSION_DB,
+                     SESSION_MAX, SESSION_TTL)
+
+log = logging.getLogger(__name__)
+
+# token_urlsafe(32): 43 caracteres. Cualquier otra cosa en la cookie se ignora sin consultar el almacén
+_SID_VALIDO = re.compile(r'^[A-Za-z0-9_-]{43}$')
+
+
+class ServerSession(SecureCookieSession):
+    """Sesión cuyos datos viven en el servidor; la cookie solo lleva `sid`."""
+
+    def __init__(self, datos=None, sid=None, expira=0.0, new=False):
+        super().__init__(datos)
+        self.sid = sid
+        self.expira = expira
+        self.new = new
+        self.anterior = None   # sid descartado por rotar_sid(), se borra al guardar
+
+
+def rotar_sid():
+    """Nuevo id para la sesión actual (al iniciar sesión), para que no se reutilice uno previo."""
+    if isinstance(session, ServerSession) and not session.new:
+        session.anterior, session.sid = session.sid, secrets.token_urlsafe(32)
+        session.new = session.modified = True
+
+
+# ==============================================================================
+# ALMACENES (memoria / SQLite)
+# ==============================================================================
+# Interfaz común: cargar(clave) -> (datos, expira) o None, guardar(clave, datos, ttl),
+# tocar(clave, ttl), borrar(clave), barrer() y stats(). Las claves son los sid de las
+# sesiones y 'carrito:<Id_cliente>' para el carrito de cada cliente.
+class MemoriaSessionStore:
+    """Sesiones en un OrderedDict del proceso, con expulsión LRU al pasar `capacidad`.
+
+    Cada acceso mueve la clave al final, así que las más viejas quedan al principio y
+    el barrido se detiene en la primera sesión que sigue vigente (los carritos, que
+    duran más, se saltan). Solo sirve con un proceso (waitress usa hilos); con varios
+    procesos usar SQLiteSessionStore.
+    """
+
+    def __init__(self, capacidad=SESSION_MAX):
+        self.capacidad = capacidad
+        self._lock = threading.Lock()
+        self._datos = OrderedDict()   # clave -> (datos, expira)
+        self._counters = {'lecturas': 0, 'escrituras': 0, 'expiradas': 0, 'expulsadas': 0}
+
+    def cargar(self, clave):
+        with self._lock:
+            self._counters['lecturas'] += 1
+            item = self._datos.get(clave)
+            if item is None:
+                return None
+            if item[1] <= time.time():
+                del self._datos[clave]
+                self._counters['expiradas'] += 1
+                return None
+            self._datos.move_to_end(clave)
+            # Copia: los cambios de la petición no se ven hasta guardar()
+            return json.loads(item[0]), item[1]
+
+    def guardar(self, clave, datos, ttl):
+        texto = json.dumps(datos, separators=(',', ':'))
+        with self._lock:
+            self._datos[clave] = (texto, time.time() + ttl)
+            self._datos.move_to_end(clave)
+            self._counters['escrituras'] += 1
+            while len(self._datos) > self.capacidad:
+                self._datos.popitem(last=False)
+                self._counters['expulsadas'] += 1
+
+    def tocar(self, clave, ttl):
+        with self._lock:
+            item = self._datos.get(clave)
+            if item is not None:
+                self._datos[clave] = (item[0], time.time() + ttl)
+                self._datos.move_to_end(clave)
+
+    def borrar(self, clave):
+        with self._lock:
+            self._datos.pop(clave, None)
+
+    def barrer(self):
+        ahora = time.time()
+        with self._lock:
+            vencidas = []
+            for clave, (_, expira) in self._datos.items():
+                if expira <= ahora:
+                    vencidas.append(clave)
+                elif not clave.startswith('carrito:'):
+                    break
+            for clave in vencidas:
+                del self._datos[clave]
+            self._counters['expiradas'] += len(vencidas)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, backend='memoria', sesiones=len(self._datos), capacidad=self.capacidad)
+
+
+class SQLiteSessionStore:
+    """Sesiones en un archivo SQLite (WAL) compartido por todos los procesos del servidor."""
+
+    _ESQUEMA = """
+    CREATE TABLE IF NOT EXISTS sesiones (clave TEXT PRIMARY KEY, datos TEXT NOT NULL, expira REAL NOT NULL);
+    CREATE INDEX IF NOT EXISTS ix_sesiones_expira ON sesiones (expira);
+    """
+
+    def __init__(self, ruta=SESSION_DB):
+        self.ruta = ruta
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._counters = {'lecturas': 0, 'escrituras': 0, 'expiradas': 0}
+        self._conexion().executescript(self._ESQUEMA)
+
+    def cargar(self, clave):
+        fila = self._conexion().execute("SELECT datos, expira FROM sesiones WHERE clave = ? AND expira > ?",
+                                        (clave, time.time())).fetchone()
+        self._contar('lecturas')
+        return (json.loads(fila[0]), fila[1]) if fila else None
+
+    def guardar(self, clave, datos, ttl):
+        conn = self._conexion()
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO sesiones (clave, datos, expira) VALUES (?, ?, ?)",
+                         (clave, json.dumps(datos, separators=(',', ':')), time.time() + ttl))
+        self._contar('escrituras')
+
+    def tocar(self, clave, ttl):
+        conn = self._conexion()
+        with conn:
+            conn.execute("UPDATE sesiones SET expira = ? WHERE clave = ?", (time.time() + ttl, clave))
+
+    def borrar(self, clave):
+        conn = self._conexion()
+        with conn:
+            conn.execute("DELETE FROM sesiones WHERE clave = ?", (clave,))
+
+    def barrer(self):
+        conn = self._conexion()
+        with conn:
+            borradas = conn.execute("DELETE FROM sesiones WHERE expira <= ?", (time.time(),)).rowcount
+        self._contar('expiradas', borradas)
+
+    def stats(self):
+        total = self._conexion().execute("SELECT COUNT(*) FROM sesiones").fetchone()[0]
+        with self._lock:
+            return dict(self._counters, backend='sqlite', sesiones=total)
+
+    # --- Internos ---
+    def _contar(self, clave, n=1):
+        with self._lock:
+            self._counters[clave] += n
+
+    def _conexion(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.ruta)), exist_ok=True)
+            conn = sqlite3.connect(self.ruta, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+
+# ==============================================================================
+# INTERFAZ DE SESIÓN PARA FLASK
+# ==============================================================================
+class ServerSessionInterface(SessionInterface):
+    """Reemplaza la cookie firmada de Flask: la cookie lleva solo un id aleatorio.
+
+    - Solo se escribe en el almacén si la sesión cambió; si no, se renueva la
+      expiración cuando ya pasó la mitad de `ttl` (una escritura cada ttl/2 como mucho).
+    - Una sesión vacía no se guarda ni envía cookie (visitantes anónimos sin estado).
+    - Cada `barrido` segundos la petición en curso borra las sesiones vencidas.
+    """
+
+    def __init__(self, store, ttl=SESSION_TTL, barrido=SESSION_BARRIDO):
+        self.store = store
+        self.ttl = ttl
+        self.barrido = barrido
+        self._proximo_barrido = time.monotonic() + barrido
+        self._lock = threading.Lock()
+
+    def open_session(self, app, request):
+        self._barrer_si_toca()
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid and _SID_VALIDO.match(sid):
+            guardada = self.store.cargar(sid)
+            if guardada is not None:
+                return ServerSession(guardada[0], sid, guardada[1])
+        return ServerSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        nombre = self.get_cookie_name(app)
+        dominio = self.get_cookie_domain(app)
+        ruta = self.get_cookie_path(app)
+        if session.accessed:
+            response.vary.add('Cookie')
+        if session.anterior:
+            self.store.borrar(session.anterior)
+
+        if not session:
+            if not session.new and session.modified:
+                # session.clear() (logout): se borra del almacén y del navegador
+                self.store.borrar(session.sid)
+                response.delete_cookie(nombre, domain=dominio, path=ruta,
+                                       secure=self.get_cookie_secure(app), httponly=self.get_cookie_httponly(app),
+                                       samesite=self.get_cookie_samesite(app))
+            return
+
+        if session.modified or session.new:
+            self.store.guardar(session.sid, dict(session), self.ttl)
+        elif session.expira - time.time() < self.ttl / 2:
+            self.store.tocar(session.sid, self.ttl)
+
+        if session.new or session.permanent:
+            response.set_cookie(nombre, session.sid, expires=self.get_expiration_time(app, session),
+                                httponly=self.get_cookie_httponly(app), domain=dominio, path=ruta,
+                                secure=self.get_cookie_secure(app), samesite=self.get_cookie_samesite(app))
+
+    def _barrer_si_toca(self):
+        ahora = time.monotonic()
+        if ahora < self._proximo_barrido:
+            return
+        with self._lock:
+            if ahora < self._proximo_barrido:
+                return
+            self._proximo_barrido = ahora + self.barrido
+        try:
+            self.store.barrer()
+        except Exception as e:
+            log.warning("Barrido de sesiones falló: %s", e)
+
+
+def init_app(app, backend=SESSION_BACKEND):
+    """Instala el almacén de sesiones elegido: 'memoria', 'sqlite' o 'cookie' (el de Flask)."""
+    if backend == 'cookie':
+        return
+    store = SQLiteSessionStore() if backend == 'sqlite' else MemoriaSessionStore()
+    app.session_interface = ServerSessionInterface(store)
+
+
+def session_stats():
+    interfaz = current_app.session_interface
+    if isinstance(interfaz, ServerSessionInterface):
+        return interfaz.store.stats()
+    return {'backend': 'cookie'}
+
+
+# ==============================================================================
+# CARRITO EN EL SERVIDOR
+# ==============================================================================
+# El carrito va en la sesión y, si hay un cliente logueado, también en el almacén bajo
+# 'carrito:<Id_cliente>': así lo recupera al entrar desde otro dispositivo.
+def _store():
+    interfaz = current_app.session_interface
+    return interfaz.store if isinstance(interfaz, ServerSessionInterface) else None
+
+
+def _clave_carrito():
+    if session.get('user_role') == 'cliente' and session.get('user_id') is not None:
+        return f"carrito:{session['user_id']}"
+    return None
+
+
+def normalizar_items(items):
+    """Items del carrito del navegador: [{id, nombre, precio, cantidad, stockMax}] validados."""
+    if not isinstance(items, list):
+        raise ValueError("El carrito debe ser una lista.")
+    limpios = {}
+    for item in items[:CARRITO_MAX_ITEMS]:
+        try:
+            id_prod = str(int(item['id']))
+            cantidad = int(item['cantidad'])
+            limpio = {'id': id_prod, 'nombre': str(item.get('nombre', ''))[:255],
+                      'precio': float(item.get('precio', 0)), 'cantidad': cantidad,
+                      'stockMax': int(item.get('stockMax', cantidad))}
+        except (KeyError, TypeError, ValueError):
+            raise ValueError("Item de carrito inválido.")
+        if cantidad > 0:
+            limpios[id_prod] = limpio
+    return list(limpios.values())
+
+
+def leer_carrito():
+    return list(session.get('carrito', []))
+
+
+def guardar_carrito(items):
+    session['carrito'] = items
+    clave, store = _clave_carrito(), _store()
+    if clave and store:
+        if items:
+            store.guardar(clave, items, CARRITO_TTL)
+        else:
+            store.borrar(clave)
+
+
+def recuperar_carrito():
+    """Al iniciar sesión un cliente: une el carrito de este dispositivo con el guardado."""
+    clave, store = _clave_carrito(), _store()
+    if not clave or not store:
+        return
+    guardado = store.cargar(clave)
+    items = {i['id']: i for i in (guardado[0] if guardado else [])}
+    for item in leer_carrito():
+        previo = items.get(item['id'])
+        if previo is None or item['cantidad'] > previo['cantidad']:
+            items[item['id']] = item
+    if items:
+        guardar_carrito(list(items.values()))
+
+
+def confirmar_compra(id_cliente, nombre=None):
+    """Pedido aplicado en el nodo: se vacía el carrito y, si el cliente vino del registro
+    rápido (`nombre`), queda con sesión iniciada."""
+    if 'user_id' not in session and nombre is not None:
+        # Auto-Login
+        session['user_id'] = id_cliente
+        session['user_name'] = nombre
+        session['user_role'] = 'cliente'
+    # Si entretanto entró otra cuenta, su carrito no se toca
+    if session.get('user_role') == 'cliente' and str(session.get('user_id')) == str(id_cliente):
+        guardar_carrito([])   # Vendido: se vacía aquí y en la cuenta del cliente
\ No newline at end of file
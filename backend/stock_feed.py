@@ -0,0 +1,109 @@
+# backend/stock_feed.py
+import threading
+import time
+from collections import deque
+
+from .config import NODOS, STOCK_FEED_MAX_ESPERAS, STOCK_FEED_SIZE
+
+
+class StockFeed:
+    """Cambios de stock por sucursal en un anillo en memoria: (versión, Id_producto, cantidad).
+
+    Las rutas que escriben INVENTARIO publican la cantidad resultante después del
+    commit (y después de invalidar catalog_cache). Los clientes piden los cambios
+    posteriores a su versión; si quedaron fuera del anillo, o si hubo un cambio de
+    catálogo (alta o baja de productos), reciben reset=True y recargan /api/productos.
+
+    Las versiones arrancan en la hora actual en milisegundos para que sigan creciendo
+    después de reiniciar el proceso.
+    """
+
+    def __init__(self, capacidad=STOCK_FEED_SIZE, max_esperas=STOCK_FEED_MAX_ESPERAS):
+        self.capacidad = capacidad
+        self.max_esperas = max_esperas
+        self._cond = threading.Condition()
+        self._eventos = {}     # sucursal -> deque[(versión, Id_producto, cantidad)]
+        self._versiones = {}   # sucursal -> última versión
+        self._reinicios = {}   # sucursal -> versión del último cambio de catálogo
+        self._inicio = time.time_ns() // 1_000_000
+        self._esperando = 0
+        self._counters = {'eventos': 0, 'reinicios': 0, 'consultas': 0, 'rechazadas': 0}
+
+    def version(self, sucursal):
+        with self._cond:
+            return self._versiones.get(sucursal, self._inicio)
+
+    def publicar(self, sucursal, cambios):
+        """cambios: [(Id_producto, cantidad)] con el stock ya confirmado en la sucursal."""
+        cambios = list(cambios)
+        if not cambios:
+            return
+        with self._cond:
+            version = self._versiones.get(sucursal, self._inicio)
+            eventos = self._eventos.get(sucursal)
+            if eventos is None:
+                eventos = self._eventos[sucursal] = deque(maxlen=self.capacidad)
+            for id_prod, cantidad in cambios:
+                version += 1
+                eventos.append((version, int(id_prod), int(cantidad)))
+            self._versiones[sucursal] = version
+            self._counters['eventos'] += len(cambios)
+            self._cond.notify_all()
+
+    def reiniciar(self, sucursal=None):
+        """Cambio de catálogo (una sucursal o todas): los clientes deben recargar completo."""
+        with self._cond:
+            for s in ([sucursal] if sucursal else NODOS):
+                version = self._versiones.get(s, self._inicio) + 1
+                self._versiones[s] = self._reinicios[s] = version
+            self._counters['reinicios'] += 1
+            self._cond.notify_all()
+
+    def desde(self, sucursal, since, timeout=0):
+        """Cambios posteriores a `since`, esperando hasta `timeout` segundos si no hay.
+
+        Devuelve {'version', 'cambios': [(versión, Id_producto, cantidad)], 'reset'}, o
+        None si ya hay demasiadas esperas en curso (el cliente reintenta más tarde).
+        """
+        with self._cond:
+            self._counters['consultas'] += 1
+            if timeout > 0 and self._versiones.get(sucursal, self._inicio) <= since:
+                if self._esperando >= self.max_esperas:
+                    self._counters['rechazadas'] += 1
+                    return None
+                self._esperando += 1
+                try:
+                    self._cond.wait_for(lambda: self._versiones.get(sucursal, self._inicio) != since, timeout)
+                finally:
+                    self._esperando -= 1
+
+            version = self._versiones.get(sucursal, self._inicio)
+            eventos = self._eventos.get(sucursal, ())
+            mas_vieja = eventos[0][0] if eventos else version + 1
+            reset = (since > version                                   # el proceso se reinició
+                     or since < self._reinicios.get(sucursal, 0)       # cambió el catálogo
+                     or (since < version and since < mas_vieja - 1))   # salió del anillo
+            cambios = [] if reset else [e for e in eventos if e[0] > since]
+            return {'version': version, 'cambios': cambios, 'reset': reset}
+
+    def stats(self):
+        with self._cond:
+            datos = dict(self._counters, esperando=self._esperando,
+                         versiones=dict(self._versiones),
+                         en_anillo={s: len(e) for s, e in self._eventos.items()})
+        return datos
+
+
+stock_feed = StockFeed()
+
+
+def leer_stock(cursor, id_sucursal, ids):
+    """[(Id_producto, cantidad)] actuales de `ids` en la sucursal (0 si no hay fila)."""
+    ids = [int(i) for i in ids]
+    if not ids:
+        return []
+    marcadores = ', '.join('?' * len(ids))
+    cursor.execute(f"SELECT Id_producto, cantidad FROM INVENTARIO WHERE Id_sucursal = ? AND Id_producto IN ({marcadores})",
+                   (id_sucursal, *ids))
+    encontrados = {fila[0]: fila[1] for fila in cursor.fetchall()}
+    return [(i, encontrados.get(i, 0)) for i in ids]
\ No newline at end of file
@@ -0,0 +1,102 @@
+# backend/templating.py
+import logging
+import os
+import threading
+import time
+
+from jinja2 import FileSystemBytecodeCache, nodes
+from jinja2.ext import Extension
+
+from .cache import LRUCache
+from .config import FRAGMENT_CACHE_SIZE, FRAGMENT_CACHE_TTL, JINJA_CACHE_DIR
+
+log = logging.getLogger(__name__)
+
+
+class FragmentCache:
+    """HTML ya renderizado de trozos de plantilla, por clave.
+
+    La clave la arma la plantilla con lo que determina el fragmento (sucursal, versión
+    o fila de datos, rol...): si los datos cambian la clave es otra, así que no hace
+    falta invalidar; las claves viejas se van por LRU o por TTL. Si alguna parte de la
+    clave es None (p. ej. catálogo de respaldo sin versión) el fragmento no se cachea.
+
+    Contadores por nombre de fragmento (primera parte de la clave): hits, misses,
+    ms renderizando en los misses y ms ahorrados estimados (hits x costo medio de un miss).
+    """
+
+    def __init__(self, max_size=FRAGMENT_CACHE_SIZE, ttl=FRAGMENT_CACHE_TTL):
+        self._datos = LRUCache(max_size, ttl)
+        self._lock = threading.Lock()
+        self._counters = {}   # nombre -> {'hits', 'misses', 'sin_cache', 'render_ms'}
+
+    def render(self, partes, caller):
+        nombre = str(partes[0])
+        if any(p is None for p in partes):
+            self._contar(nombre, 'sin_cache')
+            return caller()
+        clave = tuple(partes)
+        html = self._datos.get(clave)
+        if html is not None:
+            self._contar(nombre, 'hits')
+            return html
+        inicio = time.perf_counter()
+        html = caller()
+        self._contar(nombre, 'misses', (time.perf_counter() - inicio) * 1000)
+        self._datos.set(clave, html)
+        return html
+
+    def invalidate(self, nombre=None):
+        """Borra los fragmentos de `nombre` (todos si no se indica)."""
+        self._datos.invalidate(None if nombre is None else lambda k: k[0] == nombre)
+
+    def stats(self):
+        with self._lock:
+            fragmentos = {nombre: dict(c) for nombre, c in self._counters.items()}
+        for c in fragmentos.values():
+            costo = c['render_ms'] / c['misses'] if c['misses'] else 0.0
+            c['render_ms'] = round(c['render_ms'], 3)
+            c['ahorrado_ms'] = round(c['hits'] * costo, 3)
+        datos = self._datos.stats()
+        datos['fragmentos'] = fragmentos
+        return datos
+
+    def _contar(self, nombre, campo, ms=0.0):
+        with self._lock:
+            c = self._counters.get(nombre)
+            if c is None:
+                c = self._counters[nombre] = {'hits': 0, 'misses': 0, 'sin_cache': 0, 'render_ms': 0.0}
+            c[campo] += 1
+            c['render_ms'] += ms
+
+
+fragment_cache = FragmentCache()
+
+
+class FragmentCacheExtension(Extension):
+    """Etiqueta {% cache 'nombre', parte, ... %}...{% endcache %} sobre fragment_cache."""
+
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        partes = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            partes.append(parser.parse_expression())
+        cuerpo = parser.parse_statements(('name:endcache',), drop_needle=True)
+        return nodes.CallBlock(self.call_method('_render', [nodes.List(partes)]), [], [], cuerpo).set_lineno(lineno)
+
+    def _render(self, partes, caller):
+        return fragment_cache.render(partes, caller)
+
+
+def init_app(app, directorio=JINJA_CACHE_DIR):
+    """Bytecode de las plantillas en disco (lo reutilizan los workers nuevos) y etiqueta {% cache %}."""
+    if directorio:
+        try:
+            os.makedirs(directorio, exist_ok=True)
+            # Cada archivo lleva el checksum de la fuente: editar una plantilla no sirve bytecode viejo
+            app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directorio, 'techstore-%s.cache')
+        except OSError as e:
+            log.warning("Sin caché de bytecode de plantillas (%s): %s", directorio, e)
+    app.jinja_env.add_extension(FragmentCacheExtension)
\ No newline at end of file
@@ -4,11 +4,14 @@ import threading
 import webbrowser
 from PyQt6.QtWidgets import (QApplication, QWidget, QVBoxLayout, QLabel, 
                              QComboBox, QPushButton, QSpinBox, QHBoxLayout, QMessageBox)
-from PyQt6.QtCore import Qt
+from PyQt6.QtCore import Qt, QTimer
 from werkzeug.serving import make_server
 
 # Importamos la función que crea la app desde tu backend
 from backend import create_app
+from backend.database import close_pools
+from backend.server import ProductionServer
+from backend.config import SERVER_THREADS
 
 class ServerLauncher(QWidget):
     def __init__(self):
@@ -17,9 +20,14 @@ class ServerLauncher(QWidget):
         self.server_thread = None
         self.init_ui()
 
+        # Refresco de los contadores en vivo (desde el hilo de la GUI)
+        self.stats_timer = QTimer(self)
+        self.stats_timer.timeout.connect(self.update_stats)
+        self.stats_timer.start(1000)
+
     def init_ui(self):
         self.setWindowTitle("TechStore Launcher")
-        self.setGeometry(100, 100, 400, 320)
+        self.setGeometry(100, 100, 400, 440)
 
         layout = QVBoxLayout()
         layout.setSpacing(10)
@@ -50,6 +58,21 @@ class ServerLauncher(QWidget):
         self.spin_port.setValue(5000)
         layout.addWidget(self.spin_port)
 
+        # Modo de servidor
+        layout.addWidget(QLabel("Modo de servidor:"))
+        self.combo_mode = QComboBox()
+        self.combo_mode.addItems(["Producción (waitress)", "Desarrollo (werkzeug)"])
+        self.combo_mode.currentIndexChanged.connect(
+            lambda i: self.spin_threads.setEnabled(i == 0))
+        layout.addWidget(self.combo_mode)
+
+        # Hilos de trabajo (solo modo producción)
+        layout.addWidget(QLabel("Hilos de trabajo:"))
+        self.spin_threads = QSpinBox()
+        self.spin_threads.setRange(1, 64)
+        self.spin_threads.setValue(SERVER_THREADS)
+        layout.addWidget(self.spin_threads)
+
         layout.addStretch()
 
         # --- BOTONES DE CONTROL ---
@@ -84,6 +107,12 @@ class ServerLauncher(QWidget):
         self.lbl_status.setStyleSheet("color: #6c757d; font-size: 12px; margin-top: 10px;")
         layout.addWidget(self.lbl_status)
 
+        # Contadores en vivo (peticiones/s y en curso)
+        self.lbl_stats = QLabel("")
+        self.lbl_stats.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        self.lbl_stats.setStyleSheet("color: #495057; font-size: 12px;")
+        layout.addWidget(self.lbl_stats)
+
         self.setLayout(layout)
 
     def get_local_ips(self):
@@ -111,6 +140,8 @@ class ServerLauncher(QWidget):
     def start_server(self):
         ip = self.combo_ip.currentText()
         port = self.spin_port.value()
+        production = self.combo_mode.currentIndex() == 0
+        threads = self.spin_threads.value()
 
         self.toggle_inputs(False)
         
@@ -119,7 +150,8 @@ class ServerLauncher(QWidget):
         # Si escuchamos en una IP específica, el navegador abre esa IP
         browser_url = f"http://127.0.0.1:{port}" if ip == '0.0.0.0' else f"http://{ip}:{port}"
         
-        self.lbl_status.setText(f"🟢 Corriendo en: {ip}:{port}")
+        modo = f"waitress, {threads} hilos" if production else "werkzeug"
+        self.lbl_status.setText(f"🟢 Corriendo en: {ip}:{port} ({modo})")
         self.lbl_status.setStyleSheet("color: #198754; font-weight: bold; margin-top: 10px;")
 
         # Abrir navegador
@@ -129,7 +161,7 @@ class ServerLauncher(QWidget):
             pass # Si falla abrir el navegador, no importa, el server sigue
 
         # Lanzar hilo del servidor
-        self.server_thread = threading.Thread(target=self.run_flask, args=(ip, port))
+        self.server_thread = threading.Thread(target=self.run_flask, args=(ip, port, production, threads))
         self.server_thread.daemon = True 
         self.server_thread.start()
 
@@ -146,7 +178,10 @@ class ServerLauncher(QWidget):
         """Lógica interna de apagado para no bloquear la GUI"""
         try:
             if self.server_instance:
+                # En modo producción espera a que terminen las peticiones en curso
                 self.server_instance.shutdown()
+            # Cerramos las conexiones ociosas del pool hacia los nodos
+            close_pools()
         except Exception as e:
             print(f"Error al apagar: {e}")
         finally:
@@ -166,16 +201,35 @@ class ServerLauncher(QWidget):
     def toggle_inputs(self, enable):
         self.combo_ip.setEnabled(enable)
         self.spin_port.setEnabled(enable)
+        self.combo_mode.setEnabled(enable)
+        self.spin_threads.setEnabled(enable and self.combo_mode.currentIndex() == 0)
         self.btn_start.setEnabled(enable)
         self.btn_stop.setEnabled(not enable)
 
-    def run_flask(self, host_ip, port_num):
+    def update_stats(self):
+        server = self.server_instance
+        stats = getattr(server, 'stats', None)
+        if stats is None:
+            self.lbl_stats.setText("")
+            return
+        datos = stats.snapshot()
+        self.lbl_stats.setText(
+            f"📈 {datos['rps']:.1f} pet/s  ·  ⏳ {datos['en_curso']} en curso  ·  Σ {datos['total']}")
+
+    def run_flask(self, host_ip, port_num, production=True, threads=SERVER_THREADS):
         try:
             app = create_app()
-            # Threaded=True permite manejar múltiples peticiones a la vez (evita que se congele)
-            self.server_instance = make_server(host_ip, port_num, app, threaded=True)
+            if production:
+                # Servidor WSGI de producción: hilos fijos, keep-alive y cola acotados
+                self.server_instance = ProductionServer(app, host_ip, port_num, threads=threads)
+            else:
+                # Threaded=True permite manejar múltiples peticiones a la vez (evita que se congele)
+                self.server_instance = make_server(host_ip, port_num, app, threaded=True)
             self.server_instance.serve_forever()
             
+        except ImportError:
+            self.lbl_status.setText("❌ Error: instala 'waitress' o usa el modo desarrollo.")
+            self.toggle_inputs(True)
         except OSError as e:
             # Capturar error de puerto ocupado
             self.lbl_status.setText(f"❌ Error: Puerto {port_num} ocupado.")